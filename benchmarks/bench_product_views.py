@@ -0,0 +1,81 @@
+"""
+Throughput benchmark of the product read endpoints, WSGI vs ASGI.
+
+Start the same project twice, e.g.
+
+    gunicorn test_scrape_proj.wsgi -w 1 --threads 8 -b :8000
+    ASYNC_PRODUCT_VIEWS=1 uvicorn test_scrape_proj.asgi:application --workers 1 --port 8001
+
+then run
+
+    python benchmarks/bench_product_views.py --token <access token> \\
+        --target wsgi=http://localhost:8000 --target asgi=http://localhost:8001 \\
+        --path /products/tracking/ --path /products/tracking/1/
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, url: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(base_url: str, path: str, token: str, concurrency: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        # warm up connections and caches
+        await client.get(path)
+
+        latencies, errors = [], []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            _worker(client, path, deadline, latencies, errors) for _ in range(concurrency)
+        ))
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=base_url")
+    parser.add_argument("--path", action="append", required=True)
+    parser.add_argument("--token", required=True, help="JWT access token")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per target and path")
+    args = parser.parse_args()
+
+    print(f"{'target':<8} {'path':<32} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        for path in args.path:
+            stats = asyncio.run(run(base_url, path, args.token, args.concurrency, args.duration))
+            print(
+                f"{name:<8} {path:<32} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+                f"{stats['p95_ms']:>8.1f} {stats['errors']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Import time of worker and web process startup, from `python -X importtime`,
+checked against a budget.
+
+Each target runs in a fresh interpreter:
+
+    worker  the Celery app and the task modules a worker imports on boot
+    asgi    the ASGI application plus the URLconf its first request loads
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --target worker --budget worker=400 --runs 5
+
+Exits with status 1 when the median of a target exceeds its budget (ms),
+so the check can run in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+TARGETS = {
+    "worker": (
+        "from test_scrape_proj.celery import app\n"
+        "app.loader.import_default_modules()\n"
+    ),
+    "asgi": (
+        "from django.conf import settings\n"
+        "from django.urls import get_resolver\n"
+        "from test_scrape_proj.asgi import application\n"
+        "get_resolver(settings.ROOT_URLCONF).url_patterns\n"
+    ),
+}
+
+# milliseconds of imports, with headroom over a typical run for slower CI machines
+DEFAULT_BUDGETS = {"worker": 500, "asgi": 700}
+
+
+def measure(code: str) -> dict:
+    """
+    Run `code` with -X importtime.
+
+    Returns:
+        {"total_ms", "modules": {name: cumulative ms}} of the run
+    """
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": "test_scrape_proj.settings", "PYTHONPATH": str(ROOT)}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    total = 0
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        microseconds = int(cumulative)
+        # top level imports are the outermost ones, their cumulative times add up
+        if not name[1:].startswith(" "):
+            total += microseconds
+        modules[name.strip()] = microseconds / 1000
+    return {"total_ms": total / 1000, "modules": modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", choices=sorted(TARGETS), help="all targets by default")
+    parser.add_argument("--budget", action="append", default=[], help="name=milliseconds")
+    parser.add_argument("--runs", type=int, default=3, help="interpreters started per target")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports listed per target")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS)
+    for budget in args.budget:
+        name, _, milliseconds = budget.partition("=")
+        budgets[name] = float(milliseconds)
+
+    over_budget = []
+    for target in args.target or sorted(TARGETS):
+        runs = [measure(TARGETS[target]) for _ in range(args.runs)]
+        median = statistics.median(run["total_ms"] for run in runs)
+        status = "ok" if median <= budgets[target] else "OVER BUDGET"
+        print(f"{target}: {median:.0f} ms of imports (budget {budgets[target]:.0f} ms) {status}")
+
+        slowest = sorted(runs[-1]["modules"].items(), key=lambda item: item[1], reverse=True)
+        for name, milliseconds in slowest[:args.top]:
+            print(f"    {milliseconds:>8.1f} ms  {name}")
+        if median > budgets[target]:
+            over_budget.append(target)
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import logging
+import warnings
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from marketplaces.models import PriceHistory, PriceSeriesBlock, Product, ProductAnalytics, ProductOffer
+from marketplaces.price_series import iter_points, last_price, use_blocks
+from test_scrape_proj.db_router import store_databases
+from tracking.dashboard import refresh_snapshots
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_WINDOW_DAYS = getattr(settings, 'ANALYTICS_WINDOW_DAYS', 30)
+ANALYTICS_BATCH_SIZE = getattr(settings, 'ANALYTICS_BATCH_SIZE', 2000)
+# relative distance from the window average that counts as a trend
+TREND_THRESHOLD = getattr(settings, 'ANALYTICS_TREND_THRESHOLD', 0.01)
+# today's move is an anomaly when it is this many standard deviations
+# away from the usual daily move, and at least ANOMALY_MIN_CHANGE in size
+ANOMALY_Z_SCORE = getattr(settings, 'ANALYTICS_ANOMALY_Z_SCORE', 3.0)
+ANOMALY_MIN_CHANGE = getattr(settings, 'ANALYTICS_ANOMALY_MIN_CHANGE', 0.05)
+
+METRIC_FIELDS = [
+    'last_price', 'avg_7d', 'avg_30d', 'volatility_30d',
+    'change_1d_pct', 'change_7d_pct', 'change_30d_pct',
+]
+
+
+def load_daily_prices(product_ids: List[int], today: date, days: int = ANALYTICS_WINDOW_DAYS) -> np.ndarray:
+    """
+    Daily best (lowest active offer) price of each product over the `days`
+    days before `today` and today itself.
+
+    History only records price changes, so every offer carries its last
+    known price forward, including the one it entered the window with.
+
+    Returns:
+        Array of shape (len(product_ids), days + 1), oldest day first,
+        NaN where a product had no price yet
+    """
+    n_days = days + 1
+    best = np.full((len(product_ids), n_days), np.inf)
+    start = timezone.make_aware(datetime.combine(today - timedelta(days=days), time.min))
+
+    offers, rows = _offer_prices(product_ids, start)
+    if offers:
+        offer_row = {pk: row for row, (pk, _, _) in enumerate(offers)}
+        # column 0 holds the price each offer entered the window with
+        prices = np.full((len(offers), n_days + 1), np.nan)
+        prices[:, 0] = [np.nan if seed is None else float(seed) for _, _, seed in offers]
+
+        if rows:
+            offer_idx = np.fromiter((offer_row[row[0]] for row in rows), dtype=np.intp, count=len(rows))
+            day_idx = (
+                np.array([row[1] for row in rows], dtype='datetime64[D]')
+                - np.datetime64(today - timedelta(days=days), 'D')
+            ).astype(np.intp) + 1
+            values = np.fromiter((float(row[2]) for row in rows), dtype=float, count=len(rows))
+
+            in_window = (day_idx >= 1) & (day_idx <= n_days)
+            offer_idx, day_idx, values = offer_idx[in_window], day_idx[in_window], values[in_window]
+            # each offer's rows are in time order, so its last change of a day is the day's price
+            cells = offer_idx * (n_days + 1) + day_idx
+            _, last_reversed = np.unique(cells[::-1], return_index=True)
+            last = len(cells) - 1 - last_reversed
+            prices[offer_idx[last], day_idx[last]] = values[last]
+
+        product_row = {product_id: row for row, product_id in enumerate(product_ids)}
+        offer_products = np.fromiter(
+            (product_row[product_id] for _, product_id, _ in offers), dtype=np.intp, count=len(offers)
+        )
+        # fmin skips the NaN days an offer had no price yet
+        np.fmin.at(best, offer_products, _forward_fill(prices)[:, 1:])
+
+    best[np.isinf(best)] = np.nan
+    return best
+
+
+def _offer_prices(product_ids: List[int], start: datetime) -> Tuple[list, list]:
+    """
+    Active offers of the products as (key, product_id, price before `start`)
+    and their price changes since `start` as (offer key, local day, price),
+    per offer in time order. Offers of every store database are included,
+    keyed by (database alias, pk) as primary keys repeat across shards.
+    """
+    offers, rows = [], []
+    for using in store_databases():
+        shard_offers, shard_rows = _shard_offer_prices(product_ids, start, using)
+        offers += [((using, pk), product_id, seed) for pk, product_id, seed in shard_offers]
+        rows += [((using, offer_id), day, price) for offer_id, day, price in shard_rows]
+    return offers, rows
+
+
+def _shard_offer_prices(product_ids: List[int], start: datetime, using: str) -> Tuple[list, list]:
+    offers = ProductOffer.objects.using(using).filter(product_id__in=product_ids, is_active=True)
+
+    if use_blocks():
+        offers = [
+            (pk, product_id, last_price(seed_block))
+            for pk, product_id, seed_block in offers.annotate(seed_block=Subquery(
+                PriceSeriesBlock.objects
+                .filter(store_product=OuterRef('pk'), day__lt=timezone.localtime(start).date())
+                .order_by('-day')
+                .values('data')[:1]
+            )).values_list('pk', 'product_id', 'seed_block')
+        ]
+        rows = [
+            (offer_id, timezone.localtime(timestamp).date(), price)
+            for offer_id, timestamp, price in iter_points(
+                offer_ids=[pk for pk, _, _ in offers], start=start, using=using
+            )
+        ]
+        return offers, rows
+
+    offers = list(
+        offers
+        .annotate(seed_price=Subquery(
+            PriceHistory.objects
+            .filter(store_product=OuterRef('pk'), timestamp__lt=start)
+            .order_by('-timestamp')
+            .values('price_usd')[:1]
+        ))
+        .values_list('pk', 'product_id', 'seed_price')
+    )
+    rows = list(
+        PriceHistory.objects.using(using)
+        .filter(store_product__product_id__in=product_ids, store_product__is_active=True, timestamp__gte=start)
+        .order_by('timestamp')
+        .values_list('store_product_id', TruncDate('timestamp'), 'price_usd')
+    )
+    return offers, rows
+
+
+def _forward_fill(prices: np.ndarray) -> np.ndarray:
+    """Replace NaN cells with the last non-NaN value to their left in the row."""
+    index = np.where(np.isnan(prices), 0, np.arange(prices.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return prices[np.arange(prices.shape[0])[:, None], index]
+
+
+def compute_metrics(prices: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized statistics over a (products, days) daily price matrix whose
+    last column is today. Metrics a product lacks the history for are NaN.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # all-NaN rows are expected for products without prices
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        last = prices[:, -1]
+        # today is left out of the window average, as the trend compares against it
+        avg_window = np.nanmean(prices[:, :-1], axis=1)
+        returns = prices[:, 1:] / prices[:, :-1] - 1
+        past_returns = returns[:, :-1]
+        volatility = np.nanstd(past_returns, axis=1)
+        deviation = np.abs(returns[:, -1] - np.nanmean(past_returns, axis=1))
+
+        trend = np.full(len(prices), ProductAnalytics.TREND_STABLE, dtype=object)
+        trend[last > avg_window * (1 + TREND_THRESHOLD)] = ProductAnalytics.TREND_UP
+        trend[last < avg_window * (1 - TREND_THRESHOLD)] = ProductAnalytics.TREND_DOWN
+
+        return {
+            'last_price': last,
+            'avg_7d': np.nanmean(prices[:, -7:], axis=1),
+            'avg_30d': avg_window,
+            'volatility_30d': volatility,
+            'change_1d_pct': (last / prices[:, -2] - 1) * 100,
+            'change_7d_pct': (last / prices[:, -8] - 1) * 100,
+            'change_30d_pct': (last / prices[:, 0] - 1) * 100,
+            'trend': trend,
+            # comparisons with NaN are False, so missing history never flags
+            'is_anomaly': (deviation > ANOMALY_Z_SCORE * volatility) & (np.abs(returns[:, -1]) >= ANOMALY_MIN_CHANGE),
+        }
+
+
+def compute_price_analytics(today: Optional[date] = None, batch_size: int = ANALYTICS_BATCH_SIZE) -> int:
+    """
+    Recompute ProductAnalytics of every tracked product, a batch of
+    products per query and vectorized pass, along with the dashboard
+    snapshots of their users, and drop rows of products no longer tracked.
+
+    Returns:
+        Number of products analysed
+    """
+    today = today or timezone.localdate()
+    computed_at = timezone.now()
+    product_ids = list(
+        Product.objects
+        .filter(tracking_products__isnull=False)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+        .distinct()
+    )
+
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        metrics = compute_metrics(load_daily_prices(batch, today))
+        ProductAnalytics.objects.bulk_create(
+            [
+                ProductAnalytics(
+                    product_id=product_id,
+                    computed_at=computed_at,
+                    trend=metrics['trend'][row],
+                    is_anomaly=bool(metrics['is_anomaly'][row]),
+                    **{field: _nullable(metrics[field][row]) for field in METRIC_FIELDS},
+                )
+                for row, product_id in enumerate(batch)
+            ],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=METRIC_FIELDS + ['trend', 'is_anomaly', 'computed_at'],
+        )
+        refresh_snapshots(batch, batch_size=batch_size)
+
+    ProductAnalytics.objects.filter(computed_at__lt=computed_at).delete()
+    logger.info(f"Computed price analytics of {len(product_ids)} products")
+    return len(product_ids)
+
+
+def _nullable(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
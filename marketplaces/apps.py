@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate
+
+
+class MarketplacesConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "marketplaces"
+
+    def ready(self):
+        from marketplaces.models import Product, delete_sharded_offers
+        from marketplaces.scheduler import schedule_after_migrate
+
+        # deployments get their periodic syncs without a manual step
+        post_migrate.connect(schedule_after_migrate, sender=self, dispatch_uid="schedule_after_migrate")
+        # offers on store shards are not reached by the product's cascade
+        post_delete.connect(delete_sharded_offers, sender=Product, dispatch_uid="delete_sharded_offers")
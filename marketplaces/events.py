@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, List
+
+from django.conf import settings
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    import redis
+
+logger = logging.getLogger(__name__)
+
+PRICE_EVENTS_CHANNEL = getattr(settings, 'PRICE_EVENTS_CHANNEL', 'price-changes')
+
+_client = None
+
+
+def get_redis_url() -> str:
+    return getattr(settings, 'PRICE_EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+
+
+def _get_client() -> 'redis.Redis':
+    # redis (which loads its asyncio client too) is imported on first use,
+    # keeping it out of the startup of processes that never publish
+    import redis
+
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(get_redis_url(), socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+
+def publish_price_changes(store_name: str, prices: List[dict]) -> None:
+    """
+    Publish one message with the price changes of a synchronized batch.
+
+    Args:
+        store_name: Store the batch was fetched from
+        prices: [{"product_id", "external_id", "price"}] dicts
+
+    Publishing is best effort: a Redis outage must not fail the sync.
+    """
+    if not prices:
+        return
+    import redis
+
+    message = json.dumps({
+        "store": store_name,
+        "timestamp": timezone.now().isoformat(),
+        "prices": prices,
+    })
+    try:
+        _get_client().publish(PRICE_EVENTS_CHANNEL, message)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish price changes for {store_name}: {e}")
+
+
+class PriceEventsHub:
+    """
+    One Redis subscription to the price events channel per process, fanned
+    out to every stream subscribed in it.
+
+    The subscription is opened with the first subscriber and closed with the
+    last. Each subscriber gets a bounded queue of decoded messages; a client
+    too slow to keep up loses its oldest messages instead of holding up the
+    others.
+    """
+
+    QUEUE_SIZE = 100
+    RECONNECT_DELAY = 1
+
+    def __init__(self):
+        self._queues = set()
+        self._listener = None
+        self._loop = None
+
+    @asynccontextmanager
+    async def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # tasks and connections are bound to the loop that created them
+            self._queues, self._listener, self._loop = set(), None, loop
+        queue = asyncio.Queue(self.QUEUE_SIZE)
+        self._queues.add(queue)
+        if self._listener is None:
+            self._listener = loop.create_task(self._listen())
+        try:
+            yield queue
+        finally:
+            self._queues.discard(queue)
+            if not self._queues and self._listener is not None:
+                self._listener.cancel()
+                self._listener = None
+
+    async def _listen(self) -> None:
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.from_url(get_redis_url())
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(PRICE_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._fan_out(json.loads(message["data"]))
+            except redis.RedisError as e:
+                logger.warning(f"Price events subscription lost, reconnecting: {e}")
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    def _fan_out(self, payload: dict) -> None:
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+
+price_events = PriceEventsHub()
@@ -0,0 +1,176 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from itertools import chain, islice
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from marketplaces.models import PriceHistory, Product, ProductOffer
+from marketplaces.price_series import iter_points, use_blocks
+from test_scrape_proj.db_router import PRIMARY_DB, shard_for_store, store_databases
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'PRICE_HISTORY_EXPORT_CHUNK_SIZE', 2000)
+EXPORT_FIELDS = ['timestamp', 'store_name', 'external_id', 'price_usd']
+
+
+def price_history_rows(
+        stores: Optional[Iterable[str]] = None,
+        external_ids: Optional[Iterable[str]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        using: str = 'default',
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[tuple]:
+    """
+    Stream (timestamp, store_name, external_id, price_usd) rows in id order,
+    one store database after the other.
+
+    Rows are fetched with iterator(), i.e. a server-side cursor on PostgreSQL,
+    so memory use does not depend on the number of rows exported.
+    With PRICE_HISTORY_STORAGE = "blocks" rows come day by day instead.
+
+    Args:
+        using: Alias the primary's share (and products) is read from, e.g.
+            the replica; sharded stores are read from their own database
+    """
+    product_ids = None
+    if external_ids:
+        # products live on the primary only, so shards are filtered by id
+        product_ids = list(
+            Product.objects.using(using).filter(external_id__in=list(external_ids)).values_list('pk', flat=True)
+        )
+    if stores:
+        databases = sorted({shard_for_store(store) for store in stores})
+    else:
+        databases = store_databases()
+    databases = [using if alias == PRIMARY_DB else alias for alias in databases]
+
+    read = _series_rows if use_blocks() else _history_rows
+    rows = chain.from_iterable(
+        read(stores, product_ids, date_from, date_to, alias, chunk_size) for alias in databases
+    )
+    return _with_external_ids(rows, using, chunk_size)
+
+
+def _history_rows(stores, product_ids, date_from, date_to, using, chunk_size) -> Iterator[tuple]:
+    queryset = PriceHistory.objects.using(using)
+    if stores:
+        queryset = queryset.filter(store_product__store_name__in=list(stores))
+    if product_ids is not None:
+        queryset = queryset.filter(store_product__product_id__in=product_ids)
+    # bounds on the raw column rather than __date keep the filter sargable
+    if date_from:
+        queryset = queryset.filter(timestamp__gte=_start_of_day(date_from))
+    if date_to:
+        queryset = queryset.filter(timestamp__lt=_start_of_day(date_to + timedelta(days=1)))
+
+    return (
+        queryset
+        .order_by('id')
+        .values_list('timestamp', 'store_product__store_name', 'store_product__product_id', 'price_usd')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _series_rows(stores, product_ids, date_from, date_to, using, chunk_size) -> Iterator[tuple]:
+    offers = ProductOffer.objects.using(using)
+    if stores:
+        offers = offers.filter(store_name__in=list(stores))
+    if product_ids is not None:
+        offers = offers.filter(product_id__in=product_ids)
+    offer_keys = {
+        pk: (store_name, product_id)
+        for pk, store_name, product_id in offers.values_list('pk', 'store_name', 'product_id')
+    }
+
+    points = iter_points(
+        offer_ids=offer_keys if stores or product_ids is not None else None,
+        date_from=date_from,
+        date_to=date_to,
+        using=using,
+        chunk_size=chunk_size,
+    )
+    for offer_id, timestamp, price in points:
+        store_name, product_id = offer_keys[offer_id]
+        yield timestamp, store_name, product_id, price
+
+
+def _with_external_ids(rows: Iterator[tuple], using: str, chunk_size: int) -> Iterator[tuple]:
+    """Replace the product id of (timestamp, store_name, product_id, price) rows with its external id."""
+    external_ids = {}
+    while chunk := list(islice(rows, chunk_size)):
+        missing = {row[2] for row in chunk} - external_ids.keys()
+        if missing:
+            external_ids.update(
+                Product.objects.using(using).filter(pk__in=missing).values_list('pk', 'external_id')
+            )
+        for timestamp, store_name, product_id, price in chunk:
+            yield timestamp, store_name, external_ids.get(product_id), price
+
+
+def _start_of_day(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for timestamp, store_name, external_id, price in rows:
+        yield writer.writerow([timestamp.isoformat(), store_name, external_id, price])
+
+
+def iter_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    for timestamp, store_name, external_id, price in rows:
+        yield json.dumps({
+            'timestamp': timestamp.isoformat(),
+            'store_name': store_name,
+            'external_id': external_id,
+            'price_usd': str(price),
+        }) + '\n'
+
+
+def write_parquet(rows: Iterable[tuple], path: str, row_group_size: int = EXPORT_CHUNK_SIZE * 50) -> int:
+    """
+    Write rows to a Parquet file one row group at a time.
+
+    Requires the optional pyarrow package.
+
+    Returns:
+        Number of rows written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+        ('store_name', pa.string()),
+        ('external_id', pa.string()),
+        ('price_usd', pa.decimal128(12, 2)),
+    ])
+
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                writer.write_table(pa.Table.from_pylist(_as_records(batch), schema=schema))
+                written += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(_as_records(batch), schema=schema))
+            written += len(batch)
+    return written
+
+
+def _as_records(batch):
+    return [dict(zip(EXPORT_FIELDS, row)) for row in batch]
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from marketplaces.matching import index_products
+from marketplaces.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute title signatures and LSH buckets used to match offers across stores. "
+        "Only products without a signature are indexed unless --all is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-index every product.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        products = Product.objects.only("pk", "title").order_by("pk")
+        if not options["all"]:
+            products = products.filter(minhash__isnull=True)
+
+        count = index_products(products.iterator(chunk_size=options["batch_size"]), options["batch_size"])
+        self.stdout.write(f"Indexed {count} products")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplaces.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = "Assert that every hot query is served by an index on the current database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true", help="Print the full query plans.")
+
+    def handle(self, *args, **options):
+        failed = []
+        for result in check_query_plans():
+            if result["full_scans"]:
+                failed.append(result["name"])
+                self.stdout.write(self.style.ERROR(
+                    f"FAIL {result['name']}: full scan of {', '.join(result['full_scans'])}"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK   {result['name']}"))
+
+            if options["verbose_plans"] or result["full_scans"]:
+                self.stdout.write(result["plan"])
+
+        if failed:
+            raise CommandError(f"{len(failed)} hot queries do not use an index")
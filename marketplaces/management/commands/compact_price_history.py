@@ -0,0 +1,40 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from marketplaces.models import PriceHistory
+from marketplaces.price_series import append_points
+from test_scrape_proj.db_router import store_databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Move PriceHistory rows into delta-encoded per-offer day blocks, "
+        "for switching PRICE_HISTORY_STORAGE to \"blocks\". Compacted rows are deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Offers per transaction.")
+
+    def handle(self, *args, **options):
+        offers = points = 0
+        for using in store_databases():
+            # materialized up front: the loop deletes from the table it comes from
+            offer_ids = iter(list(
+                PriceHistory.objects.using(using)
+                .order_by("store_product_id")
+                .values_list("store_product_id", flat=True)
+                .distinct()
+            ))
+            while batch := list(islice(offer_ids, options["batch_size"])):
+                rows = PriceHistory.objects.using(using).filter(store_product_id__in=batch)
+                with transaction.atomic(using=using):
+                    points += append_points(
+                        rows.order_by("store_product_id", "timestamp")
+                        .values_list("store_product_id", "timestamp", "price_usd"),
+                        using=using,
+                    )
+                    rows.delete()
+                offers += len(batch)
+        self.stdout.write(f"Compacted {points} price points of {offers} offers")
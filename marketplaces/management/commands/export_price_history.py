@@ -0,0 +1,48 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplaces.export import EXPORT_CHUNK_SIZE, iter_csv, iter_ndjson, price_history_rows, write_parquet
+
+
+class Command(BaseCommand):
+    help = "Stream price history to CSV, NDJSON or Parquet with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "ndjson", "parquet"], default="csv")
+        parser.add_argument("--output", help="Output file, stdout when omitted (not for parquet).")
+        parser.add_argument("--store", action="append", help="Store name, may be repeated.")
+        parser.add_argument("--product", action="append", help="Product external id, may be repeated.")
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="First day, YYYY-MM-DD.")
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="Last day, YYYY-MM-DD.")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        rows = price_history_rows(
+            stores=options["store"],
+            external_ids=options["product"],
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+            using=options["database"],
+            chunk_size=options["chunk_size"],
+        )
+
+        if options["format"] == "parquet":
+            if not options["output"]:
+                raise CommandError("--output is required for parquet")
+            try:
+                written = write_parquet(rows, options["output"])
+            except ImportError:
+                raise CommandError("Parquet export requires pyarrow") from None
+            self.stderr.write(f"Exported {written} rows")
+            return
+
+        lines = iter_csv(rows) if options["format"] == "csv" else iter_ndjson(rows)
+        output = open(options["output"], "w", newline="") if options["output"] else sys.stdout
+        try:
+            output.writelines(lines)
+        finally:
+            if options["output"]:
+                output.close()
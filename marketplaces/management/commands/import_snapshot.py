@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from marketplaces.services.snapshot import SnapshotMarketClient
+from marketplaces.sync import ServicesSynchronizer, SyncResult
+
+
+def _import_partition(path, store_name, file_format, partition, publish_events, delist):
+    client = SnapshotMarketClient(path, store_name, partition=partition, format=file_format)
+    # re-running the same import resumes each partition from its last committed batch
+    checkpoint_key = f"snapshot:{store_name}:{zlib.crc32(os.path.abspath(path).encode()):08x}"
+    if partition:
+        checkpoint_key += f":{partition[0]}/{partition[1]}"
+    synchronizer = ServicesSynchronizer(
+        client, publish_events=publish_events, checkpoint_key=checkpoint_key, delist_missing=delist,
+    )
+    return synchronizer.sync_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a JSON/NDJSON catalog snapshot through ServicesSynchronizer. "
+        "--workers N splits products by external id hash over N processes "
+        "(use with PostgreSQL; SQLite serializes writers). Offers missing from "
+        "the snapshot are left alone unless --delist is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--store", required=True, help="Store name the snapshot belongs to.")
+        parser.add_argument("--format", choices=["json", "ndjson"], help="Guessed from the suffix by default.")
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument(
+            "--publish-events", action="store_true",
+            help="Publish price changes to subscribers like a live sync does.",
+        )
+        parser.add_argument(
+            "--delist", action="store_true",
+            help="Delist active offers of the store missing from the snapshot, "
+                 "like a live sync does. Only for snapshots of the whole catalog.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+
+        job = (options["path"], options["store"], options["format"])
+        flags = (options["publish_events"], options["delist"])
+        if workers == 1:
+            results = [_import_partition(*job, None, *flags)]
+        else:
+            # children must not inherit the parent's open database connections
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [
+                    executor.submit(_import_partition, *job, (index, workers), *flags)
+                    for index in range(workers)
+                ]
+                results = [future.result() for future in futures]
+
+        total = SyncResult()
+        for result in results:
+            total.merge(result)
+        self.stdout.write(f"Imported {options['path']}: {total}")
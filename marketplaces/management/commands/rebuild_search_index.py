@@ -0,0 +1,21 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from marketplaces.models import Product
+from marketplaces.search import index_products
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of every product."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        product_ids = Product.objects.order_by("pk").values_list("pk", flat=True).iterator()
+        count = 0
+        while batch := list(islice(product_ids, options["batch_size"])):
+            index_products(batch)
+            count += len(batch)
+        self.stdout.write(f"Indexed {count} products")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from marketplaces.scheduler import sync_periodic_tasks
+
+
+class Command(BaseCommand):
+    help = "Create per-store periodic sync tasks from the marketplace connector registry."
+
+    def handle(self, *args, **options):
+        result = sync_periodic_tasks()
+        for store_name in result["scheduled"]:
+            self.stdout.write(f"Scheduled {store_name}")
+        for name in result["removed"]:
+            self.stdout.write(f"Removed {name}")
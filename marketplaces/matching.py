@@ -0,0 +1,168 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from marketplaces.models import Product, ProductMatchBucket, ProductOffer
+from test_scrape_proj.db_router import shard_for_store
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: pairs above ~0.5 Jaccard similarity usually share a band
+LSH_BANDS = 16
+# estimated Jaccard similarity of title tokens needed to link two offers
+MATCH_THRESHOLD = getattr(settings, 'PRODUCT_MATCH_THRESHOLD', 0.6)
+
+STOP_WORDS = frozenset({'a', 'an', 'and', 'for', 'in', 'of', 'on', 'the', 'to', 'with'})
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# universal hash family h(x) = (a * x + b) mod p; x and a fit in 32 bits,
+# so a * x + b never overflows uint64. Fixed seed: signatures are stored.
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, int(_PRIME), NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(title: str) -> Set[str]:
+    """
+    Normalized title tokens. Categories are not part of the signature:
+    every store has its own taxonomy, so they would only lower similarity.
+    """
+    return {token for token in _TOKEN_RE.findall(title.lower()) if token not in STOP_WORDS}
+
+
+def signature(title: str) -> Optional[np.ndarray]:
+    """MinHash signature (uint32 array) of a title, None if it has no tokens."""
+    features = shingles(title)
+    if not features:
+        return None
+    hashes = np.fromiter(
+        (zlib.crc32(feature.encode()) for feature in features), dtype=np.uint64, count=len(features)
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(minhash: np.ndarray) -> List[int]:
+    """One LSH bucket key per band: the band number and a hash of its rows."""
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    return [
+        (band << 32) | zlib.crc32(minhash[band * rows:(band + 1) * rows].tobytes())
+        for band in range(LSH_BANDS)
+    ]
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the token sets behind two signatures."""
+    return float(np.count_nonzero(first == second)) / NUM_PERMUTATIONS
+
+
+def bucket_rows(product_id: int, minhash: Optional[np.ndarray]) -> List[ProductMatchBucket]:
+    if minhash is None:
+        return []
+    return [ProductMatchBucket(key=key, product_id=product_id) for key in band_keys(minhash)]
+
+
+class ProductMatcher:
+    """
+    Finds the canonical product a new offer of `store_name` belongs to.
+
+    Candidates come from the LSH buckets (indexed lookups, no pairwise scan
+    of the catalog) and are confirmed by comparing full signatures.
+    Products the store already sells are never candidates, as a store lists
+    each product once.
+    """
+
+    def __init__(self, store_name: str, threshold: float = MATCH_THRESHOLD):
+        self.store_name = store_name
+        self.threshold = threshold
+
+    def match(self, items: Iterable[dict]) -> Dict[str, int]:
+        """
+        Args:
+            items: Validated upstream products
+
+        Returns:
+            external id -> product id for the items that matched
+        """
+        keys_of = {}
+        signatures = {}
+        for item in items:
+            minhash = signature(str(item['title']))
+            if minhash is not None:
+                external_id = str(item['id'])
+                signatures[external_id] = minhash
+                keys_of[external_id] = band_keys(minhash)
+
+        products_of_key = defaultdict(set)
+        for key, product_id in ProductMatchBucket.objects.filter(
+                key__in={key for keys in keys_of.values() for key in keys}
+        ).values_list('key', 'product_id'):
+            products_of_key[key].add(product_id)
+        if not products_of_key:
+            return {}
+
+        candidate_ids = set().union(*products_of_key.values())
+        candidate_ids -= set(
+            ProductOffer.objects.using(shard_for_store(self.store_name))
+            .filter(product_id__in=candidate_ids, store_name=self.store_name)
+            .values_list('product_id', flat=True)
+        )
+        stored = {
+            product_id: np.frombuffer(bytes(minhash), dtype=np.uint32)
+            for product_id, minhash in Product.objects
+            .filter(pk__in=candidate_ids, minhash__isnull=False)
+            .values_list('pk', 'minhash')
+        }
+
+        scored = []
+        for external_id, keys in keys_of.items():
+            for product_id in set().union(*(products_of_key[key] for key in keys)) & stored.keys():
+                score = similarity(signatures[external_id], stored[product_id])
+                if score >= self.threshold:
+                    scored.append((score, external_id, product_id))
+
+        # best pairs first; each item and each product is linked at most once
+        matches = {}
+        claimed = set()
+        for score, external_id, product_id in sorted(scored, reverse=True):
+            if external_id not in matches and product_id not in claimed:
+                matches[external_id] = product_id
+                claimed.add(product_id)
+        return matches
+
+
+def index_products(products: Iterable[Product], batch_size: int = 1000) -> int:
+    """
+    (Re)compute signatures and LSH buckets of existing products.
+
+    Returns:
+        Number of products indexed
+    """
+    count = 0
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) >= batch_size:
+            count += _index_batch(batch)
+            batch = []
+    if batch:
+        count += _index_batch(batch)
+    return count
+
+
+def _index_batch(products: List[Product]) -> int:
+    buckets = []
+    for product in products:
+        minhash = signature(product.title)
+        product.minhash = None if minhash is None else minhash.tobytes()
+        buckets.extend(bucket_rows(product.pk, minhash))
+
+    with transaction.atomic():
+        Product.objects.bulk_update(products, ['minhash'])
+        ProductMatchBucket.objects.filter(product__in=products).delete()
+        ProductMatchBucket.objects.bulk_create(buckets)
+    return len(products)
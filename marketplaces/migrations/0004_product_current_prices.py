@@ -0,0 +1,86 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:32
+
+from django.db import migrations, models, router
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+
+def backfill_current_prices(apps, schema_editor):
+    Product = apps.get_model("marketplaces", "Product")
+    ProductOffer = apps.get_model("marketplaces", "ProductOffer")
+    # store shards migrate the marketplaces app too but hold no products
+    if schema_editor.connection.alias != router.db_for_write(Product):
+        return
+
+    now = timezone.now()
+    products = [
+        Product(
+            pk=row["product_id"],
+            current_min_price_usd=row["min_price"],
+            current_max_price_usd=row["max_price"],
+            offer_count=row["count"],
+            price_updated_at=now,
+        )
+        for row in ProductOffer.objects.values("product_id").annotate(
+            min_price=Min("current_price_usd"),
+            max_price=Max("current_price_usd"),
+            count=Count("id"),
+        )
+    ]
+    Product.objects.bulk_update(
+        products,
+        [
+            "current_min_price_usd",
+            "current_max_price_usd",
+            "offer_count",
+            "price_updated_at",
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0003_remove_productoffer_url"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="current_max_price_usd",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="current_min_price_usd",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="offer_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="price_updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["current_min_price_usd"], name="marketplace_current_be88a0_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["current_max_price_usd"], name="marketplace_current_fcce75_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_current_prices, migrations.RunPython.noop),
+    ]
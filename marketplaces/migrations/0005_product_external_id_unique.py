@@ -0,0 +1,100 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:34
+
+from django.db import migrations, models, router
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+
+def merge_duplicate_products(apps, schema_editor):
+    """Fold products sharing an external_id into the oldest one."""
+    Product = apps.get_model("marketplaces", "Product")
+    ProductOffer = apps.get_model("marketplaces", "ProductOffer")
+    TrackingProducts = apps.get_model("tracking", "TrackingProducts")
+    # store shards migrate the marketplaces app too but hold no products
+    if schema_editor.connection.alias != router.db_for_write(Product):
+        return
+
+    duplicates = (
+        Product.objects.values("external_id")
+        .annotate(keep_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    keep_ids = []
+    for row in duplicates:
+        keep_ids.append(row["keep_id"])
+        extra_ids = list(
+            Product.objects.filter(external_id=row["external_id"])
+            .exclude(id=row["keep_id"])
+            .values_list("id", flat=True)
+        )
+        ProductOffer.objects.filter(product_id__in=extra_ids).update(
+            product_id=row["keep_id"]
+        )
+
+        tracking_users = TrackingProducts.objects.filter(
+            product_id=row["keep_id"]
+        ).values_list("user_id", flat=True)
+        TrackingProducts.objects.filter(
+            product_id__in=extra_ids, user_id__in=tracking_users
+        ).delete()
+        TrackingProducts.objects.filter(product_id__in=extra_ids).update(
+            product_id=row["keep_id"]
+        )
+
+        Product.objects.filter(id__in=extra_ids).delete()
+
+    # the kept products now own the offers of their duplicates
+    stats = {
+        row["product_id"]: row
+        for row in ProductOffer.objects.filter(product_id__in=keep_ids)
+        .values("product_id")
+        .annotate(
+            min_price=Min("current_price_usd"),
+            max_price=Max("current_price_usd"),
+            count=Count("id"),
+        )
+    }
+    now = timezone.now()
+    Product.objects.bulk_update(
+        [
+            Product(
+                pk=keep_id,
+                current_min_price_usd=stats.get(keep_id, {}).get("min_price"),
+                current_max_price_usd=stats.get(keep_id, {}).get("max_price"),
+                offer_count=stats.get(keep_id, {}).get("count", 0),
+                price_updated_at=now,
+            )
+            for keep_id in keep_ids
+        ],
+        [
+            "current_min_price_usd",
+            "current_max_price_usd",
+            "offer_count",
+            "price_updated_at",
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0004_product_current_prices"),
+        ("tracking", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_products, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="product",
+            name="external_id",
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="productoffer",
+            index=models.Index(
+                fields=["product", "current_price_usd"],
+                name="marketplace_product_8cc68b_idx",
+            ),
+        ),
+    ]
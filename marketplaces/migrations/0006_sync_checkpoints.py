@@ -0,0 +1,79 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:42
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0005_product_external_id_unique"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuarantinedProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("store_name", models.CharField(max_length=100)),
+                ("run_id", models.UUIDField(db_index=True)),
+                ("external_id", models.CharField(blank=True, max_length=100)),
+                (
+                    "payload",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                ("error", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SyncCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255)),
+                ("store_name", models.CharField(max_length=100)),
+                ("run_id", models.UUIDField(unique=True)),
+                ("last_batch", models.IntegerField(default=-1)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("failed", "Failed"),
+                            ("completed", "Completed"),
+                        ],
+                        default="running",
+                        max_length=16,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["key", "status", "started_at"],
+                        name="marketplace_key_4addf9_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0006_sync_checkpoints"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="productoffer",
+            name="marketplace_product_8cc68b_idx",
+        ),
+        migrations.AddField(
+            model_name="productoffer",
+            name="delisted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="productoffer",
+            name="is_active",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name="productoffer",
+            index=models.Index(
+                fields=["product", "is_active", "current_price_usd"],
+                name="marketplace_product_f165e5_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productoffer",
+            index=models.Index(
+                fields=["store_name", "is_active"],
+                name="marketplace_store_n_959e19_idx",
+            ),
+        ),
+    ]
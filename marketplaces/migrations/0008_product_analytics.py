@@ -0,0 +1,46 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0007_offer_is_active"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductAnalytics",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="analytics",
+                        serialize=False,
+                        to="marketplaces.product",
+                    ),
+                ),
+                ("last_price", models.FloatField(null=True)),
+                ("avg_7d", models.FloatField(null=True)),
+                ("avg_30d", models.FloatField(null=True)),
+                ("volatility_30d", models.FloatField(null=True)),
+                ("change_1d_pct", models.FloatField(null=True)),
+                ("change_7d_pct", models.FloatField(null=True)),
+                ("change_30d_pct", models.FloatField(null=True)),
+                (
+                    "trend",
+                    models.CharField(
+                        choices=[("up", "Up"), ("down", "Down"), ("stable", "Stable")],
+                        default="stable",
+                        max_length=8,
+                    ),
+                ),
+                ("is_anomaly", models.BooleanField(default=False)),
+                ("computed_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0008_product_analytics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="minhash",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.CreateModel(
+            name="ProductMatchBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.BigIntegerField(db_index=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="match_buckets",
+                        to="marketplaces.product",
+                    ),
+                ),
+            ],
+        ),
+    ]
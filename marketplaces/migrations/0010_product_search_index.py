@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# The search index is vendor specific and not part of the model state,
+# see marketplaces.search. Run rebuild_search_index after changing
+# PRODUCT_SEARCH_CONFIG from its "english" default.
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE marketplaces_product ADD COLUMN search_vector tsvector",
+    "UPDATE marketplaces_product SET search_vector = "
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')",
+    "CREATE INDEX marketplaces_product_search_idx ON marketplaces_product USING gin (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS marketplaces_product_search_idx",
+    "ALTER TABLE marketplaces_product DROP COLUMN IF EXISTS search_vector",
+]
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE marketplaces_product_fts USING fts5("
+    "title, category, description, tokenize = 'porter unicode61')",
+    "INSERT INTO marketplaces_product_fts (rowid, title, category, description) "
+    "SELECT id, title, coalesce(category, ''), coalesce(description, '') FROM marketplaces_product",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS marketplaces_product_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0009_product_matching"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD}),
+            _run({"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}),
+        ),
+    ]
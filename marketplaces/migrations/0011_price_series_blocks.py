@@ -0,0 +1,49 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0010_product_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceSeriesBlock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("points", models.PositiveIntegerField(default=0)),
+                ("data", models.BinaryField()),
+                (
+                    "store_product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="series_blocks",
+                        to="marketplaces.productoffer",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["day"], name="marketplace_day_7cb283_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("store_product", "day"), name="unique_offer_series_day"
+                    )
+                ],
+            },
+        ),
+    ]
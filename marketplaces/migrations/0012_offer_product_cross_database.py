@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-19 15:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0011_price_series_blocks"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="productoffer",
+            name="product",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="offers",
+                to="marketplaces.product",
+            ),
+        ),
+    ]
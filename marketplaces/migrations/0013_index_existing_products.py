@@ -0,0 +1,42 @@
+from django.db import migrations, router
+
+# The signatures must be the ones the synchronizer computes; rebuild them
+# with `build_match_index --all` whenever the MinHash scheme changes.
+from marketplaces.matching import band_keys, signature
+
+BATCH_SIZE = 1000
+
+
+def index_existing_products(apps, schema_editor):
+    """Sign the products created before matching, so syncs can match them."""
+    Product = apps.get_model("marketplaces", "Product")
+    ProductMatchBucket = apps.get_model("marketplaces", "ProductMatchBucket")
+    # store shards migrate the marketplaces app too but hold no products
+    if schema_editor.connection.alias != router.db_for_write(Product):
+        return
+
+    products = Product.objects.filter(minhash__isnull=True).only("pk", "title").order_by("pk")
+    last_pk = 0
+    while batch := list(products.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        last_pk = batch[-1].pk
+        signed = []
+        buckets = []
+        for product in batch:
+            minhash = signature(product.title)
+            if minhash is not None:
+                product.minhash = minhash.tobytes()
+                signed.append(product)
+                buckets += [ProductMatchBucket(key=key, product_id=product.pk) for key in band_keys(minhash)]
+        Product.objects.bulk_update(signed, ["minhash"])
+        ProductMatchBucket.objects.bulk_create(buckets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0012_offer_product_cross_database"),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_products, migrations.RunPython.noop),
+    ]
@@ -1,25 +1,56 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+
+from test_scrape_proj.db_router import store_databases
 
 
 class Product(models.Model):
-    external_id = models.CharField(max_length=100)
+    external_id = models.CharField(max_length=100, unique=True)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     category = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Maintained by ServicesSynchronizer from the product's offers
+    current_min_price_usd = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    current_max_price_usd = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    offer_count = models.PositiveIntegerField(default=0)
+    price_updated_at = models.DateTimeField(null=True, blank=True)
+
+    # MinHash signature of the title, see marketplaces.matching
+    minhash = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['current_min_price_usd']),
+            models.Index(fields=['current_max_price_usd']),
+        ]
+
     def __str__(self):
         return self.title
 
 
+class ProductMatchBucket(models.Model):
+    """LSH band of a product signature; products sharing a key are match candidates."""
+
+    key = models.BigIntegerField(db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='match_buckets')
+
+
 class ProductOffer(models.Model):
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='offers')
+    # no database constraint: offers may live on their store's shard while
+    # products stay on the primary, see test_scrape_proj.db_router
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='offers', db_constraint=False)
     store_name = models.CharField(max_length=100)
     external_id = models.CharField(max_length=100)
 
     current_price_usd = models.DecimalField(max_digits=12, decimal_places=2)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # cleared by ServicesSynchronizer when the offer disappears upstream
+    is_active = models.BooleanField(default=True)
+    delisted_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -27,10 +58,35 @@ class ProductOffer(models.Model):
                 name='unique_store_product'
             )
         ]
+        indexes = [
+            # covers the per-product min/max/count aggregate over active offers
+            models.Index(fields=['product', 'is_active', 'current_price_usd']),
+            # active offers of a store, compared against each full sync
+            models.Index(fields=['store_name', 'is_active']),
+        ]
         verbose_name = "Product Offer"
         verbose_name_plural = "Product Offers"
 
 
+def delete_sharded_offers(sender, instance, using, **kwargs):
+    """
+    Delete the offers of a deleted product, with their price history, from
+    the other store databases once the deletion committed (receiver of
+    post_delete). Deleting a product only cascades to the offers on its own
+    database.
+    """
+    aliases = [alias for alias in store_databases() if alias != using]
+    if not aliases:
+        return
+    product_id = instance.pk  # cleared on the instance once the deletion finished
+
+    def delete():
+        for alias in aliases:
+            ProductOffer.objects.using(alias).filter(product_id=product_id).delete()
+
+    transaction.on_commit(delete, using=using)
+
+
 class PriceHistory(models.Model):
     store_product = models.ForeignKey(ProductOffer, on_delete=models.CASCADE, related_name='history')
     price_usd = models.DecimalField(max_digits=12, decimal_places=2)
@@ -39,4 +95,95 @@ class PriceHistory(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['store_product', 'timestamp']),
-        ]
\ No newline at end of file
+        ]
+
+
+class PriceSeriesBlock(models.Model):
+    """
+    Price changes of one offer during one (local) day, delta-encoded by
+    marketplaces.price_series. Used instead of PriceHistory rows when
+    settings.PRICE_HISTORY_STORAGE is "blocks".
+    """
+
+    store_product = models.ForeignKey(ProductOffer, on_delete=models.CASCADE, related_name='series_blocks')
+    day = models.DateField()
+    points = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['store_product', 'day'],
+                name='unique_offer_series_day'
+            )
+        ]
+        indexes = [
+            # export and compaction walk blocks day by day
+            models.Index(fields=['day']),
+        ]
+
+
+class SyncCheckpoint(models.Model):
+    """Progress of one synchronization run, committed together with each batch."""
+
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_COMPLETED, 'Completed'),
+    ]
+
+    # store name, or a narrower key for partitioned runs such as snapshot imports
+    key = models.CharField(max_length=255)
+    store_name = models.CharField(max_length=100)
+    run_id = models.UUIDField(unique=True)
+    last_batch = models.IntegerField(default=-1)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'status', 'started_at']),
+        ]
+
+
+class QuarantinedProduct(models.Model):
+    """Upstream product rows that failed validation or could not be written."""
+
+    store_name = models.CharField(max_length=100)
+    run_id = models.UUIDField(db_index=True)
+    external_id = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    error = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class ProductAnalytics(models.Model):
+    """Price statistics of a tracked product, recomputed by a periodic task."""
+
+    TREND_UP = 'up'
+    TREND_DOWN = 'down'
+    TREND_STABLE = 'stable'
+    TREND_CHOICES = [
+        (TREND_UP, 'Up'),
+        (TREND_DOWN, 'Down'),
+        (TREND_STABLE, 'Stable'),
+    ]
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='analytics'
+    )
+    # over the daily best (lowest active offer) price
+    last_price = models.FloatField(null=True)
+    avg_7d = models.FloatField(null=True)
+    avg_30d = models.FloatField(null=True)
+    volatility_30d = models.FloatField(null=True)
+    change_1d_pct = models.FloatField(null=True)
+    change_7d_pct = models.FloatField(null=True)
+    change_30d_pct = models.FloatField(null=True)
+    trend = models.CharField(max_length=8, choices=TREND_CHOICES, default=TREND_STABLE)
+    is_anomaly = models.BooleanField(default=False)
+    computed_at = models.DateTimeField()
@@ -0,0 +1,190 @@
+import functools
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from marketplaces.models import PriceSeriesBlock
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# "rows": one PriceHistory row per price change
+# "blocks": one delta-encoded PriceSeriesBlock per offer and day
+PRICE_HISTORY_STORAGE = getattr(settings, 'PRICE_HISTORY_STORAGE', 'rows')
+SERIES_CHUNK_SIZE = getattr(settings, 'PRICE_SERIES_CHUNK_SIZE', 500)
+BULK_BATCH_SIZE = getattr(settings, 'SYNC_BULK_BATCH_SIZE', 1000)
+
+Point = Tuple[int, datetime, Decimal]
+
+
+@functools.cache
+def point_dtype() -> 'np.dtype':
+    """
+    One 12 byte record per price change: milliseconds since the previous
+    change (the first one since local midnight) and the change in cents.
+
+    numpy is imported on first use, keeping it out of the web process
+    while PRICE_HISTORY_STORAGE is "rows".
+    """
+    import numpy as np
+
+    return np.dtype([('ms', '<u4'), ('cents', '<i8')])
+
+
+def use_blocks() -> bool:
+    return PRICE_HISTORY_STORAGE == 'blocks'
+
+
+def to_cents(price) -> int:
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+def decode_block(data: bytes) -> Tuple['np.ndarray', 'np.ndarray']:
+    """(milliseconds since the block's midnight, prices in cents) of every point."""
+    import numpy as np
+
+    records = np.frombuffer(bytes(data), dtype=point_dtype())
+    return np.cumsum(records['ms'], dtype=np.int64), np.cumsum(records['cents'], dtype=np.int64)
+
+
+def encode_points(offsets_ms: Iterable[int], cents: Iterable[int], previous: Tuple[int, int] = (0, 0)) -> bytes:
+    """
+    Records of points that follow `previous`, the (offset, cents) of the
+    block's last point. Offsets must not decrease.
+    """
+    import numpy as np
+
+    offsets = np.asarray(offsets_ms, dtype=np.int64)
+    prices = np.asarray(cents, dtype=np.int64)
+    records = np.empty(len(offsets), dtype=point_dtype())
+    records['ms'] = np.diff(offsets, prepend=previous[0])
+    records['cents'] = np.diff(prices, prepend=previous[1])
+    return records.tobytes()
+
+
+def last_price(data: Optional[bytes]) -> Optional[Decimal]:
+    if not data:
+        return None
+    return _from_cents(int(decode_block(data)[1][-1]))
+
+
+def min_price(data: Optional[bytes]) -> Optional[Decimal]:
+    if not data:
+        return None
+    return _from_cents(int(decode_block(data)[1].min()))
+
+
+def append_points(points: Iterable[Point], batch_size: int = BULK_BATCH_SIZE, using: str = 'default') -> int:
+    """
+    Add (offer id, timestamp, price) points to the offers' day blocks with
+    one query for the affected blocks and a bulk create/update.
+
+    Points are normally later than everything stored and are appended as
+    is; a block receiving older points is re-encoded in time order.
+    All offers must be stored on the `using` database.
+
+    Returns:
+        Number of points stored
+    """
+    grouped = defaultdict(list)
+    for offer_id, timestamp, price in points:
+        day = timezone.localtime(timestamp).date()
+        offset = (timestamp - _midnight(day)) // timedelta(milliseconds=1)
+        grouped[(offer_id, day)].append((offset, to_cents(price)))
+    if not grouped:
+        return 0
+
+    existing = {
+        (block.store_product_id, block.day): block
+        for block in PriceSeriesBlock.objects.using(using).filter(
+            store_product_id__in={offer_id for offer_id, _ in grouped},
+            day__in={day for _, day in grouped},
+        )
+    }
+
+    to_create = []
+    to_update = []
+    for (offer_id, day), day_points in grouped.items():
+        day_points.sort()
+        block = existing.get((offer_id, day))
+        if block is None:
+            to_create.append(PriceSeriesBlock(
+                store_product_id=offer_id,
+                day=day,
+                points=len(day_points),
+                data=encode_points(*zip(*day_points)),
+            ))
+            continue
+
+        offsets, cents = decode_block(block.data)
+        if day_points[0][0] >= offsets[-1]:
+            block.data = bytes(block.data) + encode_points(*zip(*day_points), (offsets[-1], cents[-1]))
+        else:
+            # stable sort: stored points stay ahead of new ones at the same offset
+            merged = list(zip(offsets.tolist(), cents.tolist())) + day_points
+            merged.sort(key=lambda point: point[0])
+            block.data = encode_points(*zip(*merged))
+        block.points += len(day_points)
+        to_update.append(block)
+
+    PriceSeriesBlock.objects.using(using).bulk_create(to_create, batch_size=batch_size)
+    PriceSeriesBlock.objects.using(using).bulk_update(to_update, ['data', 'points'], batch_size=batch_size)
+    return sum(len(day_points) for day_points in grouped.values())
+
+
+def iter_points(
+        offer_ids: Optional[Iterable[int]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        start: Optional[datetime] = None,
+        using: str = 'default',
+        chunk_size: int = SERIES_CHUNK_SIZE,
+) -> Iterator[Point]:
+    """
+    Stream (offer id, timestamp, price) points block by block, ordered by
+    day and offer, each offer's points in time order.
+
+    Args:
+        offer_ids: Only these offers, all by default
+        date_from, date_to: Inclusive range of local days
+        start: Skip points before this moment
+    """
+    queryset = PriceSeriesBlock.objects.using(using)
+    if offer_ids is not None:
+        queryset = queryset.filter(store_product_id__in=list(offer_ids))
+    if start is not None:
+        date_from = max(date_from or date.min, timezone.localtime(start).date())
+    if date_from:
+        queryset = queryset.filter(day__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(day__lte=date_to)
+
+    blocks = (
+        queryset
+        .order_by('day', 'store_product_id')
+        .values_list('store_product_id', 'day', 'data')
+        .iterator(chunk_size=chunk_size)
+    )
+    for offer_id, day, data in blocks:
+        midnight = _midnight(day)
+        offsets, cents = decode_block(data)
+        for offset, value in zip(offsets.tolist(), cents.tolist()):
+            timestamp = midnight + timedelta(milliseconds=offset)
+            if start is None or timestamp >= start:
+                yield offer_id, timestamp, _from_cents(value)
+
+
+def _midnight(day: date) -> datetime:
+    """
+    Local midnight of `day` in UTC, so offsets from it are elapsed time and
+    stay right on days with a DST change (23 or 25 hours long).
+    """
+    return timezone.make_aware(datetime.combine(day, time.min)).astimezone(dt_timezone.utc)
+
+
+def _from_cents(value: int) -> Decimal:
+    return Decimal(value).scaleb(-2)
@@ -0,0 +1,133 @@
+import re
+from typing import Callable, List, NamedTuple
+
+from django.db import connection, transaction
+from django.db.models import F, QuerySet
+
+
+class HotQuery(NamedTuple):
+    name: str
+    build: Callable[[], QuerySet]
+    # tables that must be reached through an index, never scanned in full
+    tables: List[str]
+
+
+def hot_queries() -> List[HotQuery]:
+    from marketplaces.models import Product, ProductOffer, PriceHistory, ProductMatchBucket, PriceSeriesBlock
+    from marketplaces.search import search_products
+    from notifications.models import PriceNotification
+    from tracking.models import TrackingProducts
+
+    return [
+        HotQuery(
+            "sync: products by external_id",
+            lambda: Product.objects.filter(external_id__in=['1', '2']),
+            [Product._meta.db_table],
+        ),
+        HotQuery(
+            "sync: offers by store and external_id",
+            lambda: ProductOffer.objects.filter(store_name='store', external_id__in=['1', '2']),
+            [ProductOffer._meta.db_table],
+        ),
+        HotQuery(
+            "sync: offer price aggregate per product",
+            lambda: ProductOffer.objects.filter(product_id__in=[1, 2], is_active=True).values('product_id', 'current_price_usd'),
+            [ProductOffer._meta.db_table],
+        ),
+        HotQuery(
+            "sync: active offers of a store",
+            lambda: ProductOffer.objects.filter(store_name='store', is_active=True).values_list('external_id', 'pk'),
+            [ProductOffer._meta.db_table],
+        ),
+        HotQuery(
+            "sync: match candidates by LSH bucket",
+            lambda: ProductMatchBucket.objects.filter(key__in=[1, 2]).values_list('key', 'product_id'),
+            [ProductMatchBucket._meta.db_table],
+        ),
+        HotQuery(
+            "detail: product by external_id",
+            lambda: Product.objects.filter(external_id='1'),
+            [Product._meta.db_table],
+        ),
+        HotQuery(
+            "search: products by text",
+            lambda: search_products('phone')[:20],
+            [Product._meta.db_table],
+        ),
+        HotQuery(
+            "detail: price history of a product",
+            lambda: PriceHistory.objects.filter(store_product__product_id=1).order_by('timestamp'),
+            [PriceHistory._meta.db_table],
+        ),
+        HotQuery(
+            "detail: price series blocks of offers",
+            lambda: PriceSeriesBlock.objects.filter(store_product_id__in=[1, 2]).order_by('day'),
+            [PriceSeriesBlock._meta.db_table],
+        ),
+        HotQuery(
+            "tracking: tracked products of a user",
+            lambda: TrackingProducts.objects.filter(user_id=1, product_id__in=[1, 2]),
+            [TrackingProducts._meta.db_table],
+        ),
+        HotQuery(
+            "tracking: dashboard snapshot of a user by trend",
+            lambda: TrackingProducts.objects.filter(user_id=1).order_by('-trend_rank', 'min_price'),
+            [TrackingProducts._meta.db_table],
+        ),
+        HotQuery(
+            "sync: dashboard snapshots of changed products",
+            lambda: TrackingProducts.objects.filter(product_id__in=[1, 2]),
+            [TrackingProducts._meta.db_table],
+        ),
+        HotQuery(
+            "alerts: pending notifications below current price",
+            lambda: PriceNotification.objects.filter(
+                is_sent=False,
+                product__current_min_price_usd__lte=F('target_price'),
+            ),
+            [PriceNotification._meta.db_table],
+        ),
+    ]
+
+
+def full_scans(plan: str, tables: List[str]) -> List[str]:
+    """
+    Return the tables from `tables` that the plan reads without an index.
+
+    Understands SQLite's EXPLAIN QUERY PLAN and PostgreSQL's EXPLAIN output.
+    """
+    scanned = []
+    for table in tables:
+        if connection.vendor == 'sqlite':
+            pattern = rf"\bSCAN {re.escape(table)}\b(?! USING)"
+        else:
+            pattern = rf"\bSeq Scan on {re.escape(table)}\b"
+        if re.search(pattern, plan):
+            scanned.append(table)
+    return scanned
+
+
+def check_query_plans() -> List[dict]:
+    """
+    EXPLAIN every hot query on the default database.
+
+    On PostgreSQL sequential scans are disabled for the check, so a small
+    development table does not hide a missing index.
+
+    Returns:
+        One {"name", "plan", "full_scans"} dict per hot query
+    """
+    results = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        for query in hot_queries():
+            plan = query.build().explain()
+            results.append({
+                "name": query.name,
+                "plan": plan,
+                "full_scans": full_scans(plan, query.tables),
+            })
+    return results
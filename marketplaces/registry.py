@@ -0,0 +1,48 @@
+import functools
+from typing import Dict, Type
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from marketplaces.services.base import BaseMarketProducts
+
+DEFAULT_CONNECTORS = [
+    'marketplaces.services.fakestoreapi.FakeStoreApiMarketClient',
+    'marketplaces.services.dummyjson.DummyJsonMarketClient',
+]
+
+
+@functools.cache
+def get_connectors() -> Dict[str, Type[BaseMarketProducts]]:
+    """
+    Load marketplace clients listed in settings.MARKETPLACE_CONNECTORS.
+
+    Returns:
+        Mapping of store name to client class, in settings order
+    """
+    connectors = {}
+    for path in getattr(settings, 'MARKETPLACE_CONNECTORS', DEFAULT_CONNECTORS):
+        client_class = import_string(path)
+        if not issubclass(client_class, BaseMarketProducts):
+            raise TypeError(f"{path} is not a BaseMarketProducts subclass")
+        connectors[client_class.get_store_name()] = client_class
+    return connectors
+
+
+def get_connector(store_name: str) -> Type[BaseMarketProducts]:
+    try:
+        return get_connectors()[store_name]
+    except KeyError:
+        raise LookupError(f"Unknown marketplace connector: {store_name}") from None
+
+
+def connector_option(client_class: Type[BaseMarketProducts], name: str):
+    """
+    Read a scheduling option (SYNC_INTERVAL, CONCURRENCY_LIMIT, RATE_LIMIT,
+    PRIORITY) for a client, preferring settings.MARKETPLACE_SCHEDULES overrides.
+    """
+    overrides = getattr(settings, 'MARKETPLACE_SCHEDULES', {})
+    store_overrides = overrides.get(client_class.get_store_name(), {})
+    if name in store_overrides:
+        return store_overrides[name]
+    return getattr(client_class, name)
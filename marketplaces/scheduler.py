@@ -0,0 +1,68 @@
+import json
+import logging
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django_celery_beat.models import IntervalSchedule, PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+SYNC_TASK = 'marketplaces.tasks.sync_market'
+PERIODIC_TASK_PREFIX = 'sync-market:'
+
+
+def sync_periodic_tasks(using: str = DEFAULT_DB_ALIAS) -> dict:
+    """
+    Create or update one django_celery_beat periodic task per registered
+    connector and remove tasks of connectors that are no longer registered,
+    on the `using` database.
+
+    Returns:
+        {"scheduled": [store names], "removed": [periodic task names]}
+    """
+    # the connectors (and httpx) load here rather than with the app, which
+    # imports this module for its post_migrate hook in every process
+    from marketplaces.registry import get_connectors, connector_option
+
+    scheduled = []
+
+    with transaction.atomic(using=using):
+        for store_name, client_class in get_connectors().items():
+            interval, _ = IntervalSchedule.objects.using(using).get_or_create(
+                every=int(connector_option(client_class, 'SYNC_INTERVAL')),
+                period=IntervalSchedule.SECONDS,
+            )
+            PeriodicTask.objects.using(using).update_or_create(
+                name=f"{PERIODIC_TASK_PREFIX}{store_name}",
+                defaults={
+                    'task': SYNC_TASK,
+                    'interval': interval,
+                    'crontab': None,
+                    'args': json.dumps([store_name]),
+                    'priority': connector_option(client_class, 'PRIORITY'),
+                    'enabled': True,
+                    'description': f"Synchronize {store_name} products",
+                },
+            )
+            scheduled.append(store_name)
+
+        stale = PeriodicTask.objects.using(using).filter(name__startswith=PERIODIC_TASK_PREFIX).exclude(
+            name__in=[f"{PERIODIC_TASK_PREFIX}{name}" for name in scheduled]
+        )
+        removed = list(stale.values_list('name', flat=True))
+        stale.delete()
+
+    logger.info(f"Scheduled marketplaces: {scheduled}, removed: {removed}")
+    return {"scheduled": scheduled, "removed": removed}
+
+
+def schedule_after_migrate(sender, using, **kwargs):
+    """
+    post_migrate receiver: create or refresh the periodic sync tasks on the
+    database holding them, once django_celery_beat's tables exist. Migrating
+    any other database (a store shard, say) leaves the schedule alone.
+    """
+    if using != router.db_for_write(PeriodicTask) or not router.allow_migrate_model(using, PeriodicTask):
+        return
+    if PeriodicTask._meta.db_table not in connections[using].introspection.table_names():
+        return
+    sync_periodic_tasks(using)
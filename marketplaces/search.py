@@ -0,0 +1,88 @@
+import re
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, QuerySet
+from django.db.models.expressions import RawSQL
+
+from marketplaces.models import Product
+
+# PostgreSQL text search configuration used for stemming
+SEARCH_CONFIG = getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'english')
+# SQLite keeps the index in this FTS5 table, PostgreSQL in the
+# marketplaces_product.search_vector column (GIN indexed)
+FTS_TABLE = 'marketplaces_product_fts'
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def index_products(product_ids: Iterable[int], using: str = 'default') -> None:
+    """
+    Refresh the search index entries of the given products from their
+    title (highest weight), category and description.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "UPDATE marketplaces_product SET search_vector = "
+                "setweight(to_tsvector(%s::regconfig, coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector(%s::regconfig, coalesce(category, '')), 'B') || "
+                "setweight(to_tsvector(%s::regconfig, coalesce(description, '')), 'C') "
+                "WHERE id = ANY(%s)",
+                [SEARCH_CONFIG, SEARCH_CONFIG, SEARCH_CONFIG, product_ids],
+            )
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, category, description) "
+                f"SELECT id, title, coalesce(category, ''), coalesce(description, '') "
+                f"FROM marketplaces_product WHERE id IN ({placeholders})",
+                product_ids,
+            )
+
+
+def search_products(query: str, using: str = 'default') -> QuerySet:
+    """
+    Products matching every term of `query`, best match first, annotated
+    with `rank` (higher is better).
+
+    The text index is only consulted inside the returned queryset's SQL, so
+    any slice of it is a single query.
+    """
+    terms = _TERM_RE.findall(query)
+    vendor = connections[using].vendor
+    if not terms or vendor not in ('postgresql', 'sqlite'):
+        return Product.objects.using(using).none()
+
+    if vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery(%s::regconfig, %s)"
+        params = (SEARCH_CONFIG, query)
+        matches = RawSQL(f"marketplaces_product.search_vector @@ {tsquery}", params, output_field=BooleanField())
+        rank = RawSQL(f"ts_rank_cd(marketplaces_product.search_vector, {tsquery})", params, output_field=FloatField())
+    else:
+        # quoted terms are matched literally, so user input can't form FTS5 syntax
+        fts_query = ' AND '.join('"{}"'.format(term.replace('"', '')) for term in terms)
+        matches = RawSQL(
+            f"marketplaces_product.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)",
+            (fts_query,), output_field=BooleanField(),
+        )
+        # bm25() is lower for better matches; the weights follow the column order
+        rank = RawSQL(
+            f"(SELECT -bm25({FTS_TABLE}, 10.0, 4.0, 1.0) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = marketplaces_product.id)",
+            (fts_query,), output_field=FloatField(),
+        )
+
+    return (
+        Product.objects.using(using)
+        .filter(matches)
+        .annotate(rank=rank)
+        .order_by('-rank', 'pk')
+    )
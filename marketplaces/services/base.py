@@ -1,8 +1,48 @@
+import json
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator
 
+import httpx
+
+from marketplaces.throttling import CircuitBreaker, TokenBucket
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional speedup
+    ijson = None
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def decode_json(content: bytes):
+    """Decode a JSON body with orjson when installed, the stdlib otherwise."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
 
 
 class BaseMarketProducts(ABC):
+    # Scheduling hints, read through marketplaces.registry.connector_option
+    # so they can be overridden per store via settings.MARKETPLACE_SCHEDULES.
+    SYNC_INTERVAL = 30  # seconds between two scheduled syncs
+    CONCURRENCY_LIMIT = 1  # syncs of this store allowed to run at once
+    RATE_LIMIT = None  # celery-style "N/s", "N/m" or "N/h" cap on sync runs
+    PRIORITY = 5  # passed through to the periodic task message priority
+
+    # Upstream protection applied by get()
+    REQUESTS_PER_SECOND = 2
+    REQUEST_BURST = 5
+    MAX_TOKEN_WAIT = 10  # seconds to wait for a request token before giving up
+    REQUEST_TIMEOUT = 10
+    FAILURE_THRESHOLD = 3
+    RECOVERY_TIMEOUT = 60
+    MAX_RECOVERY_TIMEOUT = 30 * 60
 
     @abstractmethod
     def fetch_products(self):
@@ -10,4 +50,100 @@ class BaseMarketProducts(ABC):
 
     @abstractmethod
     def get_store_name(self):
-        pass
\ No newline at end of file
+        pass
+
+    def iter_products(self) -> Iterator[dict]:
+        """
+        Yield products one by one. Clients able to parse their payload
+        incrementally override this; the default wraps fetch_products().
+        """
+        yield from self.fetch_products()
+
+    def covers(self, external_id: str) -> bool:
+        """
+        Whether a full run of this client lists `external_id` if the store
+        still sells it. Offers a run does not cover are never delisted by it.
+        """
+        return True
+
+    def _breaker(self) -> CircuitBreaker:
+        store_name = self.get_store_name()
+        breaker = CircuitBreaker(
+            store_name,
+            self.FAILURE_THRESHOLD,
+            self.RECOVERY_TIMEOUT,
+            self.MAX_RECOVERY_TIMEOUT,
+        )
+        breaker.raise_if_open()
+        TokenBucket(store_name, self.REQUESTS_PER_SECOND, self.REQUEST_BURST).wait(self.MAX_TOKEN_WAIT)
+        # a probe is claimed only with a token in hand, so RateLimitExceeded never strands it
+        breaker.before_call()
+        return breaker
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        """
+        GET an upstream URL through the store's rate limiter and circuit breaker.
+
+        Raises:
+            CircuitOpenError: If the upstream is currently considered down
+            RateLimitExceeded: If no request token is available in time
+            httpx.HTTPError: If the request fails
+        """
+        with self.stream(url, **kwargs) as response:
+            response.read()
+        return response
+
+    @contextmanager
+    def stream(self, url: str, **kwargs) -> Iterator[httpx.Response]:
+        """
+        Same as get(), but yields the response before its body is read so it
+        can be consumed with iter_bytes().
+        """
+        breaker = self._breaker()
+
+        kwargs.setdefault('timeout', self.REQUEST_TIMEOUT)
+        try:
+            with httpx.stream('GET', url, **kwargs) as response:
+                response.raise_for_status()
+                yield response
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in RETRYABLE_STATUS_CODES:
+                breaker.record_failure(_retry_after(e.response))
+            else:
+                breaker.release_probe()
+            raise
+        except httpx.TransportError:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # the caller failed or stopped reading: nothing learned about the upstream
+            breaker.release_probe()
+            raise
+
+        breaker.record_success()
+
+    def stream_json_items(self, url: str, prefix: str, **kwargs) -> Iterator:
+        """
+        Yield the items found under `prefix` (ijson syntax, e.g. "products.item")
+        while the response body is still downloading.
+
+        Requires the optional ijson package; check `ijson is not None` first.
+        """
+        with self.stream(url, **kwargs) as response:
+            items = ijson.sendable_list()
+            parser = ijson.items_coro(items, prefix)
+            for chunk in response.iter_bytes():
+                parser.send(chunk)
+                yield from items
+                del items[:]
+            parser.close()
+            yield from items
+
+
+def _retry_after(response: httpx.Response):
+    if response.status_code != 429:
+        return None
+    try:
+        return float(response.headers.get('Retry-After', 0)) or None
+    except ValueError:
+        return None
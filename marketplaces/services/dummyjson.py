@@ -1,25 +1,30 @@
-from marketplaces.services.base import BaseMarketProducts
-
-import httpx
+from marketplaces.services import base
+from marketplaces.services.base import BaseMarketProducts, decode_json
 
 
 class DummyJsonMarketClient(BaseMarketProducts):
     BASE_URL = "https://dummyjson.com/products"
     STORE_NAME = "DummyJSON"
+    # full catalog is fetched in one request, so sync it less often
+    SYNC_INTERVAL = 300
+    RATE_LIMIT = "20/h"
 
     def fetch_products(self):
         """Fetch all products from DummyJSON API."""
-        total = self.total_products_count()
-        params = {"limit": total} if total else {}
-        response = httpx.get(self.BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        # limit=0 returns the whole catalog; without a limit only the first
+        # page would come back and sync_all would delist everything else
+        response = self.get(self.BASE_URL, params={"limit": 0})
+        data = decode_json(response.content)
         return data["products"]
 
+    def iter_products(self):
+        """Stream products off the response body when ijson is installed."""
+        if base.ijson is None:
+            yield from self.fetch_products()
+            return
 
-    def total_products_count(self) -> int | None:
-        response = httpx.get(self.BASE_URL)
-        return response.json().get("total", None)
+        # limit=0 returns the whole catalog in one response
+        yield from self.stream_json_items(self.BASE_URL, "products.item", params={"limit": 0})
 
     @classmethod
     def get_store_name(cls):
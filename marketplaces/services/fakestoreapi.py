@@ -1,16 +1,14 @@
-import httpx
-
-from marketplaces.services.base import BaseMarketProducts
+from marketplaces.services.base import BaseMarketProducts, decode_json
 
 
 class FakeStoreApiMarketClient(BaseMarketProducts):
     url = "https://fakestoreapi.com/products"
     store_name = "FakeStoreAPI"
     def fetch_products(self):
-        all_products = httpx.get(self.url)
-        json = all_products.json()
+        all_products = self.get(self.url)
+        json = decode_json(all_products.content)
         return json
 
     @classmethod
     def get_store_name(cls):
-        return cls.store_name
\ No newline at end of file
+        return cls.store_name
@@ -0,0 +1,76 @@
+import mmap
+import zlib
+from typing import Iterator, Optional, Tuple
+
+from marketplaces.services import base
+from marketplaces.services.base import BaseMarketProducts, decode_json
+
+
+def partition_of(external_id, partitions: int) -> int:
+    """Stable (process independent) partition of an external id."""
+    return zlib.crc32(str(external_id).encode()) % partitions
+
+
+class SnapshotMarketClient(BaseMarketProducts):
+    """
+    Replays a catalog snapshot file instead of calling a marketplace API.
+
+    Accepts NDJSON (one product per line), a JSON array of products or a
+    JSON object with a "products" array (streamed with ijson if installed). The file is memory-mapped, so pages
+    are read lazily and shared between processes importing the same file.
+    """
+
+    NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+
+    def __init__(
+            self,
+            path: str,
+            store_name: str,
+            partition: Optional[Tuple[int, int]] = None,
+            format: Optional[str] = None,
+    ):
+        """
+        Args:
+            path: Snapshot file
+            store_name: Store the products are synchronized as
+            partition: (index, count) to only yield products whose external
+                id hashes to `index` out of `count` partitions
+            format: "json" or "ndjson", guessed from the file suffix if omitted
+        """
+        self.path = path
+        self.store_name = store_name
+        self.partition = partition
+        self.format = format or ('ndjson' if path.endswith(self.NDJSON_SUFFIXES) else 'json')
+
+    def get_store_name(self):
+        return self.store_name
+
+    def fetch_products(self):
+        return list(self.iter_products())
+
+    def iter_products(self) -> Iterator[dict]:
+        with open(self.path, 'rb') as file:
+            if file.seek(0, 2) == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for item in self._parse(data):
+                    if self.covers(item.get('id')):
+                        yield item
+
+    def covers(self, external_id: str) -> bool:
+        return self.partition is None or partition_of(external_id, self.partition[1]) == self.partition[0]
+
+    def _parse(self, data: mmap.mmap) -> Iterator[dict]:
+        if self.format == 'ndjson':
+            for line in iter(data.readline, b''):
+                if line.strip():
+                    yield decode_json(line)
+            return
+
+        is_array = data[:1024].lstrip()[:1] == b'['
+        if base.ijson is not None:
+            yield from base.ijson.items(data, 'item' if is_array else 'products.item')
+            return
+
+        document = decode_json(data[:])
+        yield from document if is_array else document['products']
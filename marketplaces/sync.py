@@ -1,11 +1,25 @@
 import logging
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
 from decimal import Decimal
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
 
-from django.db import transaction, IntegrityError
+from django.db import DEFAULT_DB_ALIAS, transaction, DataError, IntegrityError
+from django.db.models import Count, Max, Min
 from django.conf import settings
-from marketplaces.models import Product, ProductOffer, PriceHistory
+from django.utils import timezone
+from marketplaces.events import publish_price_changes
+from marketplaces.matching import ProductMatcher, bucket_rows, signature
+from marketplaces.price_series import append_points, use_blocks
+from marketplaces.search import index_products
+from marketplaces.models import (
+    Product, ProductOffer, PriceHistory, SyncCheckpoint, QuarantinedProduct, ProductMatchBucket
+)
 from marketplaces.services.base import BaseMarketProducts
+from test_scrape_proj.db_router import shard_for_store, store_databases
+from tracking.dashboard import refresh_snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -16,19 +30,92 @@ class SyncResult:
     def __init__(self):
         self.products_created = 0
         self.offers_created = 0
+        self.offers_matched = 0
         self.offers_updated = 0
+        self.offers_delisted = 0
         self.price_history_created = 0
+        self.quarantined = 0
+        self.batches_skipped = 0
         self.errors = []
 
     def __repr__(self):
         return (
             f"SyncResult(products={self.products_created}, "
             f"offers_created={self.offers_created}, "
+            f"offers_matched={self.offers_matched}, "
             f"offers_updated={self.offers_updated}, "
+            f"offers_delisted={self.offers_delisted}, "
             f"price_history={self.price_history_created}, "
+            f"quarantined={self.quarantined}, "
+            f"batches_skipped={self.batches_skipped}, "
             f"errors={len(self.errors)})"
         )
 
+    def merge(self, other: 'SyncResult') -> None:
+        """Add the statistics of another (batch or partition) result."""
+        self.products_created += other.products_created
+        self.offers_created += other.offers_created
+        self.offers_matched += other.offers_matched
+        self.offers_updated += other.offers_updated
+        self.offers_delisted += other.offers_delisted
+        self.price_history_created += other.price_history_created
+        self.quarantined += other.quarantined
+        self.batches_skipped += other.batches_skipped
+        self.errors.extend(other.errors)
+
+
+def refresh_product_prices(product_ids: Iterable[int], batch_size: int = 1000) -> int:
+    """
+    Recompute the denormalized price columns of the given products
+    from their active offers with one aggregate query per store database
+    and one bulk update, then the dashboard snapshots of the users
+    tracking them.
+
+    Returns:
+        Number of products updated
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return 0
+
+    stats = {}
+    # a product's offers may be spread over the shards of several stores
+    for alias in store_databases():
+        for row in (
+            ProductOffer.objects.using(alias)
+            .filter(product_id__in=product_ids, is_active=True)
+            .values('product_id')
+            .annotate(
+                min_price=Min('current_price_usd'),
+                max_price=Max('current_price_usd'),
+                count=Count('id'),
+            )
+        ):
+            merged = stats.setdefault(row['product_id'], row)
+            if merged is not row:
+                merged['min_price'] = min(merged['min_price'], row['min_price'])
+                merged['max_price'] = max(merged['max_price'], row['max_price'])
+                merged['count'] += row['count']
+
+    now = timezone.now()
+    products = [
+        Product(
+            pk=product_id,
+            current_min_price_usd=stats.get(product_id, {}).get('min_price'),
+            current_max_price_usd=stats.get(product_id, {}).get('max_price'),
+            offer_count=stats.get(product_id, {}).get('count', 0),
+            price_updated_at=now,
+        )
+        for product_id in product_ids
+    ]
+    Product.objects.bulk_update(
+        products,
+        ['current_min_price_usd', 'current_max_price_usd', 'offer_count', 'price_updated_at'],
+        batch_size=batch_size,
+    )
+    refresh_snapshots(product_ids, batch_size=batch_size)
+    return len(products)
+
 
 class ServicesSynchronizer:
     """
@@ -36,23 +123,58 @@ class ServicesSynchronizer:
 
     Features:
     - Bulk operations for performance
+    - Chunked processing of streamed product payloads
+    - Cross-store matching of new offers to existing products
+    - Full-text search index of new products
     - Price change tracking
-    - Transaction safety
+    - Tombstoning of offers that disappear upstream
+    - Denormalized current min/max prices on Product
+    - Per-batch transactions with a resumable checkpoint
+    - Quarantine of rows that fail validation or cannot be written
     - Comprehensive logging
     """
 
     BULK_CREATE_BATCH_SIZE = getattr(settings, 'SYNC_BULK_BATCH_SIZE', 1000)
+    CHUNK_SIZE = getattr(settings, 'SYNC_CHUNK_SIZE', 1000)
     PRICE_COMPARISON_PRECISION = Decimal('0.01')
-
-    def __init__(self, market_client: BaseMarketProducts):
+    # unfinished runs older than this start over instead of resuming
+    RESUME_MAX_AGE = getattr(settings, 'SYNC_RESUME_MAX_AGE', timedelta(hours=1))
+    # errors caused by a row's data, which quarantine the row instead of
+    # failing the run; other database errors (lost connection, lock timeout)
+    # fail it before the checkpoint moves, so a retry resumes at that batch
+    ROW_ERRORS = (DataError, IntegrityError, ValueError, TypeError, ArithmeticError)
+    # link new offers to similar products of other stores, see marketplaces.matching
+    MATCH_PRODUCTS = getattr(settings, 'SYNC_MATCH_PRODUCTS', True)
+
+    def __init__(
+            self,
+            market_client: BaseMarketProducts,
+            publish_events: bool = True,
+            checkpoint_key: Optional[str] = None,
+            resume: bool = True,
+            delist_missing: bool = True,
+    ):
         """
         Initialize synchronizer with a market client.
 
         Args:
             market_client: Implementation of BaseMarketProducts interface
+            publish_events: Publish price changes for live subscribers
+            checkpoint_key: Key of the resumable checkpoint, the store name by
+                default; runs over part of a store need their own key
+            resume: Continue the latest unfinished run of checkpoint_key
+            delist_missing: Delist active offers of the store missing from
+                the listing; only for listings of the whole catalog
         """
         self.market_client = market_client
         self.store_name = market_client.get_store_name()
+        # offers and price history go to the store's shard, the rest to the primary
+        self.db = shard_for_store(self.store_name)
+        self.publish_events = publish_events
+        self.checkpoint_key = checkpoint_key or self.store_name
+        self.resume = resume
+        self.delist_missing = delist_missing
+        self.run_id = None
 
     def sync_all(self) -> SyncResult:
         """
@@ -66,16 +188,38 @@ class ServicesSynchronizer:
             IntegrityError: If database constraints are violated
         """
         result = SyncResult()
+        checkpoint = self._start_checkpoint()
+        self.run_id = checkpoint.run_id
 
         try:
-            logger.info(f"Starting synchronization for store: {self.store_name}")
-            products_data = self.market_client.fetch_products()
+            logger.info(f"Starting synchronization for store: {self.store_name}, run {self.run_id}")
+            fetched = 0
+            seen_ids = set()
+
+            chunks = self._chunked(self.market_client.iter_products(), self.CHUNK_SIZE)
+            for batch_number, chunk in enumerate(chunks):
+                fetched += len(chunk)
+                seen_ids.update(
+                    str(item['id']) for item in chunk
+                    if isinstance(item, dict) and 'id' in item
+                )
+                if batch_number <= checkpoint.last_batch:
+                    # committed by an earlier attempt of this run
+                    result.batches_skipped += 1
+                    continue
+                self._process_batch(batch_number, chunk, checkpoint, result)
+
+            # an empty listing is far more likely an upstream outage than a wiped catalog
+            if seen_ids and self.delist_missing:
+                self._delist_missing(seen_ids, result)
+
+            checkpoint.status = SyncCheckpoint.STATUS_COMPLETED
+            checkpoint.save(update_fields=['status', 'updated_at'])
 
-            if not products_data:
+            if not fetched:
                 logger.warning(f"No products fetched from {self.store_name}")
                 return result
 
-            self._bulk_process_items(products_data, result)
             logger.info(f"Synchronization completed: {result}")
 
         except Exception as e:
@@ -84,10 +228,230 @@ class ServicesSynchronizer:
                 exc_info=True
             )
             result.errors.append(str(e))
+            checkpoint.status = SyncCheckpoint.STATUS_FAILED
+            checkpoint.save(update_fields=['status', 'updated_at'])
             raise
 
         return result
 
+    def _start_checkpoint(self) -> SyncCheckpoint:
+        """Resume the latest recent unfinished run, or start a new one."""
+        unfinished = SyncCheckpoint.objects.filter(
+            key=self.checkpoint_key,
+            status__in=[SyncCheckpoint.STATUS_RUNNING, SyncCheckpoint.STATUS_FAILED],
+        )
+        checkpoint = None
+        if self.resume:
+            checkpoint = (
+                unfinished
+                .filter(started_at__gte=timezone.now() - self.RESUME_MAX_AGE)
+                .order_by('-started_at')
+                .first()
+            )
+
+        if checkpoint:
+            logger.info(
+                f"Resuming run {checkpoint.run_id} of {self.checkpoint_key} "
+                f"after batch {checkpoint.last_batch}"
+            )
+            checkpoint.status = SyncCheckpoint.STATUS_RUNNING
+            checkpoint.save(update_fields=['status', 'updated_at'])
+        else:
+            checkpoint = SyncCheckpoint.objects.create(
+                key=self.checkpoint_key,
+                store_name=self.store_name,
+                run_id=uuid.uuid4(),
+            )
+
+        # anything else unfinished for this key is abandoned for good
+        unfinished.exclude(pk=checkpoint.pk).update(status=SyncCheckpoint.STATUS_FAILED)
+        return checkpoint
+
+    def _process_batch(
+            self,
+            batch_number: int,
+            chunk: List[dict],
+            checkpoint: SyncCheckpoint,
+            result: SyncResult
+    ) -> None:
+        """
+        Write one batch in a single transaction on each database involved and
+        advance the checkpoint once all of them committed. The primary
+        commits first, so a failed shard commit leaves products that the
+        retried batch reuses and the checkpoint before the batch.
+
+        If the batch fails as a whole it is retried row by row, each row in
+        its own savepoint, and the rows that still fail are quarantined.
+        """
+        batch_result = SyncResult()
+        try:
+            with self._atomic():
+                self._bulk_process_items(chunk, batch_result)
+                self._save_progress(checkpoint, batch_number)
+        except self.ROW_ERRORS as e:
+            logger.warning(
+                f"Batch {batch_number} of {self.store_name} failed, retrying row by row: {e}"
+            )
+            batch_result = SyncResult()
+            with self._atomic():
+                for item in chunk:
+                    try:
+                        with self._atomic():
+                            self._bulk_process_items([item], batch_result)
+                    except self.ROW_ERRORS as row_error:
+                        self._quarantine([(item, f"Database error: {row_error}")], batch_result)
+                self._save_progress(checkpoint, batch_number)
+
+        result.merge(batch_result)
+
+    @contextmanager
+    def _atomic(self):
+        """A transaction (or savepoint) on the store's shard and, nested, on the primary."""
+        if self.db == DEFAULT_DB_ALIAS:
+            with transaction.atomic():
+                yield
+            return
+        with transaction.atomic(using=self.db), transaction.atomic():
+            yield
+
+    def _delist_missing(self, seen_ids: set, result: SyncResult) -> None:
+        """
+        Mark active offers of the store that were not in this run's listing
+        as inactive, and refresh the prices of their products.
+
+        Args:
+            seen_ids: External ids of every product fetched in this run
+            result: SyncResult object to update with statistics
+        """
+        missing = [
+            pk
+            for external_id, pk in (
+                ProductOffer.objects.using(self.db)
+                .filter(store_name=self.store_name, is_active=True)
+                .values_list('external_id', 'pk')
+                .iterator(chunk_size=self.BULK_CREATE_BATCH_SIZE)
+            )
+            if external_id not in seen_ids and self.market_client.covers(external_id)
+        ]
+
+        now = timezone.now()
+        for start in range(0, len(missing), self.BULK_CREATE_BATCH_SIZE):
+            batch = missing[start:start + self.BULK_CREATE_BATCH_SIZE]
+            with self._atomic():
+                offers = ProductOffer.objects.using(self.db).filter(pk__in=batch, is_active=True)
+                product_ids = set(offers.values_list('product_id', flat=True))
+                result.offers_delisted += offers.update(is_active=False, delisted_at=now)
+                refresh_product_prices(product_ids, self.BULK_CREATE_BATCH_SIZE)
+
+        if missing:
+            logger.info(f"Delisted {len(missing)} offers of {self.store_name}")
+
+    def _save_progress(self, checkpoint: SyncCheckpoint, batch_number: int) -> None:
+        """
+        Move the checkpoint past a batch: within the batch's transaction when
+        the store lives on the primary, otherwise once the shard committed.
+        """
+        def save():
+            checkpoint.last_batch = batch_number
+            checkpoint.save(update_fields=['last_batch', 'updated_at'])
+
+        if self.db == DEFAULT_DB_ALIAS:
+            save()
+        else:
+            transaction.on_commit(save, using=self.db)
+
+    def _quarantine(self, rows: List[tuple], result: SyncResult) -> None:
+        """Store (item, error) pairs for later inspection."""
+        QuarantinedProduct.objects.bulk_create([
+            QuarantinedProduct(
+                store_name=self.store_name,
+                run_id=self.run_id,
+                external_id=str(item.get('id', '')) if isinstance(item, dict) else '',
+                payload=item,
+                error=error,
+            )
+            for item, error in rows
+        ])
+        result.quarantined += len(rows)
+
+    def _resolve_products(self, items: List[dict], result: SyncResult) -> Dict[str, int]:
+        """
+        Find or create the product each new offer belongs to.
+
+        With matching enabled an offer joins the most similar product of
+        another store, and unmatched items get a new product whose
+        external_id is prefixed with the store when the plain id is taken.
+        Without it, products are shared by external_id alone.
+
+        Returns:
+            external id -> product id
+        """
+        if not items:
+            return {}
+
+        external_ids = [str(item["id"]) for item in items]
+        if self.MATCH_PRODUCTS:
+            products_map = ProductMatcher(self.store_name).match(items)
+            result.offers_matched += len(products_map)
+            taken_ids = set(
+                Product.objects.filter(external_id__in=external_ids)
+                .values_list("external_id", flat=True)
+            )
+        else:
+            products_map = dict(
+                Product.objects.filter(external_id__in=external_ids)
+                .values_list("external_id", "pk")
+            )
+            taken_ids = set()
+
+        new_products = {}
+        signatures = {}
+        for item in items:
+            ext_id = str(item["id"])
+            if ext_id in products_map:
+                continue
+            signatures[ext_id] = signature(str(item["title"]))
+            new_products[ext_id] = Product(
+                external_id=f"{self.store_name}:{ext_id}" if ext_id in taken_ids else ext_id,
+                title=item["title"],
+                category=item.get("category", ""),
+                description=item.get("description", ""),
+                minhash=None if signatures[ext_id] is None else signatures[ext_id].tobytes(),
+            )
+
+        if new_products:
+            try:
+                created = Product.objects.bulk_create(
+                    new_products.values(),
+                    batch_size=self.BULK_CREATE_BATCH_SIZE
+                )
+                result.products_created += len(created)
+                logger.info(f"Created {len(created)} new products")
+            except IntegrityError as e:
+                logger.error(f"Failed to create products: {e}")
+                result.errors.append(f"Product creation error: {e}")
+                raise
+
+            index_products(product.pk for product in created)
+            ProductMatchBucket.objects.bulk_create(
+                [
+                    bucket
+                    for ext_id, product in new_products.items()
+                    for bucket in bucket_rows(product.pk, signatures[ext_id])
+                ],
+                batch_size=self.BULK_CREATE_BATCH_SIZE
+            )
+            products_map.update({ext_id: product.pk for ext_id, product in new_products.items()})
+
+        return products_map
+
+    @staticmethod
+    def _chunked(items: Iterable[dict], size: int) -> Iterator[List[dict]]:
+        """Group a stream of products into lists of at most `size` items."""
+        iterator = iter(items)
+        while chunk := list(islice(iterator, size)):
+            yield chunk
+
     def _validate_product_data(self, item: dict) -> Optional[str]:
         """
         Validate required fields in product data.
@@ -118,69 +482,47 @@ class ServicesSynchronizer:
     ) -> None:
         """
         Process products in bulk: create/update products and offers.
+        Called once per chunk, so statistics are accumulated into `result`.
 
         Args:
             products_list: List of product dictionaries from API
             result: SyncResult object to update with statistics
         """
         validated_products = []
+        invalid_products = []
 
         for item in products_list:
             error = self._validate_product_data(item)
             if error:
                 logger.warning(f"Skipping invalid product: {error}")
                 result.errors.append(error)
+                invalid_products.append((item, error))
                 continue
             validated_products.append(item)
 
+        if invalid_products:
+            self._quarantine(invalid_products, result)
+
         if not validated_products:
             logger.warning("No valid products to process")
             return
 
         external_ids = [str(item["id"]) for item in validated_products]
 
-        existing_product_ids = set(
-            Product.objects.filter(external_id__in=external_ids)
-            .values_list("external_id", flat=True)
-        )
-
-        new_products = [
-            Product(
-                external_id=str(item["id"]),
-                title=item["title"],
-                category=item.get("category", ""),
-                description=item.get("description", ""),
-            )
-            for item in validated_products
-            if str(item["id"]) not in existing_product_ids
-        ]
-
-        if new_products:
-            try:
-                created = Product.objects.bulk_create(
-                    new_products,
-                    batch_size=self.BULK_CREATE_BATCH_SIZE
-                )
-                result.products_created = len(created)
-                logger.info(f"Created {result.products_created} new products")
-            except IntegrityError as e:
-                logger.error(f"Failed to create products: {e}")
-                result.errors.append(f"Product creation error: {e}")
-                raise
-
-        existing_offers_qs = (
-            ProductOffer.objects
-            .filter(product__external_id__in=external_ids, store_name=self.store_name)
-            .select_related('product')
+        # served by the unique (store_name, external_id) index, no join needed
+        existing_offers_qs = ProductOffer.objects.using(self.db).filter(
+            store_name=self.store_name, external_id__in=external_ids
         )
 
         existing_offers: Dict[str, ProductOffer] = {
-            offer.product.external_id: offer
+            offer.external_id: offer
             for offer in existing_offers_qs
         }
 
-        products = Product.objects.filter(external_id__in=external_ids)
-        products_map = {product.external_id: product for product in products}
+        products_map = self._resolve_products(
+            [item for item in validated_products if str(item["id"]) not in existing_offers],
+            result
+        )
 
         to_create = []
         to_update = []
@@ -191,10 +533,10 @@ class ServicesSynchronizer:
             new_price = Decimal(str(item["price"]))
 
             if ext_id not in existing_offers:
-                product = products_map.get(ext_id)
-                if product:
+                product_id = products_map.get(ext_id)
+                if product_id:
                     new_offer = ProductOffer(
-                            product=product,
+                            product_id=product_id,
                             external_id=ext_id,
                             current_price_usd=new_price,
                             store_name=self.store_name
@@ -213,6 +555,11 @@ class ServicesSynchronizer:
             else:
                 offer = existing_offers[ext_id]
                 price_diff = abs(offer.current_price_usd - new_price)
+                relisted = not offer.is_active
+
+                if relisted:
+                    offer.is_active = True
+                    offer.delisted_at = None
 
                 if price_diff >= self.PRICE_COMPARISON_PRECISION:
                     offer.current_price_usd = new_price
@@ -224,36 +571,52 @@ class ServicesSynchronizer:
                             price_usd=new_price
                         )
                     )
+                elif relisted:
+                    to_update.append(offer)
 
         try:
-            with transaction.atomic():
+            with self._atomic():
                 if to_create:
-                    created_offers = ProductOffer.objects.bulk_create(
+                    created_offers = ProductOffer.objects.using(self.db).bulk_create(
                         to_create,
                         batch_size=self.BULK_CREATE_BATCH_SIZE
                     )
-                    result.offers_created = len(created_offers)
-                    logger.info(f"Created {result.offers_created} new offers")
+                    result.offers_created += len(created_offers)
+                    logger.info(f"Created {len(created_offers)} new offers")
 
                 if to_update:
-                    ProductOffer.objects.bulk_update(
+                    ProductOffer.objects.using(self.db).bulk_update(
                         to_update,
-                        ['current_price_usd'],
+                        ['current_price_usd', 'is_active', 'delisted_at'],
                         batch_size=self.BULK_CREATE_BATCH_SIZE
                     )
-                    result.offers_updated = len(to_update)
-                    logger.info(f"Updated {result.offers_updated} offers")
-
-                if price_history:
-                    PriceHistory.objects.bulk_create(
+                    result.offers_updated += len(to_update)
+                    logger.info(f"Updated {len(to_update)} offers")
+
+                if price_history and use_blocks():
+                    now = timezone.now()
+                    append_points(
+                        ((entry.store_product.pk, now, entry.price_usd) for entry in price_history),
+                        self.BULK_CREATE_BATCH_SIZE,
+                        using=self.db,
+                    )
+                    result.price_history_created += len(price_history)
+                    logger.info(
+                        f"Appended {len(price_history)} price points to series blocks"
+                    )
+                elif price_history:
+                    PriceHistory.objects.using(self.db).bulk_create(
                         price_history,
                         batch_size=self.BULK_CREATE_BATCH_SIZE
                     )
-                    result.price_history_created = len(price_history)
+                    result.price_history_created += len(price_history)
                     logger.info(
-                        f"Created {result.price_history_created} price history records"
+                        f"Created {len(price_history)} price history records"
                     )
 
+                changed_products = {offer.product_id for offer in to_create + to_update}
+                refresh_product_prices(changed_products, self.BULK_CREATE_BATCH_SIZE)
+
         except IntegrityError as e:
             logger.error(f"Database integrity error during sync: {e}")
             result.errors.append(f"Database error: {e}")
@@ -262,3 +625,16 @@ class ServicesSynchronizer:
             logger.error(f"Unexpected error during sync: {e}", exc_info=True)
             result.errors.append(f"Unexpected error: {e}")
             raise
+
+        if self.publish_events:
+            changed_prices = [
+                {
+                    "product_id": offer.product_id,
+                    "external_id": offer.external_id,
+                    "price": str(offer.current_price_usd),
+                }
+                for offer in to_create + to_update
+            ]
+            # subscribers may read the new prices back, so wait for the commit
+            # of the shard, which commits last
+            transaction.on_commit(lambda: publish_price_changes(self.store_name, changed_prices), using=self.db)
@@ -1,30 +1,68 @@
+import httpx
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from django.db import DatabaseError
 
-from marketplaces.services.dummyjson import DummyJsonMarketClient
-from marketplaces.services.fakestoreapi import FakeStoreApiMarketClient
-from marketplaces.sync import ServicesSynchronizer
+from marketplaces.registry import get_connectors, get_connector, connector_option
+from marketplaces.throttling import SyncSlot, allow_sync_run, CircuitOpenError, RateLimitExceeded
 
 logger = get_task_logger(__name__)
 
-MARKET_CLIENTS = [
-    FakeStoreApiMarketClient,
-    DummyJsonMarketClient
-]
+# Sync and analytics modules (and numpy) are imported inside the tasks that
+# need them, so workers of the other queues boot without them.
+
+
+# a retried run resumes from the checkpoint of the failed attempt
+@shared_task(bind=True, autoretry_for=(httpx.HTTPError, DatabaseError), retry_backoff=True, max_retries=3)
+def sync_market(self, store_name):
+    client_class = get_connector(store_name)
+
+    with SyncSlot(store_name, connector_option(client_class, 'CONCURRENCY_LIMIT')) as acquired:
+        if not acquired:
+            logger.info(f"Concurrency limit reached, skipping sync for marketplace: {store_name}")
+            return "skipped"
+
+        # only runs that got a slot count against the rate limit, and a retry
+        # continues the run it retries
+        if not self.request.retries and not allow_sync_run(
+                store_name, connector_option(client_class, 'RATE_LIMIT')
+        ):
+            logger.info(f"Rate limit reached, skipping sync for marketplace: {store_name}")
+            return "skipped"
+
+        from marketplaces.sync import ServicesSynchronizer
+
+        logger.info(f"Syncing marketplace: {store_name}")
+        sync = ServicesSynchronizer(client_class())
+        try:
+            result = sync.sync_all()
+        except (CircuitOpenError, RateLimitExceeded) as e:
+            logger.warning(f"Upstream unavailable, skipping sync for marketplace: {store_name}: {e}")
+            return "skipped"
+        logger.info(f"Synchronization completed for marketplace: {store_name}")
+        return repr(result)
 
 
 @shared_task
 def periodic_sync_markets():
+    """Queue a sync of every registered marketplace right away."""
     result = {"success": [], "failed": []}
-    for client_class in MARKET_CLIENTS:
-        client_name = client_class.__name__
+    for store_name, client_class in get_connectors().items():
         try:
-            logger.info(f"Syncing marketplace: {client_name}")
-            client = client_class()
-            sync = ServicesSynchronizer(client)
-            sync.sync_all()
-            result["success"].append(client_name)
-            logger.info(f"Synchronization completed for marketplace: {client_name}")
+            sync_market.apply_async(
+                args=[store_name],
+                priority=connector_option(client_class, 'PRIORITY'),
+            )
+            result["success"].append(store_name)
         except Exception as e:
-            logger.error(f"Synchronization failed for marketplace: {client_name}: {e}", exc_info=True)
-            result["failed"].append(client_name)
+            logger.error(f"Failed to queue sync for marketplace: {store_name}: {e}", exc_info=True)
+            result["failed"].append(store_name)
+    return result
+
+
+@shared_task
+def periodic_price_analytics():
+    """Refresh trends and anomaly flags of tracked products for the list views."""
+    from marketplaces.analytics import compute_price_analytics
+
+    return compute_price_analytics()
@@ -0,0 +1,833 @@
+import csv
+import importlib
+import json
+import os
+import statistics
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+import httpx
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django_celery_beat.models import IntervalSchedule, PeriodicTask
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pq = None
+
+from marketplaces.analytics import compute_metrics, compute_price_analytics, load_daily_prices
+from marketplaces.export import iter_ndjson, price_history_rows
+from marketplaces.matching import ProductMatcher, index_products, signature, similarity
+from marketplaces.models import (
+    PriceHistory, Product, ProductAnalytics, ProductMatchBucket, ProductOffer, PriceSeriesBlock, QuarantinedProduct,
+    SyncCheckpoint,
+)
+from marketplaces.price_series import append_points, iter_points
+from marketplaces.search import index_products as index_search, search_products
+from marketplaces.scheduler import schedule_after_migrate, sync_periodic_tasks
+from marketplaces.services import base
+from marketplaces.services.base import BaseMarketProducts
+from marketplaces.services.dummyjson import DummyJsonMarketClient
+from marketplaces.sync import ServicesSynchronizer
+from marketplaces.throttling import (
+    CircuitBreaker, CircuitOpenError, RateLimitExceeded, SyncSlot, TokenBucket, allow_sync_run,
+)
+from products.serializers import product_detail_data
+from tracking.models import TrackingProducts
+
+# Two store databases for the sharding tests. Test modules are loaded before
+# the test databases are created, so these get theirs like any other alias.
+SHARDS = {'ShardStoreA': 'shard1', 'ShardStoreB': 'shard2'}
+for _alias in sorted(set(SHARDS.values())):
+    settings.DATABASES.setdefault(_alias, {
+        **settings.DATABASES['default'],
+        'NAME': f"{settings.DATABASES['default']['NAME']}_{_alias}",
+        'TEST': {**settings.DATABASES['default']['TEST']},
+    })
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def local(*args) -> datetime:
+    return timezone.make_aware(datetime(*args))
+
+
+class ListMarketClient(BaseMarketProducts):
+    """Serves a fixed product listing."""
+
+    def __init__(self, items, store_name='StoreA'):
+        self.items = items
+        self.store_name = store_name
+
+    def fetch_products(self):
+        return self.items
+
+    def get_store_name(self):
+        return self.store_name
+
+
+def listing(*titles):
+    return [{'id': i, 'title': title, 'price': 10 + i} for i, title in enumerate(titles, 1)]
+
+
+class PriceSeriesTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(external_id='1', title='Headphones')
+        self.offer = ProductOffer.objects.create(
+            product=product, store_name='StoreA', external_id='1', current_price_usd=Decimal('10.00')
+        )
+
+    def round_trip(self, points):
+        append_points((self.offer.pk, timestamp, price) for timestamp, price in points)
+        return [(timestamp, price) for _, timestamp, price in iter_points(offer_ids=[self.offer.pk])]
+
+    def test_round_trip(self):
+        points = [
+            (utc(2026, 6, 1, 8, 0, 0, 123000), Decimal('10.00')),
+            (utc(2026, 6, 1, 9, 30), Decimal('9.99')),
+            (utc(2026, 6, 2, 12, 0), Decimal('12.50')),
+        ]
+        self.assertEqual(self.round_trip(points), points)
+        self.assertEqual(PriceSeriesBlock.objects.count(), 2)
+
+    def test_round_trip_on_dst_days(self):
+        # Europe/Kiev: 2026-03-29 is 23 hours long, 2026-10-25 is 25 hours long
+        points = [
+            (utc(2026, 3, 28, 23, 0), Decimal('10.00')),
+            (utc(2026, 3, 29, 12, 0), Decimal('11.00')),
+            (utc(2026, 10, 25, 10, 0), Decimal('12.00')),
+            (utc(2026, 10, 25, 21, 59), Decimal('13.00')),
+        ]
+        self.assertEqual(self.round_trip(points), points)
+
+    def test_local_timestamps(self):
+        timestamp = timezone.localtime(utc(2026, 10, 25, 10, 0))
+        self.assertEqual(self.round_trip([(timestamp, Decimal('1.00'))]), [(timestamp, Decimal('1.00'))])
+
+    def test_out_of_order_points_are_merged(self):
+        append_points([(self.offer.pk, utc(2026, 6, 1, 12, 0), Decimal('2.00'))])
+        append_points([(self.offer.pk, utc(2026, 6, 1, 8, 0), Decimal('1.00'))])
+        self.assertEqual(
+            [price for _, _, price in iter_points(offer_ids=[self.offer.pk])],
+            [Decimal('1.00'), Decimal('2.00')],
+        )
+        self.assertEqual(PriceSeriesBlock.objects.get().points, 2)
+
+
+class SyncCheckpointTests(TestCase):
+    ITEMS = listing(
+        'Wireless noise cancelling headphones', 'Stainless steel water bottle',
+        'Mechanical gaming keyboard', 'Ergonomic office chair',
+    )
+
+    def synchronizer(self, items=ITEMS):
+        synchronizer = ServicesSynchronizer(ListMarketClient(items), publish_events=False)
+        synchronizer.CHUNK_SIZE = 2
+        return synchronizer
+
+    def fail_batches_with(self, error, external_id):
+        """Patch _bulk_process_items to raise `error` for batches containing `external_id`."""
+        original = ServicesSynchronizer._bulk_process_items
+
+        def bulk_process_items(synchronizer, items, result):
+            if any(str(item['id']) == external_id for item in items):
+                raise error
+            return original(synchronizer, items, result)
+
+        return mock.patch.object(ServicesSynchronizer, '_bulk_process_items', bulk_process_items)
+
+    def test_operational_error_fails_run_without_moving_checkpoint(self):
+        with self.fail_batches_with(OperationalError('connection lost'), '3'):
+            with self.assertRaises(OperationalError):
+                self.synchronizer().sync_all()
+
+        checkpoint = SyncCheckpoint.objects.get()
+        self.assertEqual(checkpoint.status, SyncCheckpoint.STATUS_FAILED)
+        self.assertEqual(checkpoint.last_batch, 0)
+        self.assertFalse(QuarantinedProduct.objects.exists())
+        self.assertEqual(ProductOffer.objects.count(), 2)
+
+    def test_resume_skips_committed_batches(self):
+        with self.fail_batches_with(OperationalError('connection lost'), '3'):
+            with self.assertRaises(OperationalError):
+                self.synchronizer().sync_all()
+
+        result = self.synchronizer().sync_all()
+        self.assertEqual(result.batches_skipped, 1)
+        self.assertEqual(result.offers_created, 2)
+        self.assertEqual(ProductOffer.objects.count(), 4)
+        checkpoint = SyncCheckpoint.objects.get()
+        self.assertEqual(checkpoint.status, SyncCheckpoint.STATUS_COMPLETED)
+        self.assertEqual(checkpoint.last_batch, 1)
+
+    def test_failing_row_is_quarantined(self):
+        with self.fail_batches_with(IntegrityError('duplicate'), '3'):
+            result = self.synchronizer().sync_all()
+
+        self.assertEqual(result.quarantined, 1)
+        self.assertEqual(QuarantinedProduct.objects.get().external_id, '3')
+        self.assertEqual(
+            sorted(ProductOffer.objects.values_list('external_id', flat=True)), ['1', '2', '4']
+        )
+        self.assertEqual(SyncCheckpoint.objects.get().status, SyncCheckpoint.STATUS_COMPLETED)
+
+    def test_invalid_row_is_quarantined(self):
+        items = self.ITEMS[:1] + [{'id': 9, 'title': 'No price'}]
+        result = self.synchronizer(items).sync_all()
+
+        self.assertEqual(result.quarantined, 1)
+        self.assertIn('price', QuarantinedProduct.objects.get(external_id='9').error)
+        self.assertEqual(ProductOffer.objects.count(), 1)
+
+
+class SnapshotImportTests(TestCase):
+    def setUp(self):
+        ServicesSynchronizer(ListMarketClient(SyncCheckpointTests.ITEMS), publish_events=False).sync_all()
+
+    def import_snapshot(self, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(SyncCheckpointTests.ITEMS[:1], file)
+            file.flush()
+            call_command('import_snapshot', file.name, '--store', 'StoreA', *args, stdout=StringIO())
+
+    def test_partial_snapshot_keeps_missing_offers(self):
+        self.import_snapshot()
+        self.assertEqual(ProductOffer.objects.filter(is_active=True).count(), 4)
+
+    def test_delist_flag_delists_missing_offers(self):
+        self.import_snapshot('--delist')
+        self.assertEqual(list(ProductOffer.objects.filter(is_active=True).values_list('external_id', flat=True)), ['1'])
+
+
+class ProductMatcherTests(TestCase):
+    def setUp(self):
+        self.headphones = Product.objects.create(external_id='1', title='Sony WH-1000XM5 Wireless Headphones Black')
+        self.bottle = Product.objects.create(external_id='2', title='Stainless Steel Insulated Water Bottle 750ml')
+        index_products(Product.objects.all())
+
+    def offer(self, product, store_name):
+        return ProductOffer.objects.create(
+            product=product, store_name=store_name, external_id=product.external_id, current_price_usd=Decimal('1')
+        )
+
+    def test_signature(self):
+        self.assertEqual(similarity(signature('Blue Water Bottle'), signature('the water bottle, BLUE')), 1.0)
+        self.assertLess(similarity(signature('Blue Water Bottle'), signature('Mechanical Gaming Keyboard')), 0.2)
+        self.assertIsNone(signature('the - of'))
+
+    def test_matches_similar_titles_only(self):
+        self.offer(self.headphones, 'StoreA')
+        matches = ProductMatcher('StoreB').match([
+            {'id': 'b1', 'title': 'Sony WH-1000XM5 Wireless Headphones, Black'},
+            {'id': 'b2', 'title': 'Mechanical Gaming Keyboard RGB'},
+        ])
+        self.assertEqual(matches, {'b1': self.headphones.pk})
+
+    def test_store_never_matches_a_product_it_already_sells(self):
+        self.offer(self.headphones, 'StoreB')
+        matches = ProductMatcher('StoreB').match([
+            {'id': 'b1', 'title': 'Sony WH-1000XM5 Wireless Headphones Black'},
+        ])
+        self.assertEqual(matches, {})
+
+    def test_each_product_is_claimed_once_by_the_best_item(self):
+        matches = ProductMatcher('StoreB').match([
+            {'id': 'close', 'title': 'Sony WH-1000XM5 Wireless Headphones'},
+            {'id': 'exact', 'title': 'Sony WH-1000XM5 Wireless Headphones Black'},
+        ])
+        self.assertEqual(matches, {'exact': self.headphones.pk})
+
+    def test_migration_indexes_existing_products(self):
+        migration = importlib.import_module('marketplaces.migrations.0013_index_existing_products')
+        Product.objects.update(minhash=None)
+        ProductMatchBucket.objects.all().delete()
+        untitled = Product.objects.create(external_id='3', title='the - of')
+
+        migration.index_existing_products(apps, mock.Mock(connection=connection))
+        self.assertEqual(ProductMatchBucket.objects.filter(product=self.headphones).count(), 16)
+        self.assertIsNone(Product.objects.get(pk=untitled.pk).minhash)
+        matches = ProductMatcher('StoreB').match([{'id': 'b1', 'title': 'Sony WH-1000XM5 Wireless Headphones, Black'}])
+        self.assertEqual(matches, {'b1': self.headphones.pk})
+
+    def test_sync_links_offers_across_stores(self):
+        items = listing('Sony WH-1000XM5 Wireless Headphones Black', 'Mechanical Gaming Keyboard RGB')
+        result = ServicesSynchronizer(ListMarketClient(items, 'StoreB'), publish_events=False).sync_all()
+
+        self.assertEqual(result.offers_matched, 1)
+        self.assertEqual(result.products_created, 1)
+        self.assertEqual(ProductOffer.objects.get(store_name='StoreB', external_id='1').product_id, self.headphones.pk)
+        # the plain external id "2" is taken by the bottle, so the new product is prefixed
+        self.assertTrue(Product.objects.filter(external_id='StoreB:2', title__startswith='Mechanical').exists())
+
+
+class FakeClock:
+    """Stands in for the time module in marketplaces.throttling."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@contextmanager
+def upstream_response(status, content=b'[]'):
+    yield httpx.Response(status, content=content, request=httpx.Request('GET', 'https://upstream.test/'))
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('marketplaces.throttling.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def breaker(self):
+        return CircuitBreaker('StoreA', failure_threshold=2, recovery_timeout=60, max_recovery_timeout=600)
+
+    def test_token_bucket_exhaustion_and_refill(self):
+        bucket = TokenBucket('StoreA', rate=2, capacity=3)
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.5)
+
+        self.clock.sleep(1)
+        self.assertEqual([bucket.take() for _ in range(2)], [0, 0])
+        self.assertGreater(bucket.take(), 0)
+
+        # never refills past its capacity
+        self.clock.sleep(60)
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertGreater(bucket.take(), 0)
+
+    def test_token_bucket_wait(self):
+        bucket = TokenBucket('StoreA', rate=2, capacity=1)
+        bucket.wait(max_wait=0)
+        with self.assertRaises(RateLimitExceeded):
+            bucket.wait(max_wait=0.1)
+        started = self.clock.now
+        bucket.wait(max_wait=1)
+        self.assertAlmostEqual(self.clock.now - started, 0.5)
+
+    def test_circuit_breaker_opens_probes_and_closes(self):
+        for _ in range(2):
+            breaker = self.breaker()
+            breaker.before_call()
+            breaker.record_failure()
+        with self.assertRaisesRegex(CircuitOpenError, 'is open'):
+            self.breaker().before_call()
+
+        self.clock.sleep(61)
+        probe = self.breaker()
+        probe.before_call()
+        with self.assertRaisesRegex(CircuitOpenError, 'half-open'):
+            self.breaker().before_call()
+
+        # a failed probe reopens the circuit for twice as long
+        probe.record_failure()
+        self.clock.sleep(61)
+        with self.assertRaisesRegex(CircuitOpenError, 'is open'):
+            self.breaker().before_call()
+        self.clock.sleep(60)
+        probe = self.breaker()
+        probe.before_call()
+        probe.record_success()
+
+        for _ in range(3):
+            self.breaker().before_call()
+
+    def test_failures_past_the_threshold_open_the_circuit_once(self):
+        breakers = [self.breaker() for _ in range(4)]
+        for breaker in breakers:
+            breaker.before_call()
+        for breaker in breakers:
+            breaker.record_failure()
+
+        self.clock.sleep(61)
+        self.breaker().before_call()
+
+    def test_rate_limited_call_leaves_no_probe_behind(self):
+        client = ListMarketClient([])
+        client.MAX_TOKEN_WAIT = 0
+        CircuitBreaker('StoreA', 3, 60, 600).record_failure(retry_after=5)
+        self.clock.sleep(61)
+
+        bucket = TokenBucket('StoreA', client.REQUESTS_PER_SECOND, client.REQUEST_BURST)
+        for _ in range(client.REQUEST_BURST):
+            bucket.take()
+        with self.assertRaises(RateLimitExceeded):
+            client.get('https://upstream.test/')
+        self.assertIsNone(cache.get('circuit:StoreA:probe'))
+
+        self.clock.sleep(10)
+        with mock.patch('httpx.stream', return_value=upstream_response(404)):
+            with self.assertRaises(httpx.HTTPStatusError):
+                client.get('https://upstream.test/')
+        self.assertIsNone(cache.get('circuit:StoreA:probe'))
+
+        with mock.patch('httpx.stream', return_value=upstream_response(200)):
+            client.get('https://upstream.test/')
+        self.assertIsNone(cache.get('circuit:StoreA:opened'))
+
+    def test_sync_slot_is_exclusive(self):
+        with SyncSlot('StoreA', 1) as first:
+            self.assertTrue(first)
+            with SyncSlot('StoreA', 1) as second:
+                self.assertFalse(second)
+            with SyncSlot('StoreB', 1) as other_store:
+                self.assertTrue(other_store)
+        with SyncSlot('StoreA', 1) as again:
+            self.assertTrue(again)
+
+        slots = [SyncSlot('StoreA', 2) for _ in range(3)]
+        self.assertEqual([slot.acquire() for slot in slots], [True, True, False])
+
+    def test_allow_sync_run(self):
+        self.assertEqual([allow_sync_run('StoreA', '2/m') for _ in range(3)], [True, True, False])
+        self.assertTrue(allow_sync_run('StoreB', '2/m'))
+        self.assertTrue(allow_sync_run('StoreA', None))
+        with self.assertRaises(ValueError):
+            allow_sync_run('StoreA', '2/week')
+
+
+class ScheduleSyncTests(TestCase):
+    def setUp(self):
+        # created when the test database was migrated
+        PeriodicTask.objects.filter(name__startswith='sync-market:').delete()
+
+    def schedule(self):
+        return {
+            task.name: (task.interval.every, task.args, task.priority)
+            for task in PeriodicTask.objects.filter(name__startswith='sync-market:').select_related('interval')
+        }
+
+    def test_one_task_per_connector(self):
+        interval = IntervalSchedule.objects.create(every=10, period=IntervalSchedule.SECONDS)
+        PeriodicTask.objects.create(name='sync-market:Gone', task='marketplaces.tasks.sync_market', interval=interval)
+        PeriodicTask.objects.create(name='price_alerts', task='notifications.tasks.check_price_alerts', interval=interval)
+
+        result = sync_periodic_tasks()
+        self.assertEqual(result, {'scheduled': ['FakeStoreAPI', 'DummyJSON'], 'removed': ['sync-market:Gone']})
+        self.assertEqual(self.schedule(), {
+            'sync-market:FakeStoreAPI': (30, '["FakeStoreAPI"]', 5),
+            'sync-market:DummyJSON': (300, '["DummyJSON"]', 5),
+        })
+        self.assertTrue(PeriodicTask.objects.filter(name='price_alerts').exists())
+
+    def test_settings_overrides_update_existing_tasks(self):
+        sync_periodic_tasks()
+        with self.settings(MARKETPLACE_SCHEDULES={'DummyJSON': {'SYNC_INTERVAL': 60, 'PRIORITY': 9}}):
+            sync_periodic_tasks()
+        self.assertEqual(self.schedule()['sync-market:DummyJSON'], (60, '["DummyJSON"]', 9))
+        self.assertEqual(PeriodicTask.objects.filter(name__startswith='sync-market:').count(), 2)
+
+    def test_post_migrate_schedules_on_the_primary_only(self):
+        with override_settings(MARKETPLACE_SHARDS={'DummyJSON': 'shard1'}):
+            schedule_after_migrate(sender=None, using='shard1')
+        self.assertEqual(self.schedule(), {})
+
+        schedule_after_migrate(sender=None, using='default')
+        self.assertEqual(len(self.schedule()), 2)
+
+
+class PriceHistoryExportTests(TestCase):
+    # (external id, store, timestamp, price); 22:30 UTC on June 1st is June 2nd locally
+    HISTORY = [
+        ('1', 'StoreA', utc(2026, 6, 1, 8, 0), '10.00'),
+        ('1', 'StoreB', utc(2026, 6, 1, 9, 0), '12.00'),
+        ('2', 'StoreA', utc(2026, 6, 1, 22, 30), '5.50'),
+    ]
+
+    def setUp(self):
+        self.points = []
+        for external_id, store_name, timestamp, price in self.HISTORY:
+            product, _ = Product.objects.get_or_create(external_id=external_id, defaults={'title': external_id})
+            offer = ProductOffer.objects.create(
+                product=product, store_name=store_name, external_id=external_id, current_price_usd=Decimal(price)
+            )
+            row = PriceHistory.objects.create(store_product=offer, price_usd=Decimal(price))
+            # auto_now_add ignores a given timestamp
+            PriceHistory.objects.filter(pk=row.pk).update(timestamp=timestamp)
+            self.points.append((offer.pk, timestamp, Decimal(price)))
+
+    def expected(self, *indexes):
+        return [
+            {'timestamp': timestamp.isoformat(), 'store_name': store_name, 'external_id': external_id, 'price_usd': price}
+            for external_id, store_name, timestamp, price in (self.HISTORY[i] for i in indexes)
+        ]
+
+    def export(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export')
+            call_command('export_price_history', '--output', path, *args, stderr=StringIO())
+            if '--format' not in args:
+                with open(path, newline='') as file:
+                    return list(csv.DictReader(file))
+            return pq.read_table(path).to_pylist()
+
+    def test_csv_round_trip(self):
+        self.assertEqual(self.export(), self.expected(0, 1, 2))
+
+    def test_ndjson_filters(self):
+        def ndjson(**filters):
+            return [json.loads(line) for line in iter_ndjson(price_history_rows(**filters))]
+
+        self.assertEqual(ndjson(), self.expected(0, 1, 2))
+        self.assertEqual(ndjson(stores=['StoreA']), self.expected(0, 2))
+        self.assertEqual(ndjson(external_ids=['1'], stores=['StoreB']), self.expected(1))
+        # days are local ones
+        self.assertEqual(ndjson(date_from=date(2026, 6, 2)), self.expected(2))
+        self.assertEqual(ndjson(date_to=date(2026, 6, 1)), self.expected(0, 1))
+        self.assertEqual(ndjson(external_ids=['missing']), [])
+
+    def test_series_blocks(self):
+        PriceHistory.objects.all().delete()
+        append_points(self.points)
+        with mock.patch('marketplaces.price_series.PRICE_HISTORY_STORAGE', 'blocks'):
+            self.assertEqual(self.export('--store', 'StoreA'), self.expected(0, 2))
+            self.assertEqual(self.export('--from', '2026-06-02'), self.expected(2))
+
+    @skipUnless(pq, "requires pyarrow")
+    def test_parquet(self):
+        rows = self.export('--format', 'parquet', '--product', '1')
+        self.assertEqual(
+            [(row['timestamp'], row['store_name'], row['external_id'], row['price_usd']) for row in rows],
+            [(timestamp, store_name, external_id, Decimal(price))
+             for external_id, store_name, timestamp, price in self.HISTORY[:2]],
+        )
+
+
+class DummyJsonClientTests(TestCase):
+    CATALOG = {
+        'products': [{'id': 1, 'title': 'Phone', 'price': 9.99}, {'id': 2, 'title': 'Laptop', 'price': 499}],
+        'total': 2, 'skip': 0, 'limit': 2,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def products(self, ijson_module):
+        response = upstream_response(200, json.dumps(self.CATALOG).encode())
+        with mock.patch.object(base, 'ijson', ijson_module), mock.patch('httpx.stream', return_value=response) as stream:
+            products = list(DummyJsonMarketClient().iter_products())
+        # the whole catalog in one request
+        stream.assert_called_once_with('GET', DummyJsonMarketClient.BASE_URL, params={'limit': 0}, timeout=10)
+        return products
+
+    @skipUnless(base.ijson, "requires ijson")
+    def test_streamed_with_ijson(self):
+        products = self.products(base.ijson)
+        self.assertEqual([product['id'] for product in products], [1, 2])
+        self.assertEqual(products[1]['title'], 'Laptop')
+
+    def test_without_ijson(self):
+        self.assertEqual(self.products(None), self.CATALOG['products'])
+
+
+class PriceAnalyticsTests(TestCase):
+    def setUp(self):
+        self.today = date(2026, 6, 30)
+        self.product = Product.objects.create(external_id='1', title='Headphones')
+        user = User.objects.create_user('buyer', password='secret-password')
+        TrackingProducts.objects.create(user=user, product=self.product)
+
+        self.points = []
+        for store_name, history in (
+            # carried into the window from before it
+            ('StoreA', [(local(2026, 5, 20, 12), '100.00'), (local(2026, 6, 10, 12), '90.00')]),
+            # the last change of a day is its price
+            ('StoreB', [(local(2026, 6, 5, 12), '95.00'), (local(2026, 6, 29, 9), '80.00'), (local(2026, 6, 29, 18), '120.00')]),
+        ):
+            offer = ProductOffer.objects.create(
+                product=self.product, store_name=store_name, external_id='1', current_price_usd=Decimal(history[-1][1])
+            )
+            for timestamp, price in history:
+                row = PriceHistory.objects.create(store_product=offer, price_usd=Decimal(price))
+                PriceHistory.objects.filter(pk=row.pk).update(timestamp=timestamp)
+                self.points.append((offer.pk, timestamp, Decimal(price)))
+
+    def test_compute_metrics(self):
+        jump = [100.0] * 30 + [110.0]
+        spike = [100.0] * 15 + [120.0] + [100.0] * 15
+        new = [np.nan] * 29 + [50.0, 40.0]
+        metrics = compute_metrics(np.array([jump, spike, new, [np.nan] * 31]))
+
+        def row(index):
+            return {name: values[index] for name, values in metrics.items()}
+
+        jump = row(0)
+        self.assertEqual(jump['last_price'], 110)
+        self.assertEqual(jump['avg_30d'], 100)
+        self.assertAlmostEqual(jump['avg_7d'], (6 * 100 + 110) / 7)
+        self.assertEqual(jump['volatility_30d'], 0)
+        for name in ('change_1d_pct', 'change_7d_pct', 'change_30d_pct'):
+            self.assertAlmostEqual(jump[name], 10)
+        self.assertEqual(jump['trend'], ProductAnalytics.TREND_UP)
+        # a 10% move after a month without any
+        self.assertTrue(jump['is_anomaly'])
+
+        spike = row(1)
+        self.assertAlmostEqual(spike['avg_30d'], (29 * 100 + 120) / 30)
+        self.assertAlmostEqual(spike['volatility_30d'], statistics.pstdev([0.2, 100 / 120 - 1] + [0] * 27))
+        self.assertEqual(spike['change_30d_pct'], 0)
+        self.assertEqual(spike['trend'], ProductAnalytics.TREND_STABLE)
+        self.assertFalse(spike['is_anomaly'])
+
+        new = row(2)
+        # today is left out of the window average
+        self.assertEqual(new['avg_30d'], 50)
+        self.assertAlmostEqual(new['avg_7d'], (50 + 40) / 2)
+        self.assertAlmostEqual(new['change_1d_pct'], -20)
+        self.assertTrue(np.isnan(new['change_7d_pct']))
+        self.assertEqual(new['trend'], ProductAnalytics.TREND_DOWN)
+        self.assertFalse(new['is_anomaly'])
+
+        empty = row(3)
+        self.assertTrue(all(np.isnan(empty[name]) for name in ('last_price', 'avg_30d', 'volatility_30d')))
+        self.assertEqual(empty['trend'], ProductAnalytics.TREND_STABLE)
+        self.assertFalse(empty['is_anomaly'])
+
+    def expected_prices(self):
+        # May 31st to June 30th, the lowest offer of each day
+        return [100.0] * 5 + [95.0] * 5 + [90.0] * 21
+
+    def test_load_daily_prices(self):
+        prices = load_daily_prices([self.product.pk], self.today)
+        self.assertEqual(prices.tolist(), [self.expected_prices()])
+
+        PriceHistory.objects.all().delete()
+        append_points(self.points)
+        with mock.patch('marketplaces.price_series.PRICE_HISTORY_STORAGE', 'blocks'):
+            prices = load_daily_prices([self.product.pk], self.today)
+        self.assertEqual(prices.tolist(), [self.expected_prices()])
+
+    def test_compute_price_analytics(self):
+        untracked = Product.objects.create(external_id='2', title='Bottle')
+        ProductAnalytics.objects.create(product=untracked, computed_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(compute_price_analytics(today=self.today), 1)
+        analytics = ProductAnalytics.objects.get()
+        self.assertEqual(analytics.product, self.product)
+        self.assertEqual(analytics.last_price, 90)
+        self.assertEqual(analytics.avg_30d, round((5 * 100 + 5 * 95 + 20 * 90) / 30, 4))
+        self.assertEqual(analytics.change_30d_pct, -10)
+        self.assertEqual(analytics.change_7d_pct, 0)
+        self.assertEqual(analytics.trend, ProductAnalytics.TREND_DOWN)
+        self.assertFalse(analytics.is_anomaly)
+
+        # recomputing updates the row in place
+        ProductOffer.objects.filter(store_name='StoreA').update(is_active=False)
+        compute_price_analytics(today=self.today)
+        self.assertEqual(ProductAnalytics.objects.get().last_price, 120)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.bottle = Product.objects.create(
+            external_id='1', title='Stainless Steel Water Bottle', category='kitchen', description='Keeps drinks cold'
+        )
+        self.flask = Product.objects.create(
+            external_id='2', title='Hip Flask', category='kitchen', description='A steel bottle for the pocket'
+        )
+        self.keyboard = Product.objects.create(
+            external_id='3', title='Mechanical Keyboard', category='computers', description='RGB backlight'
+        )
+        index_search([self.bottle.pk, self.flask.pk, self.keyboard.pk])
+
+    def search(self, query):
+        return list(search_products(query).values_list('external_id', flat=True))
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('steel bottle'), ['1', '2'])
+        self.assertEqual(self.search('kitchen'), ['1', '2'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('bottle keyboard'), [])
+        self.assertEqual(self.search('rgb keyboard'), ['3'])
+
+    def test_terms_are_stemmed(self):
+        self.assertEqual(self.search('bottles'), ['1', '2'])
+        self.assertEqual(self.search('keeping'), ['1'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('bottle OR keyboard'), [])
+        self.assertEqual(self.search('bottle* "steel'), ['1', '2'])
+        self.assertEqual(self.search(' -- '), [])
+
+    def test_rebuild_search_index(self):
+        Product.objects.filter(pk=self.keyboard.pk).update(title='Wireless Mouse')
+        unindexed = Product.objects.create(external_id='4', title='Wireless Headphones')
+        self.assertEqual(self.search('wireless'), [])
+
+        call_command('rebuild_search_index', '--batch-size', '2', stdout=StringIO())
+        self.assertCountEqual(self.search('wireless'), ['3', '4'])
+        self.assertEqual(self.search('keyboard'), [])
+        self.assertEqual(search_products('headphones').get().pk, unindexed.pk)
+
+    def test_synced_products_are_indexed(self):
+        ServicesSynchronizer(ListMarketClient(listing('Ergonomic Office Chair')), publish_events=False).sync_all()
+        self.assertEqual(
+            list(search_products('ergonomic chair').values_list('title', flat=True)), ['Ergonomic Office Chair']
+        )
+
+
+class ShardedStoresMixin:
+    """Stores ShardStoreA and ShardStoreB on databases of their own, StoreA on the primary."""
+
+    databases = {'default', *SHARDS.values()}
+
+    @classmethod
+    def setUpClass(cls):
+        # the test databases were migrated without MARKETPLACE_SHARDS, which
+        # keeps the marketplaces tables off aliases it doesn't name
+        for alias in sorted(set(SHARDS.values())):
+            shard = connections[alias]
+            if ProductOffer._meta.db_table not in shard.introspection.table_names():
+                with shard.schema_editor() as editor:
+                    for model in (ProductOffer, PriceHistory, PriceSeriesBlock):
+                        editor.create_model(model)
+        super().setUpClass()
+
+    def synchronizer(self, store_name, items):
+        synchronizer = ServicesSynchronizer(ListMarketClient(items, store_name), publish_events=False)
+        synchronizer.CHUNK_SIZE = 2
+        return synchronizer
+
+    def offers(self, alias):
+        return sorted(ProductOffer.objects.using(alias).values_list('store_name', 'external_id'))
+
+
+@override_settings(MARKETPLACE_SHARDS=SHARDS)
+class ShardRoutingTests(ShardedStoresMixin, TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(external_id='1', title='Headphones')
+
+    def add_offer(self, store_name, price, *timestamps):
+        offer = ProductOffer(product=self.product, store_name=store_name, external_id='1', current_price_usd=price)
+        offer.save()  # routed by its store, unlike objects.create()
+        for timestamp in timestamps:
+            row = offer.history.create(price_usd=price)
+            PriceHistory.objects.using(row._state.db).filter(pk=row.pk).update(timestamp=timestamp)
+        return offer
+
+    def test_offers_and_history_follow_their_store(self):
+        self.assertEqual(self.add_offer('ShardStoreA', Decimal('10'), utc(2026, 1, 1))._state.db, 'shard1')
+        self.assertEqual(self.add_offer('ShardStoreB', Decimal('11'), utc(2026, 1, 1))._state.db, 'shard2')
+        self.assertEqual(self.add_offer('StoreA', Decimal('12'), utc(2026, 1, 1))._state.db, 'default')
+
+        for alias, store_name in (('shard1', 'ShardStoreA'), ('shard2', 'ShardStoreB'), ('default', 'StoreA')):
+            self.assertEqual(self.offers(alias), [(store_name, '1')])
+            self.assertEqual(
+                list(PriceHistory.objects.using(alias).values_list('store_product__store_name', flat=True)),
+                [store_name],
+            )
+
+    def test_sync_writes_to_the_store_shard(self):
+        with self.captureOnCommitCallbacks(using='shard1', execute=True):
+            result = self.synchronizer('ShardStoreA', listing('Gaming mouse', 'Office chair', 'Desk lamp')).sync_all()
+
+        self.assertEqual(result.offers_created, 3)
+        self.assertEqual(self.offers('shard1'), [('ShardStoreA', '1'), ('ShardStoreA', '2'), ('ShardStoreA', '3')])
+        self.assertEqual(PriceHistory.objects.using('shard1').count(), 3)
+        for alias in ('default', 'shard2'):
+            self.assertFalse(ProductOffer.objects.using(alias).exists())
+        self.assertEqual(Product.objects.get(external_id='ShardStoreA:1').current_min_price_usd, Decimal('11'))
+        self.assertEqual(SyncCheckpoint.objects.get().last_batch, 1)
+
+    def test_product_detail_merges_every_database(self):
+        self.add_offer('ShardStoreB', Decimal('11'), utc(2026, 1, 1, 9), utc(2026, 1, 3, 9))
+        self.add_offer('ShardStoreA', Decimal('10'), utc(2026, 1, 2, 9))
+        self.add_offer('StoreA', Decimal('12'), utc(2026, 1, 1, 10), utc(2026, 1, 2, 8))
+
+        for storage in ('rows', 'blocks'):
+            with self.subTest(storage=storage), mock.patch('marketplaces.price_series.PRICE_HISTORY_STORAGE', storage):
+                if storage == 'blocks':
+                    call_command('compact_price_history', stdout=StringIO())
+                detail = product_detail_data(self.product, date(2026, 1, 2))
+
+                self.assertCountEqual(
+                    [(offer['store_name'], offer['current_price']) for offer in detail['offers_today']],
+                    [('StoreA', Decimal('12')), ('ShardStoreA', Decimal('10')), ('ShardStoreB', None)],
+                )
+                self.assertEqual(detail['price_history_chart'], [
+                    {'date': date(2026, 1, 1), 'store_prices': {'ShardStoreB': 11.0, 'StoreA': 12.0}, 'avg_price': 11.5},
+                    {'date': date(2026, 1, 2), 'store_prices': {'StoreA': 12.0, 'ShardStoreA': 10.0}, 'avg_price': 11.0},
+                    {'date': date(2026, 1, 3), 'store_prices': {'ShardStoreB': 11.0}, 'avg_price': 11.0},
+                ])
+
+    def test_deleting_a_product_deletes_its_offers_everywhere(self):
+        other = Product.objects.create(external_id='2', title='Keyboard')
+        ProductOffer(product=other, store_name='ShardStoreA', external_id='2', current_price_usd=5).save()
+        for store_name in ('ShardStoreA', 'ShardStoreB', 'StoreA'):
+            self.add_offer(store_name, Decimal('10'), utc(2026, 1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+
+        self.assertEqual(self.offers('shard1'), [('ShardStoreA', '2')])
+        for alias in ('shard2', 'default'):
+            self.assertEqual(self.offers(alias), [])
+        for alias in self.databases:
+            self.assertFalse(PriceHistory.objects.using(alias).exists())
+
+
+@override_settings(MARKETPLACE_SHARDS=SHARDS)
+class ShardResumeTests(ShardedStoresMixin, TransactionTestCase):
+    ITEMS = listing(
+        'Wireless noise cancelling headphones', 'Stainless steel water bottle',
+        'Mechanical gaming keyboard', 'Ergonomic office chair',
+    )
+
+    def fail_shard_commit(self, alias, number):
+        """Make the `number`th commit on `alias` fail, after the primary committed its part."""
+        shard = connections[alias]
+        commit = shard.commit
+        calls = []
+
+        def failing_commit():
+            calls.append(1)
+            if len(calls) == number:
+                raise OperationalError('disk I/O error')
+            commit()
+
+        return mock.patch.object(shard, 'commit', failing_commit)
+
+    def test_failed_shard_commit_keeps_the_batch_for_the_retry(self):
+        with self.fail_shard_commit('shard1', 2), self.assertRaises(OperationalError):
+            self.synchronizer('ShardStoreA', self.ITEMS).sync_all()
+
+        checkpoint = SyncCheckpoint.objects.get()
+        self.assertEqual((checkpoint.status, checkpoint.last_batch), (SyncCheckpoint.STATUS_FAILED, 0))
+        self.assertEqual(self.offers('shard1'), [('ShardStoreA', '1'), ('ShardStoreA', '2')])
+        # the primary committed the products of the second batch
+        self.assertEqual(Product.objects.count(), 4)
+
+        result = self.synchronizer('ShardStoreA', self.ITEMS).sync_all()
+        self.assertEqual((result.batches_skipped, result.offers_created), (1, 2))
+        self.assertEqual(len(self.offers('shard1')), 4)
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(
+            set(ProductOffer.objects.using('shard1').values_list('product_id', flat=True)),
+            set(Product.objects.values_list('pk', flat=True)),
+        )
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.status, checkpoint.last_batch), (SyncCheckpoint.STATUS_COMPLETED, 1))
@@ -0,0 +1,226 @@
+import logging
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_rate(rate: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Parse a celery-style rate string such as "10/m".
+
+    Returns:
+        (allowed runs, window in seconds), or None when unlimited
+    """
+    if not rate:
+        return None
+    count, _, period = str(rate).partition('/')
+    try:
+        return int(count), RATE_PERIODS[period.strip()[:1] or 's']
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit: {rate}") from None
+
+
+class SyncSlot:
+    """
+    Cross-worker semaphore limiting concurrent syncs of one store.
+
+    Slots live in the Django cache with a TTL so a crashed worker cannot hold
+    a slot forever.
+    """
+
+    TIMEOUT = getattr(settings, 'SYNC_SLOT_TIMEOUT', 15 * 60)
+
+    def __init__(self, store_name: str, limit: int):
+        self.store_name = store_name
+        self.limit = max(int(limit), 1)
+        self.key = None
+
+    def acquire(self) -> bool:
+        for slot in range(self.limit):
+            key = f"sync-slot:{self.store_name}:{slot}"
+            if cache.add(key, 1, self.TIMEOUT):
+                self.key = key
+                return True
+        return False
+
+    def release(self) -> None:
+        if self.key:
+            cache.delete(self.key)
+            self.key = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def allow_sync_run(store_name: str, rate: Optional[str]) -> bool:
+    """
+    Fixed-window counter enforcing a store's RATE_LIMIT on sync runs.
+    """
+    parsed = parse_rate(rate)
+    if parsed is None:
+        return True
+
+    allowed, window = parsed
+    key = f"sync-rate:{store_name}"
+    if cache.add(key, 1, window):
+        return True
+    try:
+        runs = cache.incr(key)
+    except ValueError:
+        # window expired between add() and incr()
+        cache.add(key, 1, window)
+        return True
+    return runs <= allowed
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no request token becomes available within the wait budget."""
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all workers through the Django cache.
+
+    The bucket state is a (tokens, last refill timestamp) pair; updates are
+    serialized with a short cache lock so concurrent workers cannot overdraw it.
+    """
+
+    LOCK_TIMEOUT = 2
+
+    def __init__(self, name: str, rate: float, capacity: int):
+        self.key = f"token-bucket:{name}"
+        self.rate = float(rate)
+        self.capacity = max(int(capacity), 1)
+
+    def _lock(self) -> bool:
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while not cache.add(f"{self.key}:lock", 1, self.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def take(self) -> float:
+        """
+        Take one token.
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one is available
+        """
+        if not self._lock():
+            return 0.05
+        try:
+            now = time.time()
+            tokens, updated = cache.get(self.key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                cache.set(self.key, (tokens - 1, now), None)
+                return 0
+            cache.set(self.key, (tokens, now), None)
+            return (1 - tokens) / self.rate
+        finally:
+            cache.delete(f"{self.key}:lock")
+
+    def wait(self, max_wait: float) -> None:
+        deadline = time.monotonic() + max_wait
+        while True:
+            delay = self.take()
+            if not delay:
+                return
+            if time.monotonic() + delay > deadline:
+                raise RateLimitExceeded(f"No request token for {self.key} within {max_wait}s")
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Per-store circuit breaker with state kept in the Django cache.
+
+    After FAILURE_THRESHOLD consecutive failures the circuit opens and calls
+    fail fast. Once the recovery timeout passes a single probe request is let
+    through: success closes the circuit, failure reopens it with the timeout
+    doubled (up to max_recovery_timeout). A 429 Retry-After opens it directly.
+
+    Each part of the state is a cache key of its own, changed with add()
+    and incr() only, so workers failing at once neither lose a failure nor
+    open the circuit twice. An instance guards a single call.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int,
+            recovery_timeout: float,
+            max_recovery_timeout: float,
+    ):
+        self.name = name
+        self.key = f"circuit:{name}"
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.probing = False
+
+    def _incr(self, name: str) -> int:
+        key = f"{self.key}:{name}"
+        if cache.add(key, 1, None):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # the circuit closed between add() and incr()
+            cache.add(key, 1, None)
+            return 1
+
+    def raise_if_open(self) -> None:
+        if cache.get(f"{self.key}:open_until", 0) > time.time():
+            raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+    def before_call(self) -> None:
+        """Fail fast while the circuit is open; once it has opened, let one probe through."""
+        self.raise_if_open()
+        if cache.get(f"{self.key}:opened"):
+            if not cache.add(f"{self.key}:probe", 1, self.recovery_timeout):
+                # half-open: another worker is already probing the upstream
+                raise CircuitOpenError(f"Circuit for {self.name} is half-open")
+            self.probing = True
+
+    def release_probe(self) -> None:
+        """End a probe that told nothing about the upstream, e.g. a 404."""
+        if self.probing:
+            cache.delete(f"{self.key}:probe")
+            self.probing = False
+
+    def record_success(self) -> None:
+        if self.probing:
+            logger.info(f"Circuit for {self.name} closed")
+            cache.delete_many([f"{self.key}:{name}" for name in ("failures", "opened", "open_until", "probe")])
+            self.probing = False
+        elif cache.get(f"{self.key}:failures"):
+            cache.delete(f"{self.key}:failures")
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        failures = self._incr("failures")
+        # of the calls failing together only the one reaching the threshold opens the circuit
+        if retry_after is None and not self.probing and failures != self.failure_threshold:
+            return
+
+        opened = self._incr("opened")
+        timeout = min(self.recovery_timeout * 2 ** (opened - 1), self.max_recovery_timeout)
+        if retry_after is not None:
+            timeout = max(timeout, retry_after)
+        cache.set(f"{self.key}:open_until", time.time() + timeout, None)
+        logger.warning(f"Circuit for {self.name} opened for {timeout:.0f}s")
+        self.release_probe()
@@ -12,4 +12,12 @@ class PriceNotification(models.Model):
     triggered_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        unique_together = ('user', 'product', 'target_price')
\ No newline at end of file
+        unique_together = ('user', 'product', 'target_price')
+        indexes = [
+            # partial (is_sent, product) index: only pending alerts are scanned
+            models.Index(
+                fields=['is_sent', 'product'],
+                condition=models.Q(is_sent=False),
+                name='pending_notification_idx',
+            ),
+        ]
\ No newline at end of file
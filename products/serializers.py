@@ -1,18 +1,27 @@
-from datetime import date
+import heapq
+from operator import itemgetter
 
-from django.db.models import Min, Q
+from django.db.models import Min, OuterRef, Q, Subquery
+from django.utils import timezone
 from rest_framework import serializers
-from marketplaces.models import Product, ProductOffer, PriceHistory
+from marketplaces.models import Product, ProductOffer, PriceHistory, PriceSeriesBlock
+from marketplaces.price_series import iter_points, min_price, use_blocks
+from test_scrape_proj.db_router import read_databases
+from tracking.models import TrackingProducts
 
 
 class ProductListSerializer(serializers.ModelSerializer):
-    min_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    max_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    trend = serializers.CharField(read_only=True)
+    """A tracked product, read from the user's dashboard snapshot row."""
+
+    id = serializers.IntegerField(source='product_id', read_only=True)
 
     class Meta:
-        model = Product
-        fields = ['id', 'external_id', 'title', 'min_price', 'max_price', 'trend']
+        model = TrackingProducts
+        fields = [
+            'id', 'external_id', 'title', 'min_price', 'max_price',
+            'trend', 'change_7d_pct', 'volatility_30d', 'avg_30d', 'is_anomaly'
+        ]
+        read_only_fields = fields
 
 
 class ProductOfferTodaySerializer(serializers.ModelSerializer):
@@ -31,9 +40,41 @@ class PriceHistorySerializer(serializers.Serializer):
     avg_price = serializers.DecimalField(max_digits=12, decimal_places=2)
 
 
+class PriceHistoryExportParamsSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    store = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    product = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class ProductSearchParamsSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class ProductSearchSerializer(serializers.ModelSerializer):
+    min_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, source='current_min_price_usd', read_only=True
+    )
+    max_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, source='current_max_price_usd', read_only=True
+    )
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'external_id', 'title', 'category', 'min_price', 'max_price', 'offer_count', 'rank']
+
+
 class ProductDetailSerializer(serializers.ModelSerializer):
-    min_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    max_price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    min_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, source='current_min_price_usd', read_only=True
+    )
+    max_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, source='current_max_price_usd', read_only=True
+    )
     offers_today = serializers.SerializerMethodField()
     price_history_chart = serializers.SerializerMethodField()
 
@@ -46,32 +87,117 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         ]
 
     def get_offers_today(self, obj):
+        # precomputed by the detail views, see product_detail_data()
+        if 'offers_today' in self.context:
+            return self.context['offers_today']
 
-        today = self.context.get('today', date.today())
-        offers = obj.offers.annotate(
-            today_price=Min('history__price_usd', filter=Q(history__timestamp__date=today))
-        )
-        return [{'store_name': o.store_name, 'current_price': o.today_price} for o in offers]
+        return offers_today(obj, self.context.get('today', timezone.localdate()))
 
     def get_price_history_chart(self, obj):
-        history_qs = PriceHistory.objects.filter(store_product__product=obj).order_by('timestamp')
-        if not history_qs.exists():
-            return []
-
-        grouped = {}
-        for h in history_qs:
-            day = h.timestamp.date()
-            if day not in grouped:
-                grouped[day] = {'store_prices': {}, 'prices': []}
-            grouped[day]['store_prices'][h.store_product.store_name] = float(h.price_usd)
-            grouped[day]['prices'].append(float(h.price_usd))
-
-        chart_data = []
-        for day, data in grouped.items():
-            chart_data.append({
-                'date': day,
-                'store_prices': data['store_prices'],
-                'avg_price': sum(data['prices']) / len(data['prices'])
-            })
-
-        return chart_data
\ No newline at end of file
+        if 'price_history_chart' in self.context:
+            return self.context['price_history_chart']
+
+        return build_price_history_chart(price_history_rows(obj))
+
+
+def product_detail_key(product, today) -> str:
+    """
+    Single-flight key of a product's detail data. Syncs bump
+    price_updated_at whenever offers or history change, which starts a new key.
+    """
+    updated = product.price_updated_at.timestamp() if product.price_updated_at else 0
+    return f"product-detail:{product.pk}:{today.isoformat()}:{updated}"
+
+
+def product_detail_data(product, today):
+    """The offers_today and price_history_chart context of ProductDetailSerializer."""
+    return {
+        'offers_today': offers_today(product, today),
+        'price_history_chart': build_price_history_chart(price_history_rows(product)),
+    }
+
+
+def offers_today(product, today):
+    """Store name and lowest price today of every active offer, over all store databases."""
+    return [
+        {'store_name': offer.store_name, 'current_price': offer_today_price(offer)}
+        for using in read_databases(ProductOffer)
+        for offer in offers_today_queryset(product, today, using)
+    ]
+
+
+def offers_today_queryset(product, today, using='default'):
+    """
+    Active offers of the product on one store database; read their lowest
+    price today with offer_today_price().
+    """
+    offers = ProductOffer.objects.using(using).filter(product_id=product.pk, is_active=True)
+    if use_blocks():
+        return offers.annotate(today_series=Subquery(
+            PriceSeriesBlock.objects
+            .filter(store_product=OuterRef('pk'), day=today)
+            .values('data')[:1]
+        ))
+    return offers.annotate(
+        today_price=Min('history__price_usd', filter=Q(history__timestamp__date=today))
+    )
+
+
+def offer_today_price(offer):
+    if hasattr(offer, 'today_series'):
+        return min_price(offer.today_series)
+    return offer.today_price
+
+
+def price_history_rows(product):
+    """
+    (timestamp, store_name, price) of every price point, oldest first:
+    a queryset, or a lazy generator with PRICE_HISTORY_STORAGE = "blocks"
+    or when stores are sharded over several databases.
+    """
+    if use_blocks():
+        return _series_history_rows(product)
+    rows = [
+        PriceHistory.objects.using(using)
+        .filter(store_product__product_id=product.pk)
+        .order_by('timestamp')
+        .values_list('timestamp', 'store_product__store_name', 'price_usd')
+        for using in read_databases(PriceHistory)
+    ]
+    if len(rows) == 1:
+        return rows[0]
+    return heapq.merge(*rows, key=itemgetter(0))
+
+
+def _series_history_rows(product):
+    points = []
+    for using in read_databases(ProductOffer):
+        store_names = dict(
+            ProductOffer.objects.using(using).filter(product_id=product.pk).values_list('pk', 'store_name')
+        )
+        points += [
+            (timestamp, store_names[offer_id], price)
+            for offer_id, timestamp, price in iter_points(offer_ids=store_names, using=using)
+        ]
+    points.sort(key=itemgetter(0))
+    yield from points
+
+
+def build_price_history_chart(rows):
+    grouped = {}
+    for timestamp, store_name, price in rows:
+        day = timestamp.date()
+        if day not in grouped:
+            grouped[day] = {'store_prices': {}, 'prices': []}
+        grouped[day]['store_prices'][store_name] = float(price)
+        grouped[day]['prices'].append(float(price))
+
+    chart_data = []
+    for day, data in grouped.items():
+        chart_data.append({
+            'date': day,
+            'store_prices': data['store_prices'],
+            'avg_price': sum(data['prices']) / len(data['prices'])
+        })
+
+    return chart_data
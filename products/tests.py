@@ -1,3 +1,246 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplaces.events import PriceEventsHub, price_events
+from marketplaces.models import Product, ProductOffer, PriceHistory
+from marketplaces.search import index_products
+from products.views import AsyncListProductsTrackingView, AsyncProductDetailView, PriceEventsStreamView
+from tracking.dashboard import refresh_snapshots
+from tracking.models import TrackingProducts
+from users.authentication import StreamToken
+
+
+class ProductViewTestCase(TestCase):
+    """A user tracking one product with offers in two stores."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-password')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.product = Product.objects.create(
+            external_id='1', title='Wireless headphones',
+            current_min_price_usd=Decimal('10.00'), current_max_price_usd=Decimal('12.00'), offer_count=2,
+        )
+        for store_name, price in (('StoreA', '10.00'), ('StoreB', '12.00')):
+            offer = ProductOffer.objects.create(
+                product=self.product, store_name=store_name, external_id='1', current_price_usd=Decimal(price)
+            )
+            PriceHistory.objects.create(store_product=offer, price_usd=Decimal(price))
+        TrackingProducts.objects.create(user=self.user, product=self.product)
+        refresh_snapshots([self.product.pk])
+
+
+class ConditionalGetTests(ProductViewTestCase):
+    def test_not_modified_carries_validators(self):
+        response = self.client.get('/products/tracking/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/products/tracking/', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+
+    def test_snapshot_refresh_changes_etag(self):
+        etag = self.client.get('/products/tracking/', headers=self.headers)['ETag']
+        ProductOffer.objects.filter(store_name='StoreA').update(current_price_usd=Decimal('8.00'))
+        Product.objects.filter(pk=self.product.pk).update(current_min_price_usd=Decimal('8.00'))
+        refresh_snapshots([self.product.pk])
+
+        response = self.client.get('/products/tracking/', headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_today_is_the_local_day(self):
+        # 22:30 UTC on June 1st is already June 2nd in Europe/Kiev
+        now = datetime(2026, 6, 1, 22, 30, tzinfo=dt_timezone.utc)
+        PriceHistory.objects.update(timestamp=now - timedelta(hours=1))
+        cache.clear()
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = self.client.get('/products/tracking/1/', headers=self.headers)
+        self.assertEqual(
+            sorted(offer['current_price'] for offer in response.json()['offers_today']), [10.0, 12.0]
+        )
+
+
+class PriceHistoryExportViewTests(ProductViewTestCase):
+    def export(self, headers, **params):
+        return self.client.get('/products/history/export/', params, headers=headers)
+
+    def test_staff_only(self):
+        self.assertEqual(self.export({}).status_code, 401)
+        self.assertEqual(self.export(self.headers).status_code, 403)
+
+    def test_streams_csv_and_ndjson(self):
+        staff = User.objects.create_user('staff', password='secret-password', is_staff=True)
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(staff)}'}
+
+        response = self.export(headers, store='StoreA')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(
+            [(row['store_name'], row['external_id'], row['price_usd']) for row in rows], [('StoreA', '1', '10.00')]
+        )
+
+        response = self.export(headers, output='ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="price_history.ndjson"')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            sorted((row['store_name'], row['price_usd']) for row in rows), [('StoreA', '10.00'), ('StoreB', '12.00')]
+        )
+
+        self.assertEqual(self.export(headers, date_from='June').status_code, 400)
+
+
+class ProductSearchViewTests(ProductViewTestCase):
+    def search(self, **params):
+        return self.client.get('/products/search/', params, headers=self.headers)
+
+    def test_pages(self):
+        for i in range(2, 5):
+            Product.objects.create(external_id=str(i), title=f'Wired headphones {i}')
+        index_products(Product.objects.values_list('pk', flat=True))
+
+        response = self.search(q='headphones', page_size=3)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['page'], data['has_next'], len(data['results'])), (1, True, 3))
+        self.assertEqual(
+            set(data['results'][0]), {'id', 'external_id', 'title', 'category', 'min_price', 'max_price', 'offer_count', 'rank'}
+        )
+
+        data = self.search(q='headphones', page_size=3, page=2).json()
+        self.assertEqual((data['has_next'], len(data['results'])), (False, 1))
+        self.assertEqual([row['external_id'] for row in self.search(q='wireless').json()['results']], ['1'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.search().status_code, 400)
+        self.assertEqual(self.search(q='headphones', page=0).status_code, 400)
+        self.headers = {}
+        self.assertEqual(self.search(q='headphones').status_code, 401)
+
+
+class AsyncViewTests(ProductViewTestCase):
+    """The async views answer like the sync ones they replace under ASGI."""
+
+    async def get(self, view, path, headers=None, **kwargs):
+        request = AsyncRequestFactory().get(path, headers=headers if headers is not None else self.headers)
+        return await view.as_view()(request, **kwargs)
+
+    async def test_list_matches_sync_view(self):
+        expected = (await self.async_client.get('/products/tracking/', headers=self.headers)).json()
+        for sort in ('price', 'trend'):
+            response = await self.get(AsyncListProductsTrackingView, f'/products/tracking/?sort={sort}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(expected[0]['external_id'], '1')
+
+    async def test_detail_matches_sync_view(self):
+        expected = (await self.async_client.get('/products/tracking/1/', headers=self.headers)).json()
+        # computed again, not served from the sync view's single-flight result
+        await cache.aclear()
+        response = await self.get(AsyncProductDetailView, '/products/tracking/1/', external_id='1')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data, expected)
+        self.assertEqual(
+            sorted((offer['store_name'], offer['current_price']) for offer in data['offers_today']),
+            [('StoreA', 10.0), ('StoreB', 12.0)],
+        )
+
+    async def test_detail_of_unknown_product(self):
+        response = await self.get(AsyncProductDetailView, '/products/tracking/404/', external_id='404')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_conditional_get(self):
+        response = await self.get(AsyncListProductsTrackingView, '/products/tracking/')
+        etag = response['ETag']
+        response = await self.get(
+            AsyncListProductsTrackingView, '/products/tracking/', {**self.headers, 'If-None-Match': etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_authentication_is_required(self):
+        response = await self.get(AsyncListProductsTrackingView, '/products/tracking/', {})
+        self.assertEqual(response.status_code, 401)
+        response = await self.get(
+            AsyncProductDetailView, '/products/tracking/1/', {'Authorization': 'Bearer invalid'}, external_id='1'
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+async def no_redis(hub):
+    await asyncio.Event().wait()
+
+
+@mock.patch.object(PriceEventsHub, '_listen', no_redis)
+class PriceEventsStreamTests(ProductViewTestCase):
+    def stream_token(self):
+        response = self.client.post('/products/events/token/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    async def open_stream(self, query=None, headers=None):
+        request = AsyncRequestFactory().get('/products/events/', query, headers=headers or {})
+        return await PriceEventsStreamView.as_view()(request)
+
+    async def test_stream_relays_prices_of_tracked_products(self):
+        other = await Product.objects.acreate(external_id='2', title='Water bottle')
+        token = await sync_to_async(self.stream_token)()
+        response = await self.open_stream({'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = response._iterator
+        self.assertEqual(await anext(events), 'retry: 5000\n\n')
+        price_events._fan_out({'store': 'StoreA', 'timestamp': '2026-06-01T12:00:00+00:00', 'prices': [
+            {'product_id': other.pk, 'external_id': '2', 'price': '5.00'},
+            {'product_id': self.product.pk, 'external_id': '1', 'price': '9.00'},
+        ]})
+        event, data = (await anext(events)).splitlines()[:2]
+        self.assertEqual(event, 'event: price')
+        self.assertEqual(json.loads(data.removeprefix('data: '))['prices'], [
+            {'product_id': self.product.pk, 'external_id': '1', 'price': '9.00'},
+        ])
+
+        # a disconnected client unsubscribes
+        await events.aclose()
+        self.assertFalse(price_events._queues)
+
+    async def test_stream_authentication(self):
+        response = await self.open_stream()
+        self.assertEqual(response.status_code, 401)
+        # access tokens belong in the header, never in the URL
+        response = await self.open_stream({'token': str(AccessToken.for_user(self.user))})
+        self.assertEqual(response.status_code, 401)
+
+        token = StreamToken.for_user(self.user)
+        token.set_exp(lifetime=-StreamToken.lifetime)
+        response = await self.open_stream({'token': str(token)})
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.open_stream(headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stream_token_is_not_an_access_token(self):
+        response = self.client.get('/products/tracking/', headers={'Authorization': f'Bearer {self.stream_token()}'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post('/products/events/token/').status_code, 401)
+
+    def test_wsgi_answers_not_implemented(self):
+        response = self.client.get('/products/events/', headers=self.headers)
+        self.assertEqual(response.status_code, 501)
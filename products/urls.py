@@ -1,8 +1,23 @@
+from django.conf import settings
 from django.urls import path
 
-from products.views import ListProductsTrackingView, ProductDetailView
+from products.views import (
+    ListProductsTrackingView, ProductDetailView,
+    AsyncListProductsTrackingView, AsyncProductDetailView, PriceEventsStreamView, PriceEventsTokenView,
+    PriceHistoryExportView, ProductSearchView,
+)
+
+# ASGI deployments serve the same routes with the async views
+if getattr(settings, 'ASYNC_PRODUCT_VIEWS', False):
+    list_view, detail_view = AsyncListProductsTrackingView, AsyncProductDetailView
+else:
+    list_view, detail_view = ListProductsTrackingView, ProductDetailView
 
 urlpatterns = [
-    path("tracking/",  ListProductsTrackingView.as_view(), name="list-products-tracking"),
-    path("tracking/<str:external_id>/",  ProductDetailView.as_view(), name="list-products-tracking"),
-]
\ No newline at end of file
+    path("search/", ProductSearchView.as_view(), name="product-search"),
+    path("history/export/", PriceHistoryExportView.as_view(), name="price-history-export"),
+    path("events/", PriceEventsStreamView.as_view(), name="price-events"),
+    path("events/token/", PriceEventsTokenView.as_view(), name="price-events-token"),
+    path("tracking/",  list_view.as_view(), name="list-products-tracking"),
+    path("tracking/<str:external_id>/",  detail_view.as_view(), name="list-products-tracking"),
+]
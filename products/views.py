@@ -1,85 +1,407 @@
-from datetime import date, timedelta
+import asyncio
+import hashlib
+import json
+from datetime import datetime, time
 
-from django.db.models import Min, Max, Avg, Q, Case, When, F, Value, CharField, IntegerField
-from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, QuerySet
+from django.db import router
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import exceptions, generics
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
-from marketplaces.models import Product
-from products.serializers import ProductListSerializer, ProductDetailSerializer
+from marketplaces.events import price_events
+from marketplaces.export import iter_csv, iter_ndjson, price_history_rows as export_rows
+from marketplaces.models import PriceHistory, Product, ProductOffer
+from marketplaces.search import search_products
+from tracking.models import TrackingProducts
+from users.authentication import CachedJWTAuthentication, StreamToken
+from products.serializers import (
+    ProductListSerializer, ProductDetailSerializer, PriceHistoryExportParamsSerializer,
+    ProductSearchParamsSerializer, ProductSearchSerializer,
+    offers_today_queryset, offer_today_price, price_history_rows, build_price_history_chart,
+    product_detail_data, product_detail_key,
+)
+from test_scrape_proj.db_router import ReplicaReadMixin, read_databases, replica_reads
+from test_scrape_proj.profiling import span
+from test_scrape_proj.singleflight import asingle_flight, single_flight
 
 
-class ListProductsTrackingView(generics.ListAPIView):
+def tracked_products_queryset(user, sort_by='price'):
+    # snapshots are kept current by tracking.dashboard, so this reads one
+    # table through the (user, ...) indexes however long the price history is
+    queryset = TrackingProducts.objects.filter(user=user)
+
+    if sort_by == 'price':
+        queryset = queryset.order_by('min_price')
+    elif sort_by == 'trend':
+        queryset = queryset.order_by('-trend_rank', 'min_price')
+
+    return queryset
+
+
+def tracked_products_aggregates():
+    """
+    Aggregates over the user's tracking rows that change whenever the list
+    response can: a snapshot refresh or the tracked set.
+    """
+    return {
+        'snapshot_at': Max('snapshot_at'),
+        'tracked_at': Max('created_at'),
+        'count': Count('id'),
+    }
+
+
+def tracked_products_state(user):
+    return TrackingProducts.objects.filter(user=user).aggregate(**tracked_products_aggregates())
+
+
+def product_state(external_id):
+    return Product.objects.filter(external_id=external_id).values('id', 'price_updated_at')
+
+
+def build_validators(state):
+    """
+    Turn a state dict into (ETag, Last-Modified).
+
+    Trends and "today" prices move with the calendar day, so the day is part
+    of the ETag and Last-Modified is never earlier than today's midnight. Days
+    are local (TIME_ZONE) ones, like the detail views' "today".
+    """
+    today = timezone.localdate()
+    etag = hashlib.md5(repr((today, state)).encode()).hexdigest()
+
+    last_modified = timezone.make_aware(datetime.combine(today, time.min))
+    for value in state.values():
+        if isinstance(value, datetime) and value > last_modified:
+            last_modified = value
+    return quote_etag(etag), last_modified.timestamp()
+
+
+def conditional_response(request, validators):
+    """HttpResponseNotModified when the client's copy is current, else None."""
+    etag, last_modified = validators
+    return get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+
+
+def set_validators(response, validators):
+    etag, last_modified = validators
+    # a 304 carries the validators the 200 would have (RFC 9110, 15.4.5)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET with 304 from cheap validators before the heavy queryset runs.
+    Views override get_validators(); None, the default, skips conditional handling.
+    """
+
+    def get_validators(self):
+        """(ETag, Last-Modified timestamp) of the current response, see build_validators()."""
+        return None
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return set_validators(not_modified, validators)
+        return set_validators(super().get(request, *args, **kwargs), validators)
+
+
+class ListProductsTrackingView(ReplicaReadMixin, ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [IsAuthenticated, ]
 
-    def get_queryset(self):
-        user = self.request.user
-        today = date.today()
-        last_30_days = today - timedelta(days=30)
-
-        queryset = Product.objects.filter(tracking_products__user=user).annotate(
-            min_price=Min(
-                'offers__history__price_usd',
-                filter=Q(offers__history__timestamp__date=today)
-            ),
-            max_price=Max(
-                'offers__history__price_usd',
-                filter=Q(offers__history__timestamp__date=today)
-            ),
-
-            avg_30d=Avg(
-                'offers__history__price_usd',
-                filter=Q(
-                    offers__history__timestamp__date__gte=last_30_days,
-                    offers__history__timestamp__date__lt=today
-                )
-            )
-        ).annotate(
-            trend_ordered=Case(
-                When(min_price__gt=F('avg_30d'), then=Value(2)),
-                When(max_price__lt=F('avg_30d'), then=Value(0)),
-                default=Value(1),
-                output_field=IntegerField()
-            ),
-            # for serializer
-            trend=Case(
-                When(min_price__gt=F('avg_30d'), then=Value('up')),
-                When(max_price__lt=F('avg_30d'), then=Value('down')),
-                default=Value('stable'),
-                output_field=CharField()
-            )
-        )
+    def get_validators(self):
+        return build_validators(tracked_products_state(self.request.user))
 
+    def get_queryset(self):
         sort_by = self.request.query_params.get('sort', 'price')
-        if sort_by == 'price':
-            queryset = queryset.order_by('min_price')
-        elif sort_by == 'trend':
-            queryset = queryset.order_by('-trend_ordered', 'min_price')
-
-        return queryset
+        return tracked_products_queryset(self.request.user, sort_by)
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        with span('serialize'):
+            data = self.get_serializer(queryset, many=True).data
+        return Response(data)
 
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(ReplicaReadMixin, ConditionalGetMixin, generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductDetailSerializer
     permission_classes = [IsAuthenticated, ]
 
     lookup_field = 'external_id'
 
-    def get_queryset(self):
-        today = date.today()
-        return super().get_queryset().annotate(
-            min_price=Min('offers__history__price_usd', filter=Q(offers__history__timestamp__date=today)),
-            max_price=Max('offers__history__price_usd', filter=Q(offers__history__timestamp__date=today))
-        )
+    def get_validators(self):
+        state = product_state(self.kwargs['external_id']).first()
+        return build_validators(state) if state else None
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context['today'] = date.today()
+        context['today'] = timezone.localdate()
         return context
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        context = self.get_serializer_context()
+        # concurrent requests for a product share one computation
+        context.update(single_flight(
+            product_detail_key(instance, context['today']),
+            lambda: product_detail_data(instance, context['today']),
+        ))
+        with span('serialize'):
+            data = self.get_serializer(instance, context=context).data
+        return Response(data)
+
+
+class PriceHistoryExportView(ReplicaReadMixin, APIView):
+    """
+    Stream price history as CSV or NDJSON, filtered by ?store=, ?product=
+    (both repeatable), ?date_from= and ?date_to=. Staff only.
+    """
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request):
+        params = request.query_params
+        data = {key: params[key] for key in ('output', 'date_from', 'date_to') if key in params}
+        for key in ('store', 'product'):
+            if key in params:
+                data[key] = params.getlist(key)
+
+        serializer = PriceHistoryExportParamsSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
+        rows = export_rows(
+            stores=options.get('store'),
+            external_ids=options.get('product'),
+            date_from=options.get('date_from'),
+            date_to=options.get('date_to'),
+            # the stream is consumed after dispatch returns, so pin the alias now
+            using=router.db_for_read(PriceHistory),
+        )
+        if options['output'] == 'ndjson':
+            response = StreamingHttpResponse(iter_ndjson(rows), content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="price_history.{options["output"]}"'
+        return response
+
+
+SEARCH_FIELDS = [
+    'external_id', 'title', 'category', 'current_min_price_usd', 'current_max_price_usd', 'offer_count'
+]
+
+
+class ProductSearchView(ReplicaReadMixin, APIView):
+    """
+    Ranked full-text search over product title, category and description:
+    ?q= (every term must match), ?page=, ?page_size=.
+
+    Each page is one query; one extra row is fetched to tell whether a next
+    page exists instead of counting all matches.
+    """
+    permission_classes = [IsAuthenticated, ]
+
+    def get(self, request):
+        serializer = ProductSearchParamsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        offset = (params['page'] - 1) * params['page_size']
+        products = list(
+            search_products(params['q'], using=router.db_for_read(Product))
+            .only(*SEARCH_FIELDS)[offset:offset + params['page_size'] + 1]
+        )
+        has_next = len(products) > params['page_size']
+
+        return Response({
+            'page': params['page'],
+            'has_next': has_next,
+            'results': ProductSearchSerializer(products[:params['page_size']], many=True).data,
+        })
+
+
+def json_response(data, status=200):
+    """JsonResponse rendered like DRF's JSONRenderer output."""
+    return JsonResponse(
+        data, status=status, safe=False, encoder=JSONEncoder,
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+
+class AsyncJWTView(View):
+    """
+    Async counterpart of the DRF read views for ASGI deployments.
+
+    DRF views are sync only, so JWT authentication is done here and the
+    handlers use Django's async ORM while the event loop serves other requests.
+    """
+
+    authentication = CachedJWTAuthentication()
+
+    def authenticate(self, request):
+        """(user, validated token) from the Authorization header, or None without one."""
+        return self.authentication.authenticate(request)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user_auth = await sync_to_async(self.authenticate)(request)
+        except exceptions.AuthenticationFailed as e:
+            return json_response({"detail": e.detail}, status=401)
+        if user_auth is None:
+            return json_response({"detail": "Authentication credentials were not provided."}, status=401)
+
+        request.user = user_auth[0]
+        with replica_reads():
+            return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncListProductsTrackingView(AsyncJWTView):
+    async def get(self, request):
+        state = await TrackingProducts.objects.filter(user=request.user).aaggregate(
+            **tracked_products_aggregates()
+        )
+        validators = build_validators(state)
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return set_validators(not_modified, validators)
+
+        queryset = tracked_products_queryset(request.user, request.GET.get('sort', 'price'))
+        products = [product async for product in queryset]
+        with span('serialize'):
+            response = json_response(ProductListSerializer(products, many=True).data)
+        return set_validators(response, validators)
+
+
+class AsyncProductDetailView(AsyncJWTView):
+    async def get(self, request, external_id):
+        state = await product_state(external_id).afirst()
+        validators = build_validators(state) if state else None
+        if validators:
+            not_modified = conditional_response(request, validators)
+            if not_modified is not None:
+                return set_validators(not_modified, validators)
+
+        try:
+            product = await Product.objects.aget(external_id=external_id)
+        except Product.DoesNotExist:
+            return json_response({"detail": "No Product matches the given query."}, status=404)
+
+        today = timezone.localdate()
+        detail = await asingle_flight(
+            product_detail_key(product, today), lambda: self._detail_data(product, today)
+        )
+
+        with span('serialize'):
+            response = json_response(ProductDetailSerializer(product, context={'today': today, **detail}).data)
+        return set_validators(response, validators) if validators else response
+
+    @staticmethod
+    async def _detail_data(product, today):
+        """product_detail_data() with the async ORM."""
+        offers_today = [
+            {'store_name': offer.store_name, 'current_price': offer_today_price(offer)}
+            for using in read_databases(ProductOffer)
+            async for offer in offers_today_queryset(product, today, using)
+        ]
+        history = price_history_rows(product)
+        if isinstance(history, QuerySet):
+            rows = [row async for row in history]
+        else:
+            # series blocks are decoded in Python, off the event loop
+            rows = await sync_to_async(list)(history)
+        return {'offers_today': offers_today, 'price_history_chart': build_price_history_chart(rows)}
+
+
+class PriceEventsTokenView(APIView):
+    """Issue a short-lived StreamToken to open products/events/ with ?token=."""
+    permission_classes = [IsAuthenticated, ]
+
+    def post(self, request):
+        token = StreamToken.for_user(request.user)
+        return Response({'token': str(token), 'expires_in': int(token.lifetime.total_seconds())})
+
+
+class PriceEventsStreamView(AsyncJWTView):
+    """
+    Server-sent events with the price changes of the user's tracked products,
+    relayed from the Redis channel ServicesSynchronizer publishes to through
+    the process-wide marketplaces.events.price_events subscription.
+
+    Browsers' EventSource cannot send an Authorization header, so it passes
+    a StreamToken from PriceEventsTokenView as ?token= instead.
+
+    Needs an ASGI server: under WSGI the endless stream would hold a worker
+    thread forever, so it answers 501 there.
+    """
+
+    KEEPALIVE_INTERVAL = 15
+    TRACKED_REFRESH_INTERVAL = 60
+
+    def authenticate(self, request):
+        raw_token = request.GET.get('token')
+        if raw_token is None:
+            return super().authenticate(request)
+        try:
+            validated_token = StreamToken(raw_token)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+        return self.authentication.get_user(validated_token), validated_token
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return json_response({"detail": "Price events are only served under ASGI."}, status=501)
+
+        response = StreamingHttpResponse(self._events(request.user), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def _tracked_product_ids(self, user):
+        return {
+            pk async for pk in
+            TrackingProducts.objects.filter(user=user).values_list('product_id', flat=True)
+        }
+
+    async def _events(self, user):
+        loop = asyncio.get_running_loop()
+        async with price_events.subscribe() as queue:
+            tracked = await self._tracked_product_ids(user)
+            refreshed_at = loop.time()
+            yield "retry: 5000\n\n"
+
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), self.KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    payload = None
+                if loop.time() - refreshed_at > self.TRACKED_REFRESH_INTERVAL:
+                    tracked = await self._tracked_product_ids(user)
+                    refreshed_at = loop.time()
+
+                if payload is None:
+                    yield ": keepalive\n\n"
+                    continue
+
+                prices = [price for price in payload["prices"] if price["product_id"] in tracked]
+                if prices:
+                    data = json.dumps({**payload, "prices": prices})
+                    yield f"event: price\ndata: {data}\n\n"
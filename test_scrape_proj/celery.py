@@ -1,11 +1,16 @@
 import os
 
+import click
 from celery import Celery
-
-from test_scrape_proj import settings
+from celery.signals import celeryd_init, worker_init
+from click.core import ParameterSource
+from kombu import Exchange, Queue
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_scrape_proj.settings')
+# Django system checks would import every URLconf and view on worker boot;
+# `manage.py check` covers them at deploy time.
+os.environ.setdefault('CELERY_SKIP_CHECKS', '1')
 
 app = Celery('test_scrape_proj')
 
@@ -14,23 +19,116 @@ app = Celery('test_scrape_proj')
 # - namespace='CELERY' means all celery-related configuration keys
 #   should have a `CELERY_` prefix.
 app.config_from_object('django.conf:settings', namespace='CELERY')
-
-# Load task modules from all registered Django apps.
-app.autodiscover_tasks()
-
-app.conf.timezone = settings.TIME_ZONE
 app.conf.enable_utc = True
 
-app.conf.beat_schedule = {
-    "usd_rate": {
-        "task": "currencies.tasks.periodic_usd_rate",
-        "schedule": 30.0,
+# Run one worker per queue, so bulky syncs can't hold up alerts:
+#   celery -A test_scrape_proj worker -Q sync
+# Worker settings below apply to a worker consuming only that queue,
+# unless given on the command line.
+WORKER_QUEUES = {
+    # long, upstream and DB heavy: one task at a time per process
+    "sync": {"concurrency": 2, "prefetch_multiplier": 1, "max_tasks_per_child": 50},
+    # short and latency sensitive
+    "alerts": {"concurrency": 4, "prefetch_multiplier": 4, "max_tasks_per_child": None},
+    # light housekeeping and fan-out
+    "periodic": {"concurrency": 2, "prefetch_multiplier": 4, "max_tasks_per_child": None},
+}
+DEFAULT_QUEUE = "periodic"
+
+# Every task with its queue and limits, plus a beat entry (name, seconds)
+# for the statically scheduled ones; keep the names, beat stores entries
+# in the database by name. Marketplace syncs are scheduled per store
+# in the database instead, see `python manage.py sync_market_schedules`.
+# "ignore_result" skips the result backend for tasks nobody waits on (their
+# return values are still logged by the worker); other tasks store results
+# as usual, so `.get()` works on them.
+TASKS = {
+    "marketplaces.tasks.sync_market": {
+        "queue": "sync", "soft_time_limit": 15 * 60, "time_limit": 16 * 60, "ignore_result": True,
+    },
+    "marketplaces.tasks.periodic_price_analytics": {
+        "queue": "sync", "soft_time_limit": 10 * 60, "time_limit": 11 * 60, "ignore_result": True,
+        "beat": ("price_analytics", 15 * 60.0),
+    },
+    "marketplaces.tasks.periodic_sync_markets": {
+        "queue": "periodic", "soft_time_limit": 60, "time_limit": 90, "ignore_result": True,
+    },
+    "notifications.tasks.check_price_alerts": {
+        "queue": "alerts", "soft_time_limit": 2 * 60, "time_limit": 3 * 60, "ignore_result": True,
+        "beat": ("price_alerts", 60.0),
+    },
+    "currencies.tasks.periodic_usd_rate": {
+        "queue": "periodic", "soft_time_limit": 60, "time_limit": 90, "ignore_result": True,
+        "beat": ("usd_rate", 30.0),
     },
 }
 
+# Load the task modules of just the apps in TASKS, when the worker starts.
+app.autodiscover_tasks(sorted({name.split(".")[0] for name in TASKS}))
+
+app.conf.task_queues = [Queue(name, Exchange(name), routing_key=name) for name in WORKER_QUEUES]
+app.conf.task_default_queue = DEFAULT_QUEUE
+app.conf.task_routes = {name: {"queue": options["queue"]} for name, options in TASKS.items()}
+app.conf.task_annotations = {
+    name: {
+        "soft_time_limit": options["soft_time_limit"],
+        "time_limit": options["time_limit"],
+        "ignore_result": options.get("ignore_result", False),
+    }
+    for name, options in TASKS.items()
+}
+app.conf.result_expires = 60 * 60
+
 app.conf.beat_schedule = {
-    "sync_markets": {
-        "task": "marketplaces.tasks.periodic_sync_markets",
-        "schedule": 30.0,
+    options["beat"][0]: {
+        "task": name,
+        "schedule": options["beat"][1],
+        # a run still queued when the next one is due is dropped
+        "options": {"expires": options["beat"][1]},
     }
+    for name, options in TASKS.items()
+    if "beat" in options
 }
+
+
+def option_given(options, name):
+    """
+    Whether the worker option `name` was set by the operator rather than left to its default.
+
+    Under `celery worker` the options come from click, and some of them
+    (e.g. --prefetch-multiplier) have callbacks filling in the configured
+    value when omitted, so a value in `options` doesn't mean it was given.
+    Click records where each parameter came from (command line, environment
+    or default) in ParameterSource; that tells them apart. A worker started
+    from code has no click context and only passes the options it was given.
+    """
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and name in ctx.params:
+        return ctx.get_parameter_source(name) is not ParameterSource.DEFAULT
+    return options.get(name) is not None
+
+
+@celeryd_init.connect
+def configure_worker_for_queue(sender=None, conf=None, options=None, **kwargs):
+    """Apply WORKER_QUEUES settings to a worker started with -Q <single queue>."""
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    if len(queues) != 1 or queues[0] not in WORKER_QUEUES:
+        return
+
+    for option, value in WORKER_QUEUES[queues[0]].items():
+        if not option_given(options, option):
+            conf[f"worker_{option}"] = value
+
+
+@worker_init.connect
+def apply_queue_prefetch_multiplier(sender=None, **kwargs):
+    """Copy a per-queue prefetch multiplier onto a worker started by `celery worker`.
+
+    The command passes the configured multiplier on as if it had been given,
+    so the worker would otherwise keep the one from before configure_worker_for_queue.
+    """
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and ctx.get_parameter_source("prefetch_multiplier") is ParameterSource.DEFAULT:
+        sender.prefetch_multiplier = int(sender.app.conf.worker_prefetch_multiplier)
@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List
+
+from django.conf import settings
+from django.db import router
+
+REPLICA_DB = "replica"
+PRIMARY_DB = "default"
+
+# models stored on the database of their store, see StoreShardRouter
+SHARDED_APP = "marketplaces"
+SHARDED_MODELS = {"productoffer", "pricehistory", "priceseriesblock"}
+
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Route ORM reads made inside the block to the read replica, if configured."""
+    token = _read_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    DRF view mixin serving the whole request from the read replica.
+
+    Only for read-only endpoints: replica lag is tolerated here, while Celery
+    tasks and write views keep reading from the primary.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and REPLICA_DB in settings.DATABASES:
+            return REPLICA_DB
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica mirrors the primary, so objects from both can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_DB
+
+
+def shard_for_store(store_name: str) -> str:
+    """Database alias holding the offers and price history of a store."""
+    return getattr(settings, 'MARKETPLACE_SHARDS', {}).get(store_name, PRIMARY_DB)
+
+
+def store_databases() -> List[str]:
+    """Every database alias holding store data, the primary first."""
+    shards = set(getattr(settings, 'MARKETPLACE_SHARDS', {}).values()) - {PRIMARY_DB}
+    return [PRIMARY_DB] + sorted(shards)
+
+
+def read_databases(model) -> List[str]:
+    """
+    Aliases to read `model`'s store data from: the shards, plus wherever
+    the primary's share is read from (the replica inside replica_reads()).
+    Rows of different shards may share primary keys.
+    """
+    return [
+        router.db_for_read(model) if alias == PRIMARY_DB else alias
+        for alias in store_databases()
+    ]
+
+
+class StoreShardRouter:
+    """
+    Keeps offers, price history and series blocks on the database of their
+    store (settings.MARKETPLACE_SHARDS). Products and everything else stay
+    on the primary, so offers reference their product across databases.
+
+    Bulk queries, and objects.create(), carry no instance to route by:
+    code touching one store passes .using(shard_for_store(...)), and reads
+    over all stores query each of read_databases() and merge. Related lookups from a stored
+    offer, history row or block stay on its database.
+    """
+
+    def _instance_db(self, model, hints):
+        if model._meta.app_label != SHARDED_APP or model._meta.model_name not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._meta.model_name == 'productoffer' and instance._state.adding:
+            # not _state.db: assigning the product sets it to the primary
+            return shard_for_store(instance.store_name)
+        if instance._meta.model_name in SHARDED_MODELS:
+            return instance._state.db
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._instance_db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._instance_db(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != PRIMARY_DB and db in store_databases():
+            # shards carry the whole marketplaces schema, products stay empty there
+            return app_label == SHARDED_APP
+        return None
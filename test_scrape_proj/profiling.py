@@ -0,0 +1,195 @@
+import heapq
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_profile = ContextVar("request_profile", default=None)
+
+_MISSING = object()
+
+
+class RequestProfile:
+    """Measurements of one sampled request, filled in from any thread serving it."""
+
+    def __init__(self, slow_queries: int):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.spans = defaultdict(float)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._slow_queries_limit = slow_queries
+        self._slow_queries = []  # min-heap of (duration, sql)
+
+    def record_query(self, sql: str, duration: float) -> None:
+        self.queries += 1
+        self.db_time += duration
+        entry = (duration, sql)
+        if len(self._slow_queries) < self._slow_queries_limit:
+            heapq.heappush(self._slow_queries, entry)
+        elif entry > self._slow_queries[0]:
+            heapq.heapreplace(self._slow_queries, entry)
+
+    def slow_queries(self):
+        return sorted(self._slow_queries, reverse=True)
+
+    def server_timing(self, total: float) -> str:
+        metrics = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        metrics += [f'{name};dur={duration * 1000:.1f}' for name, duration in self.spans.items()]
+        if self.cache_hits or self.cache_misses:
+            metrics.append(f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def span(name: str):
+    """Add the time spent in the block to the `name` metric of a sampled request."""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.spans[name] += time.perf_counter() - started
+
+
+def record_cache_lookup(hits: int, misses: int = 0) -> None:
+    profile = _profile.get()
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(sql, time.perf_counter() - started)
+
+
+def _install_query_recorder(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class ProfiledCacheMixin:
+    """Count hits and misses of sampled requests in a cache backend."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache_lookup(0, 1)
+            return default
+        record_cache_lookup(1)
+        return value
+
+
+class ProfiledRedisCache(ProfiledCacheMixin, RedisCache):
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        record_cache_lookup(len(found), len(keys) - len(found))
+        return found
+
+
+class ProfiledLocMemCache(ProfiledCacheMixin, LocMemCache):
+    # BaseCache.get_many() goes through get(), which counts each key
+    pass
+
+
+class RequestProfilingMiddleware:
+    """
+    Profile a random PROFILING_SAMPLE_RATE share of requests: DB query count
+    and time, the slowest statements, named spans (e.g. serialization) and
+    cache hits. Sampled responses get a Server-Timing header and one JSON
+    log line on the "test_scrape_proj.profiling" logger.
+
+    Unsampled requests only pay for a random() call and a context variable
+    lookup per query. With a rate of 0 the middleware removes itself.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.slow_queries = getattr(settings, 'PROFILING_SLOW_QUERIES', 5)
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+        # the wrapper reads the request's profile from a context variable,
+        # which also reaches ORM calls run in sync_to_async threads
+        connection_created.connect(_install_query_recorder, dispatch_uid='request_profiling')
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile(self.slow_queries)
+        token = _profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self._finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        profile = RequestProfile(self.slow_queries)
+        token = _profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self._finish(request, response, profile)
+
+    def _finish(self, request, response, profile: RequestProfile):
+        # for streaming responses this covers the time to the first byte
+        total = time.perf_counter() - profile.started
+        response['Server-Timing'] = profile.server_timing(total)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(profile.db_time * 1000, 1),
+            'queries': profile.queries,
+            'spans_ms': {name: round(duration * 1000, 1) for name, duration in profile.spans.items()},
+            'cache_hits': profile.cache_hits,
+            'cache_misses': profile.cache_misses,
+            'slow_queries': [
+                {'ms': round(duration * 1000, 1), 'sql': sql[:500]}
+                for duration, sql in profile.slow_queries()
+            ],
+        }))
+        return response
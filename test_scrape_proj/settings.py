@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/6.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -43,10 +44,13 @@ INSTALLED_APPS = [
     "marketplaces",
     "currencies",
     "tracking",
-    "notifications"
+    "notifications",
+    "users",
 ]
 
 MIDDLEWARE = [
+    # outermost, so its total covers the other middleware too
+    "test_scrape_proj.profiling.RequestProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,15 +80,101 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "test_scrape_proj.wsgi.application"
 
+# Serve the product read endpoints with async views (set when running under ASGI).
+ASYNC_PRODUCT_VIEWS = os.environ.get("ASYNC_PRODUCT_VIEWS", "0") == "1"
+
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SQLite unless DB_ENGINE=postgresql; PostgreSQL settings come from DB_* env vars.
+if os.environ.get("DB_ENGINE", "sqlite") == "postgresql":
+    _postgres = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DB_NAME", "test_scrape_proj"),
+        "USER": os.environ.get("DB_USER", "postgres"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+        "HOST": os.environ.get("DB_HOST", "localhost"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        "CONN_HEALTH_CHECKS": True,
     }
-}
+    if os.environ.get("DB_POOL", "1") == "1":
+        # psycopg connection pool; Django requires CONN_MAX_AGE=0 with pooling
+        _postgres["CONN_MAX_AGE"] = 0
+        _postgres["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+                "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+            }
+        }
+    else:
+        _postgres["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+
+    DATABASES = {"default": _postgres}
+
+    if os.environ.get("DB_REPLICA_HOST"):
+        DATABASES["replica"] = {
+            **_postgres,
+            "HOST": os.environ["DB_REPLICA_HOST"],
+            "PORT": os.environ.get("DB_REPLICA_PORT", _postgres["PORT"]),
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+
+# Offers and price history of a store live on the database alias it maps
+# to (the rest on "default"), e.g. DB_SHARDS="DummyJSON=shard1,FakeStoreAPI=shard2".
+# Each alias is a database of its own: db_<alias>.sqlite3, or the PostgreSQL
+# database <DB_NAME>_<alias> (host from DB_<ALIAS>_HOST). Create its tables
+# with `python manage.py migrate marketplaces --database <alias>`.
+MARKETPLACE_SHARDS = dict(
+    entry.split("=", 1) for entry in os.environ.get("DB_SHARDS", "").split(",") if "=" in entry
+)
+for _alias in sorted(set(MARKETPLACE_SHARDS.values()) - {"default"}):
+    if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+        DATABASES[_alias] = {**DATABASES["default"], "NAME": BASE_DIR / f"db_{_alias}.sqlite3"}
+    else:
+        DATABASES[_alias] = {
+            **DATABASES["default"],
+            "NAME": os.environ.get(f"DB_{_alias.upper()}_NAME", f"{DATABASES['default']['NAME']}_{_alias}"),
+            "HOST": os.environ.get(f"DB_{_alias.upper()}_HOST", DATABASES["default"]["HOST"]),
+        }
+
+# Reads go to "replica" only inside marketplaces' read views, and store
+# data to its shard, see db_router.
+DATABASE_ROUTERS = [
+    "test_scrape_proj.db_router.StoreShardRouter",
+    "test_scrape_proj.db_router.PrimaryReplicaRouter",
+]
+
+# Sync slots, rate limiters and circuit breaker state must be visible across
+# all web and Celery processes: set CACHE_REDIS_URL (e.g.
+# redis://localhost:6379/2) wherever more than one process runs. Without it
+# each process gets a cache of its own, enough for runserver and the tests.
+# Both backends also count hits for request profiling.
+if os.environ.get("CACHE_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "test_scrape_proj.profiling.ProfiledRedisCache",
+            "LOCATION": os.environ["CACHE_REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "test_scrape_proj.profiling.ProfiledLocMemCache",
+        }
+    }
+
+# Share of requests profiled by RequestProfilingMiddleware (0 disables it):
+# Server-Timing header plus a JSON log line with the slowest SQL statements
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_SLOW_QUERIES = 5
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -126,6 +216,20 @@ STATIC_URL = "static/"
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_TIMEZONE = TIME_ZONE
+
+# Redis pub/sub used to push synchronized price changes to products/events/.
+PRICE_EVENTS_REDIS_URL = 'redis://localhost:6379/0'
+
+# Marketplace clients synchronized by marketplaces.tasks.sync_market.
+MARKETPLACE_CONNECTORS = [
+    'marketplaces.services.fakestoreapi.FakeStoreApiMarketClient',
+    'marketplaces.services.dummyjson.DummyJsonMarketClient',
+]
+# Per-store overrides of the client scheduling hints, e.g.
+# {'DummyJSON': {'SYNC_INTERVAL': 300, 'RATE_LIMIT': '10/h'}}
+MARKETPLACE_SCHEDULES = {}
 
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
@@ -134,10 +238,18 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with users cached locally and in Redis
+        'users.authentication.CachedJWTAuthentication',
     )
 }
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
+# Seconds an authenticated user stays cached in Redis (dropped on save) and
+# in each process, see users.authentication
+AUTH_USER_CACHE_TTL = 60
+AUTH_USER_LOCAL_TTL = 5
+# Seconds a products/events/token/ token can be used to open the price
+# events stream, see users.authentication.StreamToken
+STREAM_TOKEN_LIFETIME = 60
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import secrets
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+# how long a computed result is served to later callers
+RESULT_TTL = getattr(settings, 'SINGLE_FLIGHT_RESULT_TTL', 30)
+# a crashed computation frees its key after this many seconds
+LOCK_TIMEOUT = getattr(settings, 'SINGLE_FLIGHT_LOCK_TIMEOUT', 10)
+# callers waiting longer than this compute the value themselves
+WAIT_TIMEOUT = getattr(settings, 'SINGLE_FLIGHT_WAIT_TIMEOUT', 5)
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+# deletes the lock only if it still holds the caller's token
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+_async_locks = {}
+
+
+@contextmanager
+def _thread_lock(key: str):
+    """Per-key lock shared by the threads of this process, dropped when unused."""
+    with _thread_locks_guard:
+        entry = _thread_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _thread_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _thread_locks[key]
+
+
+@asynccontextmanager
+async def _async_lock(key: str):
+    """Per-key lock shared by the tasks of this event loop, dropped when unused."""
+    entry = _async_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _async_locks[key]
+
+
+def _lock_token() -> int:
+    # an int is stored as is by RedisCache, not pickled, so the release
+    # script can compare it
+    return secrets.randbits(62)
+
+
+def _release(lock_key: str, token: int) -> None:
+    """
+    Free the lock if this caller still owns it. A computation outliving
+    LOCK_TIMEOUT must not delete the lock of the caller that took over.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        key = backend.make_and_validate_key(lock_key)
+        backend._cache.get_client(key, write=True).eval(_RELEASE_SCRIPT, 1, key, token)
+    elif cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def single_flight(key: str, compute: Callable[[], Any], ttl: int = RESULT_TTL) -> Any:
+    """
+    Return the cached result of `compute` under `key`, computing it at most
+    once at a time across threads and workers.
+
+    Threads of one process queue on a local lock, so only one of them takes
+    part in the cross-worker round; the others find its result in the cache.
+    Across workers a cache lock picks the one computing, and the rest poll
+    the cache for the result for up to WAIT_TIMEOUT seconds.
+
+    The result must be picklable.
+    """
+    result_key = f"single-flight:{key}"
+    value = cache.get(result_key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    with _thread_lock(key):
+        value = cache.get(result_key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        lock_key = f"{result_key}:lock"
+        token = _lock_token()
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while not cache.add(lock_key, token, LOCK_TIMEOUT):
+            time.sleep(POLL_INTERVAL)
+            value = cache.get(result_key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() > deadline:
+                logger.warning(f"Gave up waiting for {key} to be computed elsewhere")
+                return compute()
+
+        try:
+            value = compute()
+            cache.set(result_key, value, ttl)
+            return value
+        finally:
+            _release(lock_key, token)
+
+
+async def asingle_flight(key: str, compute: Callable[[], Awaitable[Any]], ttl: int = RESULT_TTL) -> Any:
+    """single_flight() for coroutines; waiting never blocks the event loop."""
+    result_key = f"single-flight:{key}"
+    value = await cache.aget(result_key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    async with _async_lock(key):
+        value = await cache.aget(result_key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        lock_key = f"{result_key}:lock"
+        token = _lock_token()
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while not await cache.aadd(lock_key, token, LOCK_TIMEOUT):
+            await asyncio.sleep(POLL_INTERVAL)
+            value = await cache.aget(result_key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() > deadline:
+                logger.warning(f"Gave up waiting for {key} to be computed elsewhere")
+                return await compute()
+
+        try:
+            value = await compute()
+            await cache.aset(result_key, value, ttl)
+            return value
+        finally:
+            await sync_to_async(_release)(lock_key, token)
@@ -0,0 +1,214 @@
+import json
+import re
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+try:
+    import fakeredis
+except ImportError:  # pragma: no cover - optional dependency
+    fakeredis = None
+
+from marketplaces.models import PriceHistory, Product, ProductOffer
+from test_scrape_proj import profiling, singleflight
+from test_scrape_proj.profiling import ProfiledLocMemCache, ProfiledRedisCache, RequestProfile
+from test_scrape_proj.singleflight import asingle_flight, single_flight
+from users.authentication import local_users, user_cache_key
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_SLOW_QUERIES=2)
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='secret-password')
+        local_users.delete(user_cache_key(self.user.pk))
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        product = Product.objects.create(external_id='1', title='Headphones', current_min_price_usd=Decimal('10.00'))
+        offer = ProductOffer.objects.create(
+            product=product, store_name='StoreA', external_id='1', current_price_usd=Decimal('10.00')
+        )
+        PriceHistory.objects.create(store_product=offer, price_usd=Decimal('10.00'))
+
+    def server_timing(self, response):
+        return dict(re.findall(r'(\w+);([^,]+)', response['Server-Timing']))
+
+    def test_sampled_request(self):
+        with self.assertLogs('test_scrape_proj.profiling', 'INFO') as logs, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/tracking/1/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['method'], record['path'], record['status']), ('GET', '/products/tracking/1/', 200))
+        self.assertEqual(record['queries'], len(queries))
+        self.assertIn('serialize', record['spans_ms'])
+        # the user and the detail missed, the detail again under the lock;
+        # releasing the lock read it back
+        self.assertEqual((record['cache_hits'], record['cache_misses']), (1, 3))
+        slow = [query['ms'] for query in record['slow_queries']]
+        self.assertEqual(len(slow), 2)
+        self.assertEqual(slow, sorted(slow, reverse=True))
+
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'serialize', 'cache', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+        self.assertIn('cache;desc="1 hits, 3 misses"', response['Server-Timing'])
+
+        # the detail is cached now, the user in the process-local tier
+        response = self.client.get('/products/tracking/1/', headers=self.headers)
+        self.assertIn('cache;desc="1 hits, 0 misses"', response['Server-Timing'])
+
+    async def test_sampled_async_request(self):
+        response = await self.async_client.get('/products/tracking/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.server_timing(response)), {'db', 'serialize', 'cache', 'total'})
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        response = self.client.get('/products/tracking/1/', headers=self.headers)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_locmem_cache_counts_lookups_of_sampled_requests(self):
+        self.assertIsInstance(caches['default'], ProfiledLocMemCache)
+        cache.set('present', 1)
+        self.assertEqual(cache.get('present'), 1)  # outside a sampled request
+
+        profile = RequestProfile(slow_queries=1)
+        token = profiling._profile.set(profile)
+        try:
+            cache.get('present')
+            cache.get('missing')
+            self.assertEqual(cache.get_many(['present', 'missing', 'absent']), {'present': 1})
+        finally:
+            profiling._profile.reset(token)
+        self.assertEqual((profile.cache_hits, profile.cache_misses), (2, 3))
+
+    def test_redis_get_many_counts_each_key(self):
+        backend = ProfiledRedisCache('redis://localhost:6379/2', {})
+        profile = RequestProfile(slow_queries=1)
+        token = profiling._profile.set(profile)
+        try:
+            with mock.patch.object(RedisCache, 'get_many', return_value={'present': 1}):
+                backend.get_many(['present', 'missing'])
+        finally:
+            profiling._profile.reset(token)
+        self.assertEqual((profile.cache_hits, profile.cache_misses), (1, 1))
+
+
+class SingleFlightTests(SimpleTestCase):
+    key = 'detail:1'
+    result_key = 'single-flight:detail:1'
+    lock_key = 'single-flight:detail:1:lock'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_computes_once(self):
+        compute = mock.Mock(return_value={'price': 10})
+        self.assertEqual(single_flight(self.key, compute), {'price': 10})
+        self.assertEqual(single_flight(self.key, compute), {'price': 10})
+        compute.assert_called_once_with()
+        self.assertIsNone(cache.get(self.lock_key))
+
+    async def test_async_computes_once(self):
+        compute = mock.AsyncMock(return_value={'price': 10})
+        self.assertEqual(await asingle_flight(self.key, compute), {'price': 10})
+        self.assertEqual(await asingle_flight(self.key, compute), {'price': 10})
+        compute.assert_awaited_once_with()
+        self.assertIsNone(await cache.aget(self.lock_key))
+
+    def test_waits_for_the_lock_owner(self):
+        cache.add(self.lock_key, 1)
+        compute = mock.Mock()
+
+        def finish(interval):
+            # the owner finishes while this caller polls
+            cache.set(self.result_key, {'price': 10})
+
+        with mock.patch('test_scrape_proj.singleflight.time.sleep', side_effect=finish):
+            self.assertEqual(single_flight(self.key, compute), {'price': 10})
+        compute.assert_not_called()
+        self.assertEqual(cache.get(self.lock_key), 1)
+
+    @mock.patch('test_scrape_proj.singleflight.WAIT_TIMEOUT', 0)
+    def test_computes_itself_after_waiting_too_long(self):
+        cache.add(self.lock_key, 1)
+        with mock.patch('test_scrape_proj.singleflight.time.sleep'), \
+                self.assertLogs('test_scrape_proj.singleflight', 'WARNING'):
+            self.assertEqual(single_flight(self.key, lambda: {'price': 10}), {'price': 10})
+        self.assertEqual(cache.get(self.lock_key), 1)
+
+    def take_over(self):
+        # the lock expired during the computation and another worker took it
+        cache.delete(self.lock_key)
+        self.assertTrue(cache.add(self.lock_key, 7))
+        return {'price': 10}
+
+    def test_stale_owner_keeps_the_lock_of_its_successor(self):
+        self.assertEqual(single_flight(self.key, self.take_over), {'price': 10})
+        self.assertEqual(cache.get(self.lock_key), 7)
+
+    async def test_async_stale_owner_keeps_the_lock_of_its_successor(self):
+        async def compute():
+            return await sync_to_async(self.take_over)()
+
+        self.assertEqual(await asingle_flight(self.key, compute), {'price': 10})
+        self.assertEqual(await cache.aget(self.lock_key), 7)
+
+    def test_release_compares_the_token(self):
+        cache.add(self.lock_key, 7)
+        singleflight._release(self.lock_key, 8)
+        self.assertEqual(cache.get(self.lock_key), 7)
+        singleflight._release(self.lock_key, 7)
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_redis_release_runs_the_compare_and_delete_script(self):
+        client = mock.Mock()
+        with override_settings(CACHES=REDIS_CACHES), \
+                mock.patch.object(RedisCacheClient, 'get_client', return_value=client) as get_client:
+            singleflight._release(self.lock_key, 7)
+            key = caches['default'].make_and_validate_key(self.lock_key)
+        get_client.assert_called_once_with(key, write=True)
+        client.eval.assert_called_once_with(singleflight._RELEASE_SCRIPT, 1, key, 7)
+        client.get.assert_not_called()
+        client.delete.assert_not_called()
+
+
+REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'test_scrape_proj.profiling.ProfiledRedisCache',
+        'LOCATION': 'redis://localhost:6379/15',
+    },
+}
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(CACHES=REDIS_CACHES)
+class RedisSingleFlightTests(SingleFlightTests):
+    """The same cases against Redis, with the release script run by fakeredis."""
+
+    def setUp(self):
+        server = fakeredis.FakeRedis()
+        patcher = mock.patch.object(RedisCacheClient, 'get_client', return_value=server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def test_redis_release_runs_the_compare_and_delete_script(self):
+        spy = mock.Mock(wraps=RedisCacheClient.get_client(None))
+        with mock.patch.object(RedisCacheClient, 'get_client', return_value=spy):
+            cache.add(self.lock_key, 7)
+            singleflight._release(self.lock_key, 8)
+            self.assertEqual(cache.get(self.lock_key), 7)
+            singleflight._release(self.lock_key, 7)
+            self.assertIsNone(cache.get(self.lock_key))
+        self.assertEqual(spy.eval.call_count, 2)
+        spy.delete.assert_not_called()
@@ -0,0 +1,84 @@
+from typing import Iterable
+
+from django.db.models import Case, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from marketplaces.models import Product, ProductAnalytics
+from tracking.models import TrackingProducts
+
+SNAPSHOT_BATCH_SIZE = 1000
+
+TREND_RANKS = {
+    ProductAnalytics.TREND_UP: 2,
+    ProductAnalytics.TREND_STABLE: 1,
+    ProductAnalytics.TREND_DOWN: 0,
+}
+
+
+def snapshot_values() -> dict:
+    """
+    Update expressions copying the tracked product's current prices and
+    analytics into TrackingProducts snapshot columns.
+    """
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    analytics = ProductAnalytics.objects.filter(product_id=OuterRef('product_id'))
+
+    def column(queryset, field):
+        return Subquery(queryset.values(field)[:1])
+
+    return {
+        'external_id': column(product, 'external_id'),
+        'title': column(product, 'title'),
+        'min_price': column(product, 'current_min_price_usd'),
+        'max_price': column(product, 'current_max_price_usd'),
+        'avg_30d': column(analytics, 'avg_30d'),
+        'change_7d_pct': column(analytics, 'change_7d_pct'),
+        'volatility_30d': column(analytics, 'volatility_30d'),
+        'trend': Coalesce(column(analytics, 'trend'), Value(ProductAnalytics.TREND_STABLE)),
+        'trend_rank': Coalesce(
+            column(analytics.annotate(rank=Case(
+                *[When(trend=trend, then=Value(rank)) for trend, rank in TREND_RANKS.items()],
+                output_field=IntegerField(),
+            )), 'rank'),
+            Value(TREND_RANKS[ProductAnalytics.TREND_STABLE]),
+        ),
+        'is_anomaly': Coalesce(column(analytics, 'is_anomaly'), Value(False)),
+    }
+
+
+def refresh_snapshots(
+        product_ids: Iterable[int],
+        user=None,
+        batch_size: int = SNAPSHOT_BATCH_SIZE,
+) -> int:
+    """
+    Rewrite the dashboard snapshot of every tracking row of the given
+    products, i.e. of just the users tracking them, with one UPDATE per
+    batch of products.
+
+    Args:
+        product_ids: Products whose prices or analytics changed
+        user: Only refresh this user's rows
+
+    Returns:
+        Number of tracking rows updated
+    """
+    product_ids = sorted(set(product_ids))
+    values = snapshot_values()
+    now = timezone.now()
+    updated = 0
+    for start in range(0, len(product_ids), batch_size):
+        rows = TrackingProducts.objects.filter(product_id__in=product_ids[start:start + batch_size])
+        if user is not None:
+            rows = rows.filter(user=user)
+        updated += rows.update(**values, snapshot_at=now)
+    return updated
+
+
+def refresh_all_snapshots(batch_size: int = SNAPSHOT_BATCH_SIZE) -> int:
+    """Rewrite the snapshot of every tracked product."""
+    return refresh_snapshots(
+        TrackingProducts.objects.values_list('product_id', flat=True).distinct(),
+        batch_size=batch_size,
+    )
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.11 on 2026-10-19 14:57
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def fill_snapshots(apps, schema_editor):
+    Product = apps.get_model("marketplaces", "Product")
+    ProductAnalytics = apps.get_model("marketplaces", "ProductAnalytics")
+    TrackingProducts = apps.get_model("tracking", "TrackingProducts")
+
+    product = Product.objects.filter(pk=OuterRef("product_id"))
+    analytics = ProductAnalytics.objects.filter(product_id=OuterRef("product_id"))
+
+    def column(queryset, field):
+        return Subquery(queryset.values(field)[:1])
+
+    trend_rank = analytics.annotate(
+        rank=Case(
+            When(trend="up", then=Value(2)),
+            When(trend="stable", then=Value(1)),
+            When(trend="down", then=Value(0)),
+            output_field=IntegerField(),
+        )
+    )
+    TrackingProducts.objects.update(
+        external_id=column(product, "external_id"),
+        title=column(product, "title"),
+        min_price=column(product, "current_min_price_usd"),
+        max_price=column(product, "current_max_price_usd"),
+        avg_30d=column(analytics, "avg_30d"),
+        change_7d_pct=column(analytics, "change_7d_pct"),
+        volatility_30d=column(analytics, "volatility_30d"),
+        trend=Coalesce(column(analytics, "trend"), Value("stable")),
+        trend_rank=Coalesce(column(trend_rank, "rank"), Value(1)),
+        is_anomaly=Coalesce(column(analytics, "is_anomaly"), Value(False)),
+        snapshot_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplaces", "0011_price_series_blocks"),
+        ("tracking", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="avg_30d",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="change_7d_pct",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="external_id",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="is_anomaly",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="max_price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="min_price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="snapshot_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="title",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="trend",
+            field=models.CharField(default="stable", max_length=8),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="trend_rank",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="trackingproducts",
+            name="volatility_30d",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="trackingproducts",
+            index=models.Index(
+                fields=["user", "min_price"], name="tracking_user_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trackingproducts",
+            index=models.Index(
+                fields=["user", "-trend_rank", "min_price"],
+                name="tracking_user_trend_idx",
+            ),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -3,4 +3,34 @@ from django.db import models
 class TrackingProducts(models.Model):
     product = models.ForeignKey('marketplaces.Product', on_delete=models.CASCADE, related_name='tracking_products')
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Dashboard snapshot of the product, refreshed by tracking.dashboard
+    # whenever its prices or analytics change, so the tracking list is
+    # read from this table alone
+    external_id = models.CharField(max_length=100, blank=True, default='')
+    title = models.CharField(max_length=255, blank=True, default='')
+    min_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    avg_30d = models.FloatField(null=True, blank=True)
+    change_7d_pct = models.FloatField(null=True, blank=True)
+    volatility_30d = models.FloatField(null=True, blank=True)
+    trend = models.CharField(max_length=8, default='stable')
+    # 2 up, 1 stable, 0 down; for ?sort=trend
+    trend_rank = models.PositiveSmallIntegerField(default=1)
+    is_anomaly = models.BooleanField(default=False)
+    snapshot_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # also serves as the (user, product) lookup index
+            models.UniqueConstraint(
+                fields=['user', 'product'],
+                name='unique_user_tracking_product'
+            )
+        ]
+        indexes = [
+            # the two orderings of the tracking list
+            models.Index(fields=['user', 'min_price'], name='tracking_user_price_idx'),
+            models.Index(fields=['user', '-trend_rank', 'min_price'], name='tracking_user_trend_idx'),
+        ]
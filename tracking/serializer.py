@@ -1,7 +1,15 @@
+from django.conf import settings
 from rest_framework import serializers
 
+MAX_TRACKING_IDS = getattr(settings, 'TRACKING_MAX_IDS_PER_REQUEST', 5000)
+
 
 class CreateTrackingProductsSerializer(serializers.Serializer):
+    # external ids of products; numeric ids are accepted and compared as strings
     product_ids = serializers.ListField(
-        child=serializers.IntegerField(),
-        allow_empty=False, )
+        child=serializers.CharField(max_length=100),
+        allow_empty=False, max_length=MAX_TRACKING_IDS)
+
+
+class DeleteTrackingProductsSerializer(CreateTrackingProductsSerializer):
+    pass
@@ -1,3 +1,80 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketplaces.models import Product
+from tracking.models import TrackingProducts
+
+
+class BulkTrackingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-password')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.products = [
+            Product.objects.create(external_id=str(i), title=f'Product {i}', current_min_price_usd=Decimal(i))
+            for i in range(1, 31)
+        ]
+
+    def post(self, url, product_ids):
+        return self.client.post(url, {'product_ids': product_ids}, content_type='application/json', headers=self.headers)
+
+    def statuses(self, response):
+        return {row['product_id']: row['status'] for row in response.json()['results']}
+
+    def test_create_reports_status_per_id(self):
+        TrackingProducts.objects.create(user=self.user, product=self.products[0])
+
+        response = self.post('/tracking/create/', ['1', '2', '2', 'missing', 3])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['results'], [
+            {'product_id': '1', 'status': 'already_tracked'},
+            {'product_id': '2', 'status': 'created'},
+            {'product_id': 'missing', 'status': 'not_found'},
+            {'product_id': '3', 'status': 'created'},
+        ])
+        self.assertEqual(TrackingProducts.objects.filter(user=self.user).count(), 3)
+
+    def test_create_fills_dashboard_snapshot(self):
+        self.post('/tracking/create/', ['5'])
+        tracking = TrackingProducts.objects.get(user=self.user)
+        self.assertEqual(tracking.external_id, '5')
+        self.assertEqual(tracking.min_price, Decimal('5'))
+        self.assertIsNotNone(tracking.snapshot_at)
+
+    def test_create_without_new_rows_is_ok(self):
+        TrackingProducts.objects.create(user=self.user, product=self.products[0])
+        response = self.post('/tracking/create/', ['1', 'missing'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), {'1': 'already_tracked', 'missing': 'not_found'})
+
+    def test_create_queries_do_not_grow_with_ids(self):
+        self.post('/tracking/create/', ['30'])  # caches the authenticated user
+        with CaptureQueriesContext(connection) as few:
+            self.post('/tracking/create/', ['1', '2'])
+        with CaptureQueriesContext(connection) as many:
+            self.post('/tracking/create/', [str(i) for i in range(3, 30)])
+        self.assertEqual(len(few), len(many))
+
+    def test_delete_reports_status_per_id(self):
+        for product in self.products[:2]:
+            TrackingProducts.objects.create(user=self.user, product=product)
+        other = User.objects.create_user('other', password='secret-password')
+        TrackingProducts.objects.create(user=other, product=self.products[2])
+
+        response = self.post('/tracking/delete/', ['1', '3', 'missing'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), {'1': 'deleted', '3': 'not_tracked', 'missing': 'not_tracked'})
+        self.assertEqual(
+            list(TrackingProducts.objects.filter(user=self.user).values_list('product_id', flat=True)),
+            [self.products[1].pk],
+        )
+        self.assertTrue(TrackingProducts.objects.filter(user=other).exists())
 
-# Create your tests here.
+    def test_empty_and_anonymous_requests_are_rejected(self):
+        self.assertEqual(self.post('/tracking/create/', []).status_code, 400)
+        self.headers = {}
+        self.assertEqual(self.post('/tracking/create/', ['1']).status_code, 401)
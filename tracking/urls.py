@@ -1,7 +1,8 @@
 from django.urls import path
 
-from tracking.views import CreateTrackingProductsView
+from tracking.views import CreateTrackingProductsView, DeleteTrackingProductsView
 
 urlpatterns = [
     path("create/", CreateTrackingProductsView.as_view(), name="create-tracking-products"),
+    path("delete/", DeleteTrackingProductsView.as_view(), name="delete-tracking-products"),
 ]
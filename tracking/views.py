@@ -1,40 +1,88 @@
 from rest_framework import status
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, GenericAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from marketplaces.models import Product
+from tracking.dashboard import refresh_snapshots
 from tracking.models import TrackingProducts
-from tracking.serializer import CreateTrackingProductsSerializer
+from tracking.serializer import CreateTrackingProductsSerializer, DeleteTrackingProductsSerializer
+
+
+def _results(product_ids, statuses):
+    return [{"product_id": product_id, "status": statuses[product_id]} for product_id in product_ids]
 
 
 class CreateTrackingProductsView(CreateAPIView):
+    """
+    Track many products at once with a constant number of queries:
+    one product lookup, one lookup of existing tracking rows, one insert
+    and one update filling in the dashboard snapshot of the new rows.
+    """
     serializer_class = CreateTrackingProductsSerializer
     permission_classes = [IsAuthenticated, ]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        product_ids = serializer.validated_data['product_ids']
+        product_ids = list(dict.fromkeys(serializer.validated_data['product_ids']))
         user = request.user
 
         try:
-            existing_product_ids = set(
+            products = dict(
+                Product.objects
+                .filter(external_id__in=product_ids)
+                .values_list('external_id', 'id')
+            )
+            already_tracked = set(
                 TrackingProducts.objects
-                .filter(user=user, product__external_id__in=product_ids)
-                .values_list('product__external_id', flat=True)
+                .filter(user=user, product_id__in=products.values())
+                .values_list('product_id', flat=True)
             )
 
-            ids_to_tracking = set(product_ids) - set(map(int, existing_product_ids))
-            if not ids_to_tracking:
-                return Response({"detail": "All products are already being tracked."}, status=status.HTTP_200_OK)
+            statuses = {}
+            tracking_objects = []
+            for product_id in product_ids:
+                pk = products.get(product_id)
+                if pk is None:
+                    statuses[product_id] = "not_found"
+                elif pk in already_tracked:
+                    statuses[product_id] = "already_tracked"
+                else:
+                    statuses[product_id] = "created"
+                    tracking_objects.append(TrackingProducts(user=user, product_id=pk))
 
-            products_to_track = Product.objects.filter(external_id__in=ids_to_tracking)
+            TrackingProducts.objects.bulk_create(tracking_objects, ignore_conflicts=True)
+            refresh_snapshots([tracking.product_id for tracking in tracking_objects], user=user)
 
-            tracking_objects = [TrackingProducts(user=user, product=product)
-                                for product in products_to_track]
+            response_status = status.HTTP_201_CREATED if tracking_objects else status.HTTP_200_OK
+            return Response({"results": _results(product_ids, statuses)}, status=response_status)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            TrackingProducts.objects.bulk_create(tracking_objects, ignore_conflicts=True)
-            return Response(status=status.HTTP_201_CREATED)
+
+class DeleteTrackingProductsView(GenericAPIView):
+    """Stop tracking many products at once with one lookup and one delete."""
+    serializer_class = DeleteTrackingProductsSerializer
+    permission_classes = [IsAuthenticated, ]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_ids = list(dict.fromkeys(serializer.validated_data['product_ids']))
+
+        try:
+            tracked = dict(
+                TrackingProducts.objects
+                .filter(user=request.user, product__external_id__in=product_ids)
+                .values_list('product__external_id', 'id')
+            )
+            TrackingProducts.objects.filter(id__in=tracked.values()).delete()
+
+            statuses = {
+                product_id: "deleted" if product_id in tracked else "not_tracked"
+                for product_id in product_ids
+            }
+            return Response({"results": _results(product_ids, statuses)}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
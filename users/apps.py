@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        from users.authentication import invalidate_cached_user
+
+        # any process saving a user, including the admin and Celery workers
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_cached_user,
+                sender=settings.AUTH_USER_MODEL,
+                dispatch_uid="invalidate_cached_user",
+            )
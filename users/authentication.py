@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+logger = logging.getLogger(__name__)
+
+# shared by every process; dropped when the user is saved or deleted
+USER_CACHE_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+# per process, so other processes only see a change once this expires
+USER_LOCAL_TTL = getattr(settings, 'AUTH_USER_LOCAL_TTL', 5)
+USER_LOCAL_SIZE = getattr(settings, 'AUTH_USER_LOCAL_SIZE', 1024)
+
+# seconds a StreamToken can be used to open a stream
+STREAM_TOKEN_LIFETIME = getattr(settings, 'STREAM_TOKEN_LIFETIME', 60)
+
+# what authentication and permission checks read; never the password hash
+CACHED_USER_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+
+
+def user_cache_key(user_id) -> str:
+    return f"auth-user-fields:{user_id}"
+
+
+def cached_user_fields(user) -> dict:
+    """
+    The fields of `user` kept in the caches: its pk, CACHED_USER_FIELDS and,
+    with CHECK_REVOKE_TOKEN, the password fingerprint tokens are issued with.
+    """
+    fields = {name: getattr(user, name) for name in CACHED_USER_FIELDS if hasattr(user, name)}
+    fields['pk'] = user.pk
+    if api_settings.CHECK_REVOKE_TOKEN:
+        fields['token_version'] = get_md5_hash_password(user.password)
+    return fields
+
+
+def build_user(fields: dict):
+    """
+    A user instance with only the cached fields loaded. Other fields are
+    deferred, so they load on first access and save() leaves them alone.
+    """
+    model = get_user_model()
+    loaded = {model._meta.pk.attname: fields['pk']}
+    loaded.update((name, fields[name]) for name in CACHED_USER_FIELDS if name in fields)
+    # from_db() takes the values in the model's field order
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in loaded]
+    return model.from_db(router.db_for_read(model), names, [loaded[name] for name in names])
+
+
+class StreamToken(Token):
+    """
+    Token for opening a stream from clients that cannot send an Authorization
+    header, such as the browser EventSource. It travels in the query string,
+    so it expires quickly and access tokens are not accepted in its place;
+    a stream stays open past its expiry once authenticated.
+    """
+
+    token_type = 'stream'
+    lifetime = timedelta(seconds=STREAM_TOKEN_LIFETIME)
+
+
+class LocalUserCache:
+    """Thread-safe LRU of (cached_at, fields) entries that expire after `ttl` seconds."""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] + self.ttl < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+local_users = LocalUserCache(USER_LOCAL_SIZE, USER_LOCAL_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving the token's user from a local LRU, then the
+    Django cache, and only then the database.
+
+    Only the fields in cached_user_fields() are cached, and requests get a
+    user with just those loaded. The active and revoked-token checks still
+    run on every request against the cached fields. A token issued after the
+    user was cached (e.g. a fresh login after a password change) always
+    reloads the user.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(user_id)
+        entry = local_users.get(key)
+        if entry is None:
+            try:
+                entry = cache.get(key)
+            except Exception as e:
+                # the database can still answer while the cache is down
+                logger.warning(f"User cache unavailable: {e}")
+            if entry is not None:
+                local_users.set(key, entry)
+
+        issued_at = validated_token.get('iat')
+        if entry is None or (issued_at is not None and issued_at > entry[0]):
+            user = super().get_user(validated_token)
+            self._store(key, (time.time(), cached_user_fields(user)))
+            return user
+
+        self._check_user(entry[1], validated_token)
+        return build_user(entry[1])
+
+    @staticmethod
+    def _store(key: str, entry) -> None:
+        local_users.set(key, entry)
+        try:
+            cache.set(key, entry, USER_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"User cache unavailable: {e}")
+
+    def _check_user(self, fields: dict, validated_token) -> None:
+        """The checks JWTAuthentication.get_user makes after loading the user."""
+        if api_settings.CHECK_USER_IS_ACTIVE and not fields.get('is_active', True):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != fields.get('token_version'):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop a saved or deleted user from both caches (receiver of
+    post_save/post_delete), so password and active state changes apply on
+    the next request. Changes made with QuerySet.update() send no signal and
+    apply once the entries expire.
+    """
+    key = user_cache_key(getattr(instance, api_settings.USER_ID_FIELD))
+    local_users.delete(key)
+    try:
+        cache.delete(key)
+    except Exception as e:
+        logger.warning(f"User cache unavailable, {key} expires in {USER_CACHE_TTL}s: {e}")
@@ -1,3 +1,72 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import CachedJWTAuthentication, local_users, user_cache_key
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-password', is_staff=True)
+        self.authentication = CachedJWTAuthentication()
+        local_users.delete(user_cache_key(self.user.pk))
+
+    def authenticate(self, token=None):
+        token = AccessToken.for_user(self.user) if token is None else token
+        return self.authentication.get_user(self.authentication.get_validated_token(str(token)))
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_active)
+        self.assertTrue(user.is_staff)
+        self.assertTrue(user.is_authenticated)
+
+    def test_cache_holds_no_password_hash(self):
+        self.authenticate()
+        for entry in (cache.get(user_cache_key(self.user.pk)), local_users.get(user_cache_key(self.user.pk))):
+            self.assertNotIn('password', entry[1])
+            self.assertNotIn(self.user.password, repr(entry))
+
+    def test_cached_user_loads_other_fields_on_access(self):
+        self.authenticate()
+        user = self.authenticate()
+        with self.assertNumQueries(1):
+            self.assertEqual(user.username, 'buyer')
+
+    def test_saving_cached_user_keeps_other_fields(self):
+        self.authenticate()
+        user = self.authenticate()
+        user.is_staff = False
+        user.save()
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_staff)
+        self.assertTrue(self.user.check_password('secret-password'))
+
+    def test_deactivated_user_is_rejected(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
 
-# Create your tests here.
+    # patched in place: overriding SIMPLE_JWT rebinds simplejwt's module global only
+    @mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_password_change_revokes_cached_tokens(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+        self.user.set_password('new-secret-password')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+        # tokens issued with the new password are accepted
+        self.assertEqual(self.authenticate(AccessToken.for_user(self.user)).pk, self.user.pk)